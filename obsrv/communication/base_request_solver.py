@@ -8,6 +8,8 @@ from serverish.base import dt_utcnow_array, MessengerNotConnected
 from serverish.messenger import get_publisher
 from obsrv.communication.nats_streams import NatsStreams
 from obcom.data_colection.response_error import ResponseError
+from obsrv.utils.large_value_store import create_large_value_store_from_config
+from obsrv.utils.tracing import configure_tracing_from_config, get_tracer
 from obsrv.utils.tree_data import TreeData
 from obcom.data_colection.tree_user import TreeUser, TreeServiceUser
 from obcom.data_colection.value_call import ValueRequest, ValueResponse
@@ -21,7 +23,8 @@ class BaseRequestSolver(ABC):
 
     def __init__(self, data_provider: ProvidesResponseProtocol, **kwargs):
         self.data_provider: ProvidesResponseProtocol = data_provider
-        self._tree_data = TreeData(target_requests=self)
+        self._tree_data = TreeData(target_requests=self, large_values=create_large_value_store_from_config())
+        configure_tracing_from_config()
         if self.data_provider is not None:
             self.data_provider.post_init_tree(tree_data=self._tree_data, tree_path="")
         else:
@@ -29,6 +32,11 @@ class BaseRequestSolver(ABC):
         self._nats_host = SingletonConfig.get_config()['nats']['host'].get()
         self._nats_port = SingletonConfig.get_config()['nats']['port'].get()
 
+    @property
+    def tree_data(self) -> TreeData:
+        """Global data shared by the whole tree (NATS messenger, large value store...)."""
+        return self._tree_data
+
     @abstractmethod
     async def get_answer(self, request: List[bytes], user_id: bytes, timeout=None) -> List[bytes]:
         """
@@ -124,6 +132,8 @@ class BaseRequestSolver(ABC):
             return v_response
         # try to get response
         # get_response method shouldn't raise any errors !!!
+        trace = get_tracer().start_trace(v_request)
+        v_response = None
         try:
             v_response = await self.data_provider.get_response(v_request)
         except asyncio.CancelledError:
@@ -132,6 +142,8 @@ class BaseRequestSolver(ABC):
             logger.error(f'{str(e)}')
             re = ResponseError(4002, '', repr(self), ResponseError.SEVERITY_CRITICAL)
             v_response = ValueResponse(v_request.address, None, False, re)
+        finally:
+            get_tracer().finish_trace(trace, v_response.status if v_response is not None else None)
         return v_response
 
     def get_tree_configuration(self) -> dict:
@@ -260,5 +272,6 @@ class BaseRequestSolver(ABC):
 
     async def reload_nats_config(self) -> bool:
         logger.debug(f"Resending configuration to nats")
-        SingletonConfig.get_config(rebuild=True).get()  # reload configuration data
+        # reload configuration data, parsing of the YAML files is done by a worker thread
+        await self._tree_data.executors.run(lambda: SingletonConfig.get_config(rebuild=True).get())
         return await self._nats_update_config_observatories()
@@ -1,7 +1,8 @@
 import asyncio
 import logging
+import time
 import zmq
-from typing import List
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
 from zmq.asyncio import Poller
 from obcom.comunication.base_zmq_communication_object import BaseZmqCommunicationObject
 from obsrv.communication.base_request_solver import BaseRequestSolver
@@ -9,10 +10,21 @@ from obcom.comunication.comunication_error import CommunicationTimeoutError
 from obcom.comunication.message_serializer import MessageSerializer
 from obcom.comunication.multipart_structure import MultipartStructure
 from obsrv.communication.base_router_with_config import BaseRouterWithConfig
+from obsrv.communication.traffic_recorder import TrafficRecorder
+from obsrv.utils import metrics
+from obsrv.utils.loop_watchdog import get_loop_watchdog
+from obsrv.utils.sampling_profiler import start_profiler, stop_profiler
+from obsrv.utils.tracing import get_tracer, mark_received
 from obsrv.utils.asyncio_util_functions import wait_for_psce
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
+_REQUESTS = metrics.counter('ocabox_router_requests_total', 'Messages received by the router', ('router', 'kind'))
+_FAILURES = metrics.counter('ocabox_router_failures_total', 'Messages the router did not answer',
+                            ('router', 'reason'))
+_DURATION = metrics.histogram('ocabox_router_request_seconds', 'Time from receiving a message to sending the answer',
+                              ('router', 'kind'))
+
 
 class Router(BaseRouterWithConfig):
     DEFAULT_NAME = 'DefaultRouter'
@@ -48,6 +60,13 @@ class Router(BaseRouterWithConfig):
         self._stop_task = None
         # async loop
         self._current_loop = None  # remember async loop with router working
+        # preallocated metrics
+        self._m_requests = {kind: _REQUESTS.labels(self.name, kind) for kind in ('request', 'service')}
+        self._m_duration = {kind: _DURATION.labels(self.name, kind) for kind in ('request', 'service')}
+        self._m_failures = {reason: _FAILURES.labels(self.name, reason)
+                            for reason in ('invalid', 'expired', 'timeout', 'error')}
+        # opt-in log of incoming requests for replay
+        self._recorder: TrafficRecorder or None = TrafficRecorder.from_config(self._get_cfg('traffic_recorder', {}))
 
     async def _echo(self):
         enabled = self._get_cfg('echo-task-enabled', True)
@@ -72,24 +91,128 @@ class Router(BaseRouterWithConfig):
                 logger.error(f"Can not find request solver. The router can't send response to client.")
         return answer
 
+    def _service_commands(self) -> Dict[str, Callable[[dict], Awaitable[Tuple[Any, List[bytes]]]]]:
+        """
+        Service commands handled by the router. Every handler gets the decoded message dict and returns the response
+        put under the 'response' key and a list of additional binary frames sent after the header frame.
+        """
+        return {
+            'is_alive': self._cmd_is_alive,
+            'reload_config': self._cmd_reload_config,
+            'fetch_large_value': self._cmd_fetch_large_value,
+            'cache_stats': self._cmd_cache_stats,
+            'get_traces': self._cmd_get_traces,
+            'loop_stalls': self._cmd_loop_stalls,
+            'start_profiler': self._cmd_start_profiler,
+            'stop_profiler': self._cmd_stop_profiler,
+        }
+
     async def _get_answer(self, ms: MultipartStructure) -> List[bytes]:
 
         response = []
-        # TODO In the future, when the number of commands increases, think about a class instead of a dictionary
         r = None
+        frames = []
         if ms.data and isinstance(ms.data, list) and len(ms.data) > 0:
             message_dict = MessageSerializer.from_bytes(ms.data[0])
             order = message_dict.get("command")
-            if order is not None and order == "is_alive":
-                r = {"command": order, "response": True}
-            if order is not None and order == "reload_config":
-                result = await self.request_solver.reload_nats_config()
+            handler = self._service_commands().get(order) if order is not None else None
+            if handler is not None:
+                result, frames = await handler(message_dict)
                 r = {"command": order, "response": result}
         resp = MessageSerializer.pack_b(r)
         response.append(resp)
+        response.extend(frames)
 
         return response
 
+    async def _cmd_is_alive(self, message: dict) -> Tuple[Any, List[bytes]]:
+        return True, []
+
+    async def _cmd_reload_config(self, message: dict) -> Tuple[Any, List[bytes]]:
+        return await self.request_solver.reload_nats_config(), []
+
+    async def _cmd_fetch_large_value(self, message: dict) -> Tuple[Any, List[bytes]]:
+        """
+        Stream payload kept in the large value store. Message: {'command': 'fetch_large_value', 'handle': str,
+        'offset': int (optional), 'length': int (optional)}. The header response describes the object (or contains
+        'error') and the payload follows as separate binary frames of 'chunk_size' bytes. One reply carries at most
+        'max_chunks_per_reply' frames, when the range is longer 'next_offset' tells where the next fetch continues.
+        """
+        store = self.request_solver.tree_data.large_values if self.request_solver else None
+        if store is None:
+            return {'error': 'Large value store is disabled'}, []
+        handle = message.get('handle')
+        description = store.describe(handle)
+        if description is None:
+            return {'error': f'Unknown or expired handle {handle}'}, []
+        try:
+            chunks, next_offset = store.fetch(handle, offset=message.get('offset', 0), length=message.get('length'))
+        except ValueError as e:
+            return {'error': str(e)}, []
+        description['chunks'] = len(chunks)
+        if next_offset is not None:
+            description['next_offset'] = next_offset
+        return description, chunks
+
+    async def _cmd_cache_stats(self, message: dict) -> Tuple[Any, List[bytes]]:
+        """Hit and miss counters of all caches keyed by cache component name."""
+        from obsrv.tree_components.specialized_components.tree_cache_observatory import cache_stats
+        return cache_stats(), []
+
+    async def _cmd_get_traces(self, message: dict) -> Tuple[Any, List[bytes]]:
+        """
+        Kept request traces and per-component latency histograms. Message: {'command': 'get_traces', 'limit': int,
+        'min_duration': float (s), 'address': str (prefix), 'buckets': bool, 'reset': bool} (all optional).
+        """
+        tracer = get_tracer()
+        result = {'enabled': tracer.enabled,
+                  'traces': tracer.traces(limit=message.get('limit', 50), min_duration=message.get('min_duration'),
+                                          address=message.get('address')),
+                  'histograms': tracer.histograms(with_buckets=bool(message.get('buckets', False)))}
+        if message.get('reset'):
+            tracer.reset()
+        return result, []
+
+    async def _cmd_loop_stalls(self, message: dict) -> Tuple[Any, List[bytes]]:
+        """
+        Top event loop blockers found by the loop watchdog. Message: {'command': 'loop_stalls', 'top': int,
+        'reset': bool} (all optional).
+        """
+        watchdog = get_loop_watchdog()
+        if watchdog is None:
+            return {'error': 'Loop watchdog is disabled'}, []
+        result = {'threshold': watchdog.threshold, 'stalls': watchdog.stalls,
+                  'blockers': watchdog.report(top=message.get('top', 10))}
+        if message.get('reset'):
+            watchdog.reset()
+        return result, []
+
+    async def _cmd_start_profiler(self, message: dict) -> Tuple[Any, List[bytes]]:
+        """
+        Start sampling the stacks of the server. Message: {'command': 'start_profiler', 'duration': float (s),
+        'interval': float (s), 'all_threads': bool, 'file_name': str} (all optional). The profile stops after
+        'duration' (limited by config) or on 'stop_profiler' and is written as collapsed stacks to 'file', a file in
+        the configured output directory ('file_name' must not contain a path).
+        """
+        try:
+            return start_profiler(duration=message.get('duration'), interval=message.get('interval'),
+                                  all_threads=bool(message.get('all_threads', False)),
+                                  file_name=message.get('file_name')), []
+        except (RuntimeError, ValueError) as e:
+            return {'error': str(e)}, []
+
+    async def _cmd_stop_profiler(self, message: dict) -> Tuple[Any, List[bytes]]:
+        """
+        Stop the profile (or get the last finished one). Message: {'command': 'stop_profiler', 'top': int,
+        'stacks': bool}. Response is the summary with the top functions; with 'stacks' the collapsed stacks follow
+        as a binary frame.
+        """
+        result = await stop_profiler()
+        if result is None:
+            return {'error': 'Profiler was not started'}, []
+        frames = [result.to_folded().encode()] if message.get('stacks') else []
+        return result.summary(top=message.get('top', 10)), frames
+
     @staticmethod
     def _open_envelope(multipart: List[bytes]) -> MultipartStructure:
         ms = MultipartStructure(multipart, 1)
@@ -127,15 +250,23 @@ class Router(BaseRouterWithConfig):
             except ValueError:
                 logger.error('Unexpected ValueError. Can not remove task from task list.')
 
+        received = time.monotonic()
         try:
             ms = self._open_envelope(message)
         except ValueError:
             # Don't answer for incorrect requests. Close task.
+            self._m_failures['invalid'].inc()
             remove_task_inner()
             return
+        kind = 'service' if ms.service_msg_bool else 'request'
+        self._m_requests[kind].inc()
+        if self._recorder is not None:
+            self._recorder.record(ms.prefix_data[0], ms.data, ms.service_msg_bool, ms.request_timeout_float)
+        mark_received()
         try:
             time_to_expire = self._get_time_to_expire(ms=ms, use_default=True)
         except CommunicationTimeoutError as e:
+            self._m_failures['expired'].inc()
             remove_task_inner()
             logger.error(e.message)
             return
@@ -144,6 +275,7 @@ class Router(BaseRouterWithConfig):
         except ValueError:
             # Obsolete and shouldn't have happened
             # Don't answer for incorrect requests. Close task.
+            self._m_failures['error'].inc()
             remove_task_inner()
             logger.error(f"Router encountered a ValueError when try to solve request. Solver handled the exception "
                          f"incorrectly")
@@ -154,11 +286,13 @@ class Router(BaseRouterWithConfig):
             raise
         except asyncio.TimeoutError:
             # remove to slow task from list
+            self._m_failures['timeout'].inc()
             remove_task_inner()
             logger.error(f"Handling the request has timed out. Stop handling this task.")
             return
         except Exception as e:
             # shouldn't have happened
+            self._m_failures['error'].inc()
             remove_task_inner()
             logger.error(f"Router encountered an unexpected error while generating response. Task was closed and "
                          f"don't send response. Error message: {str(e)}")
@@ -171,6 +305,7 @@ class Router(BaseRouterWithConfig):
             remove_task_inner()
             return
         self._front_socket.send_multipart(answer_multipart.multipart)
+        self._m_duration[kind].observe(time.monotonic() - received)
         logger.info("Send response to client")
         remove_task_inner()
 
@@ -348,6 +483,8 @@ class Router(BaseRouterWithConfig):
             if task in asyncio.all_tasks():
                 logger.info(f'Task {task.get_name} for router named {self.name} stopped.')
         self._message_tasks = []
+        if self._recorder is not None:
+            self._recorder.flush()
 
         self._stop_task = None
         logger.info(f'Router {self.name} was stopped.')
@@ -409,6 +546,8 @@ class Router(BaseRouterWithConfig):
     def __del__(self):
         if not self.is_stopped():
             self.stop()
+        if getattr(self, '_recorder', None) is not None:
+            self._recorder.close()
         if self._front_socket:
             self._front_socket.close()
         super().__del__()
@@ -0,0 +1,185 @@
+"""
+Recorder of requests coming to the ``Router``, for replaying production traffic against a test server.
+
+Enabled by the ``traffic_recorder`` router config (opt-in). Every valid incoming request envelope is appended to a
+binary log with rotation (``path``, ``path.1`` ... ``path.<backups>``, like ``logging.handlers.RotatingFileHandler``).
+
+Log file: 8 byte magic ``OCBXTRF1`` followed by records::
+
+    <d   receive time (unix)
+    <d   request timeout relative to the receive time (s), NaN when unknown
+    8s   blake2b hash of the client ZMQ identity (clients are distinguished, not identified)
+    <B   1 for service messages
+    <H   number of data frames
+    then for every frame: <I length, raw bytes (serialized request)
+
+Read with :func:`read_traffic_log`, replay with ``obsrv.communication.traffic_replay``.
+"""
+import glob
+import hashlib
+import logging
+import math
+import os
+import struct
+import time
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+MAGIC = b'OCBXTRF1'
+_HEADER = struct.Struct('<dd8sBH')
+_FRAME_LEN = struct.Struct('<I')
+FLUSH_INTERVAL = 1.0
+
+
+class TrafficRecord(NamedTuple):
+    ts: float
+    timeout: float
+    client: bytes
+    service: bool
+    frames: List[bytes]
+
+
+def client_hash(identity: bytes) -> bytes:
+    return hashlib.blake2b(identity, digest_size=8).digest()
+
+
+class TrafficRecorder:
+    """
+    Appends requests to the rotating log.
+
+    :param path: path of the current log file
+    :param max_bytes: size after which the file is rotated
+    :param backups: number of rotated files kept
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, backups: int = 5):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = max(0, int(backups))
+        self.records = 0
+        self._file: Optional[BinaryIO] = None
+        self._size = 0
+        self._last_flush = 0.0
+        self._open()
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> Optional['TrafficRecorder']:
+        """Recorder described by the ``traffic_recorder`` config, None when disabled or the file can not be opened."""
+        cfg = cfg or {}
+        if not cfg.get('enabled', False):
+            return None
+        path = cfg.get('path') or '/tmp/ocabox_traffic.bin'
+        try:
+            recorder = cls(path, max_bytes=cfg.get('max_bytes', 64 * 1024 * 1024), backups=cfg.get('backups', 5))
+        except OSError as e:
+            logger.error(f'Can not open traffic log {path}: {e}')
+            return None
+        logger.info(f'Recording incoming requests to {path}')
+        return recorder
+
+    def _open(self):
+        self._file = open(self.path, 'ab')
+        self._size = self._file.tell()
+        if self._size == 0:
+            self._file.write(MAGIC)
+            self._size = len(MAGIC)
+
+    def _rotate(self):
+        self._file.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                src = f'{self.path}.{i}'
+                if os.path.exists(src):
+                    os.replace(src, f'{self.path}.{i + 1}')
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def record(self, identity: bytes, frames: List[bytes], service: bool = False, timeout: Optional[float] = None):
+        """
+        Append one request.
+
+        :param identity: ZMQ identity of the client, only its hash is stored
+        :param frames: serialized request frames
+        :param service: the request is a router service message
+        :param timeout: absolute request timeout (unix time) from the envelope
+        """
+        if self._file is None:
+            return
+        now = time.time()
+        relative_timeout = timeout - now if timeout is not None else math.nan
+        parts = [_HEADER.pack(now, relative_timeout, client_hash(identity or b''), 1 if service else 0, len(frames))]
+        for f in frames:
+            parts.append(_FRAME_LEN.pack(len(f)))
+            parts.append(f)
+        data = b''.join(parts)
+        try:
+            if self._size + len(data) > self.max_bytes and self._size > len(MAGIC):
+                self._rotate()
+            self._file.write(data)
+            self._size += len(data)
+            self.records += 1
+            if now - self._last_flush > FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+        except OSError as e:
+            logger.error(f'Traffic recording stopped, can not write {self.path}: {e}')
+            self.close()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            finally:
+                self._file = None
+
+
+def traffic_log_files(path: str) -> List[str]:
+    """Files of the log oldest first: rotated backups ``path.N`` ... ``path.1`` and then ``path``."""
+    backups = []
+    for p in glob.glob(glob.escape(path) + '.*'):
+        suffix = p[len(path) + 1:]
+        if suffix.isdigit():
+            backups.append((int(suffix), p))
+    files = [p for _, p in sorted(backups, reverse=True)]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_traffic_log(path: str, with_backups: bool = True) -> Iterator[TrafficRecord]:
+    """
+    Records of the log in recording order. A record truncated at the end of a file (server killed while writing)
+    is skipped.
+
+    :raise ValueError: file is not a traffic log
+    """
+    for file_path in (traffic_log_files(path) if with_backups else [path]):
+        with open(file_path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{file_path} is not a traffic log')
+            while True:
+                header = f.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                ts, timeout, client, service, n = _HEADER.unpack(header)
+                frames = []
+                for _ in range(n):
+                    raw_len = f.read(_FRAME_LEN.size)
+                    if len(raw_len) < _FRAME_LEN.size:
+                        break
+                    (length,) = _FRAME_LEN.unpack(raw_len)
+                    frame = f.read(length)
+                    if len(frame) < length:
+                        break
+                    frames.append(frame)
+                if len(frames) < n:
+                    logger.warning(f'Truncated record at the end of {file_path}')
+                    break
+                yield TrafficRecord(ts, timeout, client, bool(service), frames)
@@ -0,0 +1,224 @@
+"""
+Replay of a traffic log written by the router ``traffic_recorder`` against a test server.
+
+Requests are sent at the recorded pace divided by ``--speed`` (1x, 10x ...), every recorded client gets its own
+ZMQ DEALER socket and does not wait for its previous answer, so bursts and concurrent cycle queries keep their shape.
+Absolute times inside requests (``time_of_data``, ``request_timeout``, ``time_of_known_change``,
+``no_send_before``) are shifted by the time elapsed since recording. Service messages are skipped unless
+``--include-service``.
+
+Prints latency distributions per request kind (get, put, cycle) and the cache hit ratio of the server during the
+replay (``cache_stats`` router command)::
+
+    python -m obsrv.communication.traffic_replay /tmp/ocabox_traffic.bin --server tcp://localhost:5559 --speed 10
+"""
+import argparse
+import asyncio
+import math
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import zmq
+import zmq.asyncio
+
+from obcom.comunication.message_serializer import MessageSerializer
+from obcom.comunication.multipart_structure import MultipartStructure
+from obcom.data_colection.value_call import ValueResponse
+from obsrv.communication.traffic_recorder import read_traffic_log
+
+DEFAULT_TIMEOUT = 30.0
+_ABSOLUTE_TIME_FIELDS = ('time_of_data', 'request_timeout')
+_ABSOLUTE_TIME_DATA_FIELDS = ('time_of_known_change', 'no_send_before')
+
+
+def _shift(d: dict, keys, offset: float):
+    for k in keys:
+        if isinstance(d.get(k), (int, float)) and not isinstance(d.get(k), bool):
+            d[k] = d[k] + offset
+
+
+def shift_request_times(frame: bytes, offset: float) -> Tuple[bytes, dict]:
+    """Move absolute times of the serialized request by offset seconds, returns the new frame and the request."""
+    request = MessageSerializer.unpack_b(frame)
+    if not isinstance(request, dict):
+        return frame, {}
+    _shift(request, _ABSOLUTE_TIME_FIELDS, offset)
+    if isinstance(request.get('request_data'), dict):
+        _shift(request['request_data'], _ABSOLUTE_TIME_DATA_FIELDS, offset)
+    return MessageSerializer.pack_b(request), request
+
+
+def request_kind(request: dict) -> str:
+    if request.get('cycle_query'):
+        return 'cycle'
+    return 'put' if request.get('request_type') == 'PUT' else 'get'
+
+
+def build_envelope(frames: List[bytes], msg_id: int, timeout: float, service: bool = False) -> List[bytes]:
+    now = time.time()
+    return MultipartStructure.from_parts(create_time=MessageSerializer.pack_b(now),
+                                         id_=MessageSerializer.pack_b(msg_id),
+                                         data=frames,
+                                         request_timeout=MessageSerializer.pack_b(now + timeout),
+                                         service_msg=MessageSerializer.pack_b(service),
+                                         prefix_data=[]).multipart
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return math.nan
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class ReplayReport:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Counter] = defaultdict(Counter)
+        self.sent: Counter = Counter()
+        self.lost: Counter = Counter()
+        self.duration = 0.0
+        self.cache: Dict[str, dict] = {}
+
+    def print(self):
+        print(f'replayed {sum(self.sent.values())} requests in {self.duration:.1f} s')
+        print(f'{"kind":>6} {"sent":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"max ms":>9} {"lost":>5}  errors')
+        for kind in sorted(self.sent):
+            lat = sorted(v * 1000 for v in self.latencies[kind])
+            print(f'{kind:>6} {self.sent[kind]:7d} {_percentile(lat, 0.5):8.2f} {_percentile(lat, 0.95):8.2f} '
+                  f'{_percentile(lat, 0.99):8.2f} {(lat[-1] if lat else math.nan):9.2f} {self.lost[kind]:5d}  '
+                  f'{dict(self.errors[kind]) if self.errors[kind] else ""}')
+        for name, c in sorted(self.cache.items()):
+            ratio = f'{c["hit_ratio"]:.1%}' if c['hit_ratio'] is not None else '-'
+            print(f'cache {name}: hit ratio {ratio} (hits {c["hits"]}, shared {c["shared"]}, misses {c["misses"]})')
+
+
+async def _cache_stats(context: zmq.asyncio.Context, server: str) -> Optional[dict]:
+    with context.socket(zmq.DEALER) as s:
+        s.setsockopt(zmq.LINGER, 0)
+        s.connect(server)
+        await s.send_multipart(build_envelope([MessageSerializer.pack_b({'command': 'cache_stats'})], 0, 5.0, True))
+        try:
+            answer = await asyncio.wait_for(s.recv_multipart(), 5.0)
+        except asyncio.TimeoutError:
+            return None
+    response = MessageSerializer.unpack_b(MultipartStructure(answer, 0).data[0]) or {}
+    return response.get('response')
+
+
+def _cache_delta(before: Optional[dict], after: Optional[dict]) -> Dict[str, dict]:
+    out = {}
+    for name, a in (after or {}).items():
+        b = (before or {}).get(name, {})
+        d = {k: a.get(k, 0) - b.get(k, 0) for k in ('hits', 'shared', 'misses')}
+        lookups = sum(d.values())
+        d['hit_ratio'] = (d['hits'] + d['shared']) / lookups if lookups else None
+        out[name] = d
+    return out
+
+
+async def replay(path: str, server: str, speed: float = 1.0, limit: Optional[int] = None,
+                 include_service: bool = False) -> ReplayReport:
+    """
+    Replay the log and collect the report.
+
+    :param path: traffic log (rotated backups are replayed first)
+    :param server: ZMQ address of the router, e.g. 'tcp://localhost:5559'
+    :param speed: time compression, 2.0 sends the traffic twice as fast as recorded
+    :param limit: maximum number of replayed requests
+    """
+    report = ReplayReport()
+    context = zmq.asyncio.Context()
+    sockets: Dict[bytes, zmq.asyncio.Socket] = {}
+    pending: Dict[Tuple[bytes, int], Tuple[float, str]] = {}
+    receivers: List[asyncio.Task] = []
+    msg_id = 0
+    max_timeout = 0.0
+
+    async def receive(client: bytes, s: zmq.asyncio.Socket):
+        while True:
+            answer = await s.recv_multipart()
+            t = time.perf_counter()
+            ms = MultipartStructure(answer, 0)
+            sent = pending.pop((client, MessageSerializer.unpack_b(ms.id_)), None)
+            if sent is None:
+                continue
+            t0, kind = sent
+            report.latencies[kind].append(t - t0)
+            for frame in ms.data:
+                try:
+                    response = ValueResponse.from_byte(frame)
+                except Exception:
+                    continue
+                if not response.status:
+                    report.errors[kind][str(response.error.code if response.error else None)] += 1
+
+    try:
+        before = await _cache_stats(context, server)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        first_ts = None
+        for record in read_traffic_log(path):
+            if record.service and not include_service:
+                continue
+            if limit is not None and msg_id >= limit:
+                break
+            if first_ts is None:
+                first_ts = record.ts
+            delay = start + (record.ts - first_ts) / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            s = sockets.get(record.client)
+            if s is None:
+                s = sockets[record.client] = context.socket(zmq.DEALER)
+                s.setsockopt(zmq.LINGER, 0)
+                s.connect(server)
+                receivers.append(asyncio.create_task(receive(record.client, s)))
+            offset = time.time() - record.ts
+            frames, kind = [], 'service'
+            for i, frame in enumerate(record.frames):
+                if record.service:
+                    frames.append(frame)
+                    continue
+                frame, request = shift_request_times(frame, offset)
+                frames.append(frame)
+                if i == 0:
+                    kind = request_kind(request)
+            timeout = record.timeout if math.isfinite(record.timeout) and record.timeout > 0 else DEFAULT_TIMEOUT
+            max_timeout = max(max_timeout, timeout)
+            msg_id += 1
+            pending[(record.client, msg_id)] = (time.perf_counter(), kind)
+            report.sent[kind] += 1
+            await s.send_multipart(build_envelope(frames, msg_id, timeout, record.service))
+        # wait for the answers of the last requests
+        deadline = loop.time() + max_timeout
+        while pending and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        report.duration = loop.time() - start
+        for _, kind in pending.values():
+            report.lost[kind] += 1
+        report.cache = _cache_delta(before, await _cache_stats(context, server))
+    finally:
+        for t in receivers:
+            t.cancel()
+        await asyncio.gather(*receivers, return_exceptions=True)
+        for s in sockets.values():
+            s.close()
+        context.term()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('log', help='traffic log file written by the router')
+    parser.add_argument('--server', default='tcp://localhost:5559', help='ZMQ address of the test server')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed factor (1 = as recorded)')
+    parser.add_argument('--limit', type=int, default=None, help='replay at most this many requests')
+    parser.add_argument('--include-service', action='store_true', help='replay router service messages too')
+    args = parser.parse_args()
+    report = asyncio.run(replay(args.log, args.server, args.speed, args.limit, args.include_service))
+    report.print()
+
+
+if __name__ == '__main__':
+    main()
@@ -51,6 +51,7 @@ def tree_build() -> Router:
     conditional_freezer_sim = TreeConditionalFreezer('conditional-freezer-sim', cache_sim)
     target_provider_sim = TreeProvider('target-provider-sim', 'sim', conditional_freezer_sim)
     blocker_grantor_sim.set_change_notifier(cache_sim._report_new_value)
+    alpaca_sim.set_push_sink(cache_sim.ingest_pushed_value, address_prefix='sim')
 
     # --------------------------------------- dev ---------------------------------------
     alpaca_dev = TreeAlpacaObservatory('alpaca-dev', observatory_name='dev')
@@ -65,6 +66,7 @@ def tree_build() -> Router:
     conditional_freezer_dev = TreeConditionalFreezer('conditional-freezer-dev', cache_dev)
     target_provider_dev = TreeProvider('target-provider-dev', 'dev', conditional_freezer_dev)
     blocker_grantor_dev.set_change_notifier(cache_dev._report_new_value)
+    alpaca_dev.set_push_sink(cache_dev.ingest_pushed_value, address_prefix='dev')
 
     # --------------------------------------- dummytest ---------------------------------------
     alpaca_dummytest = TreeAlpacaObservatory('alpaca-dummytest', observatory_name='dummytest')
@@ -78,6 +80,7 @@ def tree_build() -> Router:
     conditional_freezer_dummytest = TreeConditionalFreezer('conditional-freezer-dummytest', cache_dummytest)
     target_provider_dummytest = TreeProvider('target-provider-dummytest', 'dummytest', conditional_freezer_dummytest)
     blocker_grantor_dummytest.set_change_notifier(cache_dummytest._report_new_value)
+    alpaca_dummytest.set_push_sink(cache_dummytest.ingest_pushed_value, address_prefix='dummytest')
 
 
     # -----------------------------gather alpacas components -----------------------------
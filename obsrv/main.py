@@ -106,6 +106,23 @@ def main(argv=None):
         from obsrv.utils.runtime_diagnostics import schedule_runtime_diagnostics
         schedule_runtime_diagnostics(loop, interval=diag_interval)
 
+    # Optional event loop stall detector, opt-in via config (`loop_watchdog.enabled`).
+    try:
+        watchdog_cfg = SingletonConfig.get_config()['loop_watchdog'].get() or {}
+    except Exception:
+        watchdog_cfg = {}
+    loop_watchdog = None
+    if watchdog_cfg.get('enabled', False):
+        from obsrv.utils.loop_watchdog import schedule_loop_watchdog
+        loop_watchdog = schedule_loop_watchdog(loop, threshold=float(watchdog_cfg.get('threshold', 0.25)),
+                                               stack_depth=int(watchdog_cfg.get('stack_depth', 15)),
+                                               report_interval=float(watchdog_cfg.get('report_interval', 600.0)))
+
+    # Optional metrics endpoint / NATS publishing, opt-in via config (`metrics.enabled`).
+    from obsrv.utils.metrics import MetricsExporter
+    metrics_exporter = MetricsExporter.from_config()
+    from obsrv.utils.executors import Executors
+
     def ask_exit():
         raise KeyboardInterrupt
     loop.add_signal_handler(signal.SIGINT, ask_exit)
@@ -113,14 +130,21 @@ def main(argv=None):
     try:
         asyncio.set_event_loop(loop)
         loop.run_until_complete(rs.run_tree())
+        if metrics_exporter is not None:
+            loop.run_until_complete(metrics_exporter.start())
         loop.run_until_complete(coro)
     except KeyboardInterrupt:
         pass
     finally:
+        if loop_watchdog is not None:
+            loop_watchdog.stop()
+            loop_watchdog.log_report()
         try:
             # cancel router tasks
             vr.stop()
             vr_stop = asyncio.gather(vr.get_stop_task(), rs.stop_tree(), return_exceptions=True)
+            if metrics_exporter is not None:
+                vr_stop = asyncio.gather(vr_stop, metrics_exporter.stop(), return_exceptions=True)
             loop.run_until_complete(vr_stop)
 
             # make sure if all task is finished (router task and every other in this loop)
@@ -136,6 +160,7 @@ def main(argv=None):
 
             loop.run_until_complete(loop.shutdown_asyncgens())
         finally:
+            Executors().shutdown(wait=False)
             loop.close()
 
     return 0
@@ -1 +1,2 @@
-from obsrv.protocols.connector_factory import create_connector
\ No newline at end of file
+from obsrv.protocols.connector_factory import create_connector
+from obsrv.protocols.connector_registry import ConnectorRegistry
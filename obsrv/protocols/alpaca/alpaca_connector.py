@@ -1,8 +1,10 @@
 import asyncio
+import json
 import random
+import time
 import aiohttp as aiohttp
 import logging
-from typing import Iterable, Callable, Tuple
+from typing import Iterable, Callable, Tuple, Awaitable, Dict
 
 from aiohttp import ServerConnectionError, ClientConnectionError
 from obcom.data_colection.address import AddressError
@@ -11,14 +13,48 @@ from obcom.data_colection.value import TreeValueError
 
 from obsrv.protocols.alpaca.alpaca_exceptions import AlpacaError, AlpacaHttpError, RequestConnectionError, \
     AlpacaHttp400Error, AlpacaHttp500Error, AlpacaContentTypeError
+from obsrv.ob_config import SingletonConfig
+from obsrv.utils import metrics
+from obsrv.utils.executors import Executors
+from obsrv.protocols.circuit_breaker import CircuitBreakerSet, CircuitOpenError
+from obsrv.protocols.connector_registry import normalize_endpoint
+from obsrv.protocols.request_hedging import LatencyTracker, RetryBudget, hedged_request
+from obsrv.protocols.subscription import PollingSubscription, Unsubscribe, DEFAULT_POLL_PERIOD
+from obsrv.protocols.alpaca.alpaca_imagebytes import ImageBytesArray, IMAGEBYTES_MIME, IMAGEBYTES_ACCEPT_HEADERS, \
+    IMAGE_ARRAY_VARIABLES
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
 
+# dropped connections and resets, aiohttp raises them as ClientError subclasses which are not OSError
+_CONNECTION_ERRORS = (IOError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)
+
+_LATENCY = metrics.histogram('ocabox_connector_request_seconds', 'Duration of HTTP requests to device servers',
+                             ('protocol', 'host'))
+
 # Vendor SDK error codes that map to TreeOtherError(4008) "device busy".
 # 20072 = Andor DRV_ACQUIRING (acquisition in progress).
 _DEVICE_BUSY_ERRNOS = frozenset({20072})
 
+_DEFAULT_BREAKER_SETTINGS = {
+    'enabled': True,
+    'failure_threshold': 5,
+    'open_duration': 30.0,
+    'slow_call_threshold': 10.0,
+}
+
+# GET hedging, used by devices with the 'hedge_gets' option
+_DEFAULT_HEDGING_SETTINGS = {
+    'quantile': 0.95,        # latency quantile of the device after which a second GET is sent
+    'min_delay': 0.05,       # never hedge sooner than this (s)
+    'window': 100,           # latency samples remembered per device
+    'min_samples': 20,       # no hedging before so many samples, only retries
+    'max_attempts': 2,
+    'budget_ratio': 0.1,     # retry budget per server: tokens earned per request...
+    'budget_per_second': 1.0,  # ...and per second
+    'budget_capacity': 10.0,
+}
+
 
 class Connector:
     """Base connector class for all telescope protocols."""
@@ -32,8 +68,18 @@ class Connector:
     async def call(self, component: 'Component', function: str, **data):
         raise NotImplementedError
 
-    async def subscribe(self, variables: Iterable[Tuple[str, str]], callback: Callable):
-        raise NotImplementedError
+    async def subscribe(self, variables: Iterable[Tuple['Component', str]], callback: Callable,
+                        period: float = DEFAULT_POLL_PERIOD, **kwargs) -> Unsubscribe:
+        """
+        Deliver values of device variables to callback without client requests, see ``obsrv.protocols.subscription``.
+        Connectors without device events poll the variables every period seconds.
+
+        :param variables: pairs (component, variable)
+        :param callback: ``callback(component, variable, value, ts)``, sync or async
+        :param period: polling period in seconds
+        :return: idempotent unsubscribe callable
+        """
+        return PollingSubscription(self, variables, callback, period=period).start()
 
     def __del__(self):
         pass
@@ -41,14 +87,114 @@ class Connector:
 
 class AlpacaConnector(Connector):
 
+    # one breaker per Alpaca server (scheme://host:port), disabled until __init__ reads the configuration
+    _breakers = CircuitBreakerSet(enabled=False)
+    _hedging = _DEFAULT_HEDGING_SETTINGS
+
     def __init__(self, **kwargs) -> None:
         self.client_id = random.randint(0, 65535)  # alternative (0, 4294967295)
         self.session_id = 0
         self._session_loop = None
         self._http_session: aiohttp.ClientSession or None = None
+        self._breakers = CircuitBreakerSet(**self._settings('circuit_breaker', _DEFAULT_BREAKER_SETTINGS))
+        self._hedging = self._settings('hedging', _DEFAULT_HEDGING_SETTINGS)
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._retry_budgets: Dict[str, RetryBudget] = {}
+        self._host_latency: Dict[str, object] = {}  # preallocated latency histograms per server
         logger.info('Alpaca connector created, ClientId=%d', self.client_id)
         super().__init__(**kwargs)
 
+    @staticmethod
+    def _settings(section: str, defaults: dict) -> dict:
+        settings = dict(defaults)
+        try:
+            cfg = SingletonConfig.get_config()['data_collection']['AlpacaConnector'][section].get(dict)
+            settings.update({k: v for k, v in (cfg or {}).items() if k in settings})
+        except Exception:
+            logger.debug(f"No data_collection.AlpacaConnector.{section} in configuration, using defaults")
+        return settings
+
+    def circuit_breaker_states(self) -> Dict[str, dict]:
+        """State of the breaker of every Alpaca server used by this connector, for diagnostics."""
+        return self._breakers.describe()
+
+    def hedging_stats(self) -> Dict[str, dict]:
+        """Retry budgets of Alpaca servers used by hedged GETs, for diagnostics."""
+        return {host: b.describe() for host, b in self._retry_budgets.items()}
+
+    @staticmethod
+    def _retryable(exc: BaseException) -> bool:
+        # an open breaker would reject the retry as well
+        return isinstance(exc, (RequestConnectionError, asyncio.TimeoutError, *_CONNECTION_ERRORS)) \
+            and not isinstance(exc, CircuitOpenError)
+
+    async def _hedged_get(self, url: str, **data):
+        """
+        GET with hedging and retries: a second attempt is sent when the first one is slower than the observed
+        latency quantile of the device or fails to connect, paid from the retry budget of the server. Only for
+        GETs, which are idempotent.
+        """
+        host = normalize_endpoint(url)
+        device = url.rsplit('/', 1)[0]
+        budget = self._retry_budgets.get(host)
+        if budget is None:
+            budget = self._retry_budgets[host] = RetryBudget(ratio=self._hedging['budget_ratio'],
+                                                             min_per_second=self._hedging['budget_per_second'],
+                                                             capacity=self._hedging['budget_capacity'])
+        latencies = self._latencies.get(device)
+        if latencies is None:
+            latencies = self._latencies[device] = LatencyTracker(window=self._hedging['window'],
+                                                                 min_samples=self._hedging['min_samples'])
+        hedge_delay = latencies.quantile(self._hedging['quantile'])
+        if hedge_delay is not None:
+            hedge_delay = max(hedge_delay, self._hedging['min_delay'])
+
+        async def attempt():
+            start = time.monotonic()
+            # each attempt has its own transaction id
+            result = await self._guarded(url, lambda: self._get(url, **data))
+            latencies.record(time.monotonic() - start)
+            return result
+
+        return await hedged_request(attempt, budget, hedge_delay=hedge_delay, retryable=self._retryable,
+                                    max_attempts=self._hedging['max_attempts'])
+
+    async def _guarded(self, url: str, request: Callable[[], Awaitable]):
+        """
+        Run the request through the circuit breaker of its server and record its duration in the latency histogram of
+        the server. Only connection errors, timeouts and slow calls are failures, an HTTP or Alpaca error means the
+        server is alive.
+
+        :raise CircuitOpenError: the breaker is open, the request was not sent
+        """
+        host = normalize_endpoint(url)
+        latency = self._host_latency.get(host)
+        if latency is None:
+            latency = self._host_latency[host] = _LATENCY.labels('alpaca', host)
+        breaker = self._breakers.get(host)
+        start = time.monotonic()
+        if breaker is None:
+            try:
+                return await request()
+            finally:
+                latency.observe(time.monotonic() - start)
+        breaker.acquire()
+        try:
+            result = await request()
+        except (RequestConnectionError, asyncio.TimeoutError):
+            breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            breaker.record_cancelled(time.monotonic() - start)
+            raise
+        except Exception:
+            breaker.record_success(time.monotonic() - start)
+            raise
+        finally:
+            latency.observe(time.monotonic() - start)
+        breaker.record_success(time.monotonic() - start)
+        return result
+
     def _create_permanent_http_session(self, loop=None) -> None or aiohttp.ClientSession:
         if self._http_session:
             logger.warning(f"One session is already exist, close it before create a new one.")
@@ -88,6 +234,20 @@ class AlpacaConnector(Connector):
         """
         return self._create_permanent_http_session(loop)
 
+    def _get_http_session(self) -> aiohttp.ClientSession:
+        """
+        Return permanent http session of the running loop, create it on first use. One session (and its connection
+        pool) is used by all requests of the connector instead of a new session per request.
+        """
+        loop = asyncio.get_running_loop()
+        if self._http_session is not None and (self._http_session.closed or self._session_loop is not loop):
+            # session of a closed or other loop can not be used here
+            logger.debug(f"Dropping http session bound to another loop or closed")
+            self._http_session = None
+        if self._http_session is None:
+            self._create_permanent_http_session(loop)
+        return self._http_session
+
     async def _close_permanent_http_session(self):
         if not self._http_session:
             logger.info(f"The session is already close or never created")
@@ -182,10 +342,12 @@ class AlpacaConnector(Connector):
                 pass
         return devices
 
-    async def _get(self, url, **data):
+    async def _get(self, url, accept_imagebytes: bool = False, **data):
         """
 
         :param url: url address
+        :param accept_imagebytes: ask server for the binary 'application/imagebytes' format, if server answers with
+            it the result is ImageBytesArray, otherwise the JSON value is returned as usual
         :param data: dict of parameters to pass in request
         :raise AlpacaHttp400Error: if server alpaca return 400 error
         :raise AlpacaHttp500Error: if server alpaca return 500 error
@@ -195,24 +357,24 @@ class AlpacaConnector(Connector):
         :raise RequestConnectionError: when can not connect to alpaca
         :return: requested value or none
         """
+        headers = IMAGEBYTES_ACCEPT_HEADERS if accept_imagebytes else None
 
         async def get_response(s):
-            async with s.get(url, params=data, allow_redirects=False) as response:
-                await self.__check_error(response)
-                r = await response.json()
-                return r
+            async with s.get(url, params=data, headers=headers, allow_redirects=False) as response:
+                if accept_imagebytes and response.content_type == IMAGEBYTES_MIME:
+                    self.__check_http_status(response)
+                    # decoded without copying the body, errors are carried in the ImageBytes header
+                    return ImageBytesArray(await response.read())
+                j = await self.__check_error(response)
+                return j.get("Value", None)
 
         data.update(self._base_data_for_request())
         try:
-            if self._http_session:
-                resp = await get_response(self._http_session)
-            else:
-                async with aiohttp.ClientSession() as session:
-                    resp = await get_response(session)
-        except IOError as exc:
+            resp = await get_response(self._get_http_session())
+        except _CONNECTION_ERRORS as exc:
             logger.error(f'Connection to {url} failed')
             raise RequestConnectionError from exc
-        return resp.get("Value", None)
+        return resp
 
     async def get(self, component: 'Component', variable: str, kind=None, **data):
         """
@@ -232,7 +394,11 @@ class AlpacaConnector(Connector):
         url = None
         try:
             url = self._url(component=component, variable=variable, kind=kind)
-            resp = await self._get(url, **data)
+            if variable in IMAGE_ARRAY_VARIABLES and component.get_option_recursive('imagebytes') is not False:
+                return await self._guarded(url, lambda: self._get(url, accept_imagebytes=True, **data))
+            if component.get_option_recursive('hedge_gets') is True:
+                return await self._hedged_get(url, **data)
+            resp = await self._guarded(url, lambda: self._get(url, **data))
             return resp
         except Exception as e:
             self.raise_tree_exeption(e, address=url)
@@ -256,7 +422,7 @@ class AlpacaConnector(Connector):
         url = None
         try:
             url = self._url(component=component, variable=variable, kind=kind)
-            resp = await self._put(url, **data)
+            resp = await self._guarded(url, lambda: self._put(url, **data))
             return resp
         except Exception as e:
             self.raise_tree_exeption(e, address=url)
@@ -266,6 +432,10 @@ class AlpacaConnector(Connector):
             raise exception
         except asyncio.CancelledError:
             raise
+        except CircuitOpenError as e:
+            # server is known to be down, fail fast without a request (the breaker logs state changes)
+            raise TreeOtherError(address=None, code=4005, message=f"Server alpaca is not responding at {address}, "
+                                                                  f"{e}", severity=TreeOtherError.SEVERITY_NORMAL)
         except AlpacaHttp400Error as e:
             # if server alpaca return 400 error
             logger.warning(f"Alpaca throw error 400 for request {address}")
@@ -327,18 +497,12 @@ class AlpacaConnector(Connector):
 
         async def get_response(s: aiohttp.ClientSession):
             async with s.put(url, data=data) as response:
-                await self.__check_error(response)
-                r = await response.json()
-                return r
+                return await self.__check_error(response)
 
         data.update(self._base_data_for_request())
         try:
-            if self._http_session:
-                resp = await get_response(self._http_session)
-            else:
-                async with aiohttp.ClientSession() as session:
-                    resp = await get_response(session)
-        except IOError as exc:
+            resp = await get_response(self._get_http_session())
+        except _CONNECTION_ERRORS as exc:
             logger.error(f'Connection to {url} failed')
             raise RequestConnectionError from exc
         return resp.get("Value", None)
@@ -346,9 +510,6 @@ class AlpacaConnector(Connector):
     async def call(self, component: 'Component', function: str, **data):
         raise NotImplementedError
 
-    async def subscribe(self, variables: Iterable[Tuple[str, str]], callback: Callable):
-        raise NotImplementedError
-
     def _base_data_for_request(self):
         self.session_id += 1
         return {
@@ -367,14 +528,12 @@ class AlpacaConnector(Connector):
         return url
 
     @staticmethod
-    async def __check_error(response: aiohttp.ClientResponse):
-        """Check response from Alpaca server for Errors.
+    def __check_http_status(response: aiohttp.ClientResponse):
+        """Check HTTP status of response from Alpaca server.
 
         :param response: Response from Alpaca server to check.
         :raise AlpacaHttp400Error: if server alpaca return 400 error
         :raise AlpacaHttp500Error: if server alpaca return 500 error
-        :raise AlpacaContentTypeError: if server alpaca return data in wrong format
-        :raise AlpacaError: when server alpaca throws an error with a numeric value
         :raise AlpacaHttpError: if server alpaca return unresolved error
         :return: None
         """
@@ -394,15 +553,38 @@ class AlpacaConnector(Connector):
         except aiohttp.ClientResponseError as e:
             logger.error(f'Alpaca HTTP {e.status} error for {e.request_info.real_url}')
             raise AlpacaHttpError(str(e.message))
-        # try to convert to json and get errors
+
+    @staticmethod
+    async def __check_error(response: aiohttp.ClientResponse) -> dict:
+        """Check response from Alpaca server for Errors and return the decoded JSON body. The body is decoded only
+        once, callers use the returned dict instead of calling response.json() again.
+
+        :param response: Response from Alpaca server to check.
+        :raise AlpacaHttp400Error: if server alpaca return 400 error
+        :raise AlpacaHttp500Error: if server alpaca return 500 error
+        :raise AlpacaContentTypeError: if server alpaca return data in wrong format
+        :raise AlpacaError: when server alpaca throws an error with a numeric value
+        :raise AlpacaHttpError: if server alpaca return unresolved error
+        :return: decoded JSON response
+        """
+        AlpacaConnector.__check_http_status(response)
         try:
-            j = await response.json()
-        except aiohttp.ContentTypeError as e:
+            url = response.url
+        except Exception:
+            url = 'unknown-url'
+        # try to convert to json and get errors
+        if 'json' not in response.content_type:
             logger.error(f'Alpaca content type error. Status {response.status} error for {url}')
-            raise AlpacaContentTypeError from e
+            raise AlpacaContentTypeError(response.request_info, response.history, status=response.status,
+                                         message=f'Attempt to decode JSON with unexpected mimetype: '
+                                                 f'{response.content_type}', headers=response.headers)
+        body = await response.read()
+        # big bodies (e.g. JSON image arrays) are decoded by a worker thread, not on the event loop
+        j = await Executors().run(json.loads, body, size=len(body), threshold='alpaca_json')
         if j["ErrorNumber"] != 0:
             logger.error(f'Alpaca error, code={j["ErrorNumber"]}, msg={j["ErrorMessage"]} for {url}')
             raise AlpacaError(j["ErrorNumber"], j["ErrorMessage"])
+        return j
 
 
 # ALPACA-specific connector implementation only
@@ -53,6 +53,12 @@ class AlpacaHttp400Error(AlpacaHttpError):
     pass
 
 
+class AlpacaImageBytesError(AlpacaHttpError):
+    """
+    Exception for when Alpaca return malformed or unsupported ImageBytes data.
+    """
+
+
 class AlpacaHttp500Error(AlpacaHttpError):
     pass
 
@@ -0,0 +1,136 @@
+"""Decoder of the Alpaca ``application/imagebytes`` image transfer format.
+
+The format (ASCOM Alpaca API, ImageBytes) is a 44 byte little endian header
+followed by the raw pixel data::
+
+    int32  MetadataVersion        (1)
+    int32  ErrorNumber            (0 = OK, otherwise the data is a UTF-8 error message)
+    uint32 ClientTransactionID
+    uint32 ServerTransactionID
+    int32  DataStart              (offset of the pixel data, 44 for version 1)
+    int32  ImageElementType      (type of pixels in the camera)
+    int32  TransmissionElementType (type of pixels on the wire, may be narrower)
+    int32  Rank                   (2 or 3)
+    int32  Dimension1, Dimension2, Dimension3
+
+The pixel data is not copied, :class:`ImageBytesArray` exposes it as a
+``memoryview`` cast to the transmitted element type and image shape, which
+any buffer protocol consumer (e.g. ``numpy.asarray``) can use directly.
+"""
+from __future__ import annotations
+
+import struct
+import sys
+from typing import Dict, List, Tuple
+
+from obsrv.protocols.alpaca.alpaca_exceptions import AlpacaError, AlpacaImageBytesError
+
+IMAGEBYTES_MIME = 'application/imagebytes'
+IMAGEBYTES_ACCEPT_HEADERS = {'Accept': f'{IMAGEBYTES_MIME}, application/json'}
+IMAGE_ARRAY_VARIABLES = frozenset({'imagearray', 'imagearrayvariant'})
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+_HEADER = struct.Struct('<iiIIiiiiiii')
+HEADER_SIZE = _HEADER.size  # 44
+
+# ImageArrayElementTypes -> (struct / memoryview format, numpy-style little endian dtype)
+_ELEMENT_TYPES: Dict[int, Tuple[str, str]] = {
+    1: ('h', '<i2'),  # Int16
+    2: ('i', '<i4'),  # Int32
+    3: ('d', '<f8'),  # Double
+    4: ('f', '<f4'),  # Single
+    5: ('Q', '<u8'),  # UInt64
+    6: ('B', '|u1'),  # Byte
+    7: ('q', '<i8'),  # Int64
+    8: ('H', '<u2'),  # UInt16
+    9: ('I', '<u4'),  # UInt32
+}
+
+
+class ImageBytesArray:
+    """
+    Decoded ImageBytes frame. ``data`` is a memoryview of the response body (no copy) with ``format`` and ``shape``
+    of the transmitted array.
+
+    :param body: full response body
+    """
+
+    __slots__ = ('element_type', 'transmission_type', 'rank', 'shape', 'dtype', 'data', 'server_transaction_id')
+
+    def __init__(self, body: bytes):
+        if len(body) < HEADER_SIZE:
+            raise AlpacaImageBytesError(f'ImageBytes response too short ({len(body)} bytes)')
+        (version, error_number, _client_tid, server_tid, data_start, element_type, transmission_type, rank,
+         d1, d2, d3) = _HEADER.unpack_from(body, 0)
+        if version != 1:
+            raise AlpacaImageBytesError(f'Unsupported ImageBytes metadata version {version}')
+        view = memoryview(body)
+        if error_number != 0:
+            raise AlpacaError(error_number, bytes(view[data_start:]).decode('utf-8', errors='replace'))
+        try:
+            fmt, dtype = _ELEMENT_TYPES[transmission_type]
+        except KeyError:
+            raise AlpacaImageBytesError(f'Unsupported ImageBytes transmission element type {transmission_type}')
+        shape = (d1, d2) if rank == 2 else (d1, d2, d3)
+        data = view[data_start:]
+        if sys.byteorder != 'little' and struct.calcsize(fmt) > 1:
+            # memoryview.cast uses native order, only big endian hosts pay for a copy
+            from array import array
+            swapped = array(fmt, data)
+            swapped.byteswap()
+            data = memoryview(swapped).cast('B')
+        try:
+            self.data = data.cast(fmt, shape)
+        except TypeError as e:
+            raise AlpacaImageBytesError(f'ImageBytes payload does not match shape {shape}: {e}')
+        self.element_type = element_type
+        self.transmission_type = transmission_type
+        self.rank = rank
+        self.shape = shape
+        self.dtype = dtype
+        self.server_transaction_id = server_tid
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def iter_chunks(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        """Yield the raw pixel data in memoryview chunks of at most chunk_size bytes (no copy)."""
+        raw = self.data.cast('B')
+        for start in range(0, len(raw), chunk_size):
+            yield raw[start:start + chunk_size]
+
+    def to_value(self, chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+        """
+        Return the frame as a msgpack friendly dict: metadata and the pixel data as list of binary chunks. Pixels
+        are in the order defined by Alpaca (Dimension1 is the outer axis), client restores the array with e.g.
+        ``numpy.frombuffer(b''.join(chunks), dtype).reshape(shape)``.
+        """
+        chunks: List[bytes] = [bytes(c) for c in self.iter_chunks(chunk_size)]
+        return {'format': 'imagebytes',
+                'dtype': self.dtype,
+                'shape': list(self.shape),
+                'element_type': self.element_type,
+                'transmission_type': self.transmission_type,
+                'nbytes': self.nbytes,
+                'chunks': chunks}
+
+
+def encode_imagebytes(data: bytes, shape: Tuple[int, ...], transmission_type: int, element_type: int = None,
+                      error_number: int = 0, error_message: str = '', client_transaction_id: int = 0,
+                      server_transaction_id: int = 0) -> bytes:
+    """
+    Build an ImageBytes response body, used by simulators and tests.
+
+    :param data: raw little endian pixel data
+    :param shape: image shape, rank 2 or 3
+    :param transmission_type: element type of data
+    :param element_type: element type of the image, default the same as transmission_type
+    :param error_number: if not 0 an error frame with error_message is built
+    """
+    dims = list(shape) + [0] * (3 - len(shape))
+    payload = error_message.encode('utf-8') if error_number else data
+    header = _HEADER.pack(1, error_number, client_transaction_id, server_transaction_id, HEADER_SIZE,
+                          element_type if element_type is not None else transmission_type, transmission_type,
+                          len(shape), *dims)
+    return header + payload
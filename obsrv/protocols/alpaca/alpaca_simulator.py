@@ -0,0 +1,373 @@
+"""
+Local Alpaca compatible HTTP server simulating the device kinds of ``StandardTelescopeComponents``.
+
+Exercises the real HTTP path of ``AlpacaConnector`` (session, ``__check_error``, JSON and ImageBytes decoding)
+under load without hardware. Every endpoint can have its own latency distribution and injected faults:
+
+    config = {
+        'latency': {                       # fnmatch patterns of 'kind.method', first match wins, then 'default'
+            'default': {'dist': 'lognormal', 'median': 0.005, 'sigma': 0.5},
+            'camera.imagearray': {'dist': 'fixed', 'value': 0.2},
+        },
+        'faults': {                        # probabilities per request
+            'default': {'http_500': 0.0, 'busy': 0.0, 'reset': 0.0},
+            'telescope.*': {'busy': 0.01},
+        },
+        'devices': [{'kind': 'telescope', 'number': 0}, ...],   # default one of every kind
+        'devicestate': True,               # answer GET devicestate
+        'imagebytes': True,                # answer imagearray in application/imagebytes when asked
+        'image_size': [64, 64],
+    }
+    simulator = AlpacaSimulator(config, seed=1)
+    url = await simulator.start()          # 'http://127.0.0.1:<port>/api/v1'
+    ...
+    await simulator.stop()
+
+Latency distributions: ``fixed`` (value), ``uniform`` (low, high), ``normal`` (mean, stddev), ``lognormal``
+(median, sigma) and ``exponential`` (mean). Faults: ``http_500`` answers HTTP 500, ``busy`` answers Alpaca
+``ErrorNumber`` 20072 (device acquiring) and ``reset`` drops the connection without an answer.
+
+From the command line (serves the ``test_observatory`` of config.yaml when run on port 80)::
+
+    python -m obsrv.protocols.alpaca.alpaca_simulator --port 11111 --config simulator.yaml
+"""
+import argparse
+import asyncio
+import fnmatch
+import json
+import logging
+import math
+import random
+import struct
+from collections import Counter
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+
+from obsrv.protocols.alpaca.alpaca_imagebytes import encode_imagebytes, IMAGEBYTES_MIME
+from obsrv.telescope_devices.standard_components import StandardTelescopeComponents
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+ERROR_NOT_IMPLEMENTED = 0x400
+ERROR_INVALID_VALUE = 0x401
+ERROR_BUSY = 20072
+
+_INT32 = 2
+
+_COMMON_STATE = {
+    'connected': True,
+    'description': 'ocabox Alpaca simulator',
+    'driverinfo': 'ocabox Alpaca simulator',
+    'driverversion': '1.0',
+    'interfaceversion': 3,
+}
+
+# Initial state of device kinds, GET of a key returns it, PUT of a key sets it
+_KIND_STATE: Dict[str, Dict[str, Any]] = {
+    StandardTelescopeComponents.MOUNT: {
+        'rightascension': 0.0, 'declination': 0.0, 'altitude': 45.0, 'azimuth': 180.0, 'siderealtime': 0.0,
+        'targetrightascension': 0.0, 'targetdeclination': 0.0, 'tracking': False, 'slewing': False,
+        'atpark': False, 'athome': False, 'sideofpier': 0, 'utcdate': '2026-01-01T00:00:00.000Z',
+    },
+    StandardTelescopeComponents.DOME: {
+        'azimuth': 0.0, 'altitude': 0.0, 'shutterstatus': 1, 'slewing': False, 'atpark': False, 'athome': False,
+    },
+    StandardTelescopeComponents.CAMERA: {
+        'camerastate': 0, 'ccdtemperature': -10.0, 'cooleron': True, 'binx': 1, 'biny': 1, 'imageready': False,
+        'percentcompleted': 0, 'cameraxsize': 64, 'cameraysize': 64, 'gain': 0,
+    },
+    StandardTelescopeComponents.FILTERWHEEL: {
+        'position': 0, 'names': ['L', 'R', 'G', 'B'], 'focusoffsets': [0, 0, 0, 0],
+    },
+    StandardTelescopeComponents.FOCUSER: {
+        'position': 0, 'ismoving': False, 'absolute': True, 'maxstep': 100000, 'maxincrement': 100000,
+        'temperature': 10.0, 'tempcomp': False,
+    },
+    StandardTelescopeComponents.ROTATOR: {
+        'position': 0.0, 'mechanicalposition': 0.0, 'targetposition': 0.0, 'ismoving': False, 'reverse': False,
+    },
+    StandardTelescopeComponents.SWITCH: {
+        'maxswitch': 2, 'switchvalues': [0.0, 0.0],
+    },
+    StandardTelescopeComponents.SAFETYMONITOR: {
+        'issafe': True,
+    },
+    StandardTelescopeComponents.COVERCALIBRATOR: {
+        'coverstate': 1, 'calibratorstate': 1, 'brightness': 0, 'maxbrightness': 100,
+    },
+    StandardTelescopeComponents.TERTIARY: {
+        'position': 0,
+    },
+}
+
+_DEFAULT_CONFIG: Dict[str, Any] = {
+    'latency': {'default': {'dist': 'fixed', 'value': 0.0}},
+    'faults': {'default': {}},
+    'devices': [{'kind': kind, 'number': 0} for kind in _KIND_STATE] +
+               [{'kind': StandardTelescopeComponents.CAMERA, 'number': 1},
+                {'kind': StandardTelescopeComponents.FILTERWHEEL, 'number': 1}],
+    'devicestate': True,
+    'imagebytes': True,
+    'image_size': [64, 64],
+}
+
+
+def sample_latency(spec: Optional[dict], rng: random.Random) -> float:
+    """Draw one latency in seconds from the distribution spec (see module docstring)."""
+    if not spec:
+        return 0.0
+    dist = spec.get('dist', 'fixed')
+    if dist == 'fixed':
+        value = spec.get('value', 0.0)
+    elif dist == 'uniform':
+        value = rng.uniform(spec.get('low', 0.0), spec.get('high', 0.0))
+    elif dist == 'normal':
+        value = rng.gauss(spec.get('mean', 0.0), spec.get('stddev', 0.0))
+    elif dist == 'lognormal':
+        value = rng.lognormvariate(math.log(spec.get('median', 0.001)), spec.get('sigma', 0.0))
+    elif dist == 'exponential':
+        mean = spec.get('mean', 0.0)
+        value = rng.expovariate(1 / mean) if mean > 0 else 0.0
+    else:
+        raise ValueError(f'Unknown latency distribution {dist}')
+    return max(0.0, float(value))
+
+
+def _match(table: Dict[str, dict], endpoint: str) -> dict:
+    for pattern, spec in table.items():
+        if pattern != 'default' and fnmatch.fnmatchcase(endpoint, pattern):
+            return spec
+    return table.get('default') or {}
+
+
+def _parse_form_value(value: str):
+    low = value.lower()
+    if low in ('true', 'false'):
+        return low == 'true'
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+
+class SimulatedDevice:
+    """State and actions of one simulated device."""
+
+    def __init__(self, kind: str, number: int, image_size=(64, 64)):
+        self.kind = kind
+        self.number = number
+        self.state: Dict[str, Any] = dict(_COMMON_STATE)
+        self.state.update(json.loads(json.dumps(_KIND_STATE.get(kind, {}))))  # deep copy of lists
+        self.state['name'] = f'Simulated {kind} {number}'
+        self.image_size = tuple(image_size)
+        if kind == StandardTelescopeComponents.CAMERA:
+            self.state['cameraxsize'], self.state['cameraysize'] = self.image_size
+
+    def get(self, method: str, params: Dict[str, Any]):
+        """:raise KeyError: method is not implemented"""
+        if self.kind == StandardTelescopeComponents.SWITCH and method in ('getswitchvalue', 'getswitch'):
+            value = self.state['switchvalues'][int(params.get('id', 0))]
+            return bool(value) if method == 'getswitch' else value
+        return self.state[method]
+
+    def put(self, method: str, params: Dict[str, Any]):
+        """:raise KeyError: method is not implemented"""
+        s = self.state
+        if method in ('slewtocoordinates', 'slewtocoordinatesasync'):
+            s['rightascension'], s['declination'] = params['rightascension'], params['declination']
+        elif method in ('slewtotarget', 'slewtotargetasync'):
+            s['rightascension'], s['declination'] = s['targetrightascension'], s['targetdeclination']
+        elif method in ('slewtoaltaz', 'slewtoaltazasync'):
+            s['azimuth'], s['altitude'] = params['azimuth'], params['altitude']
+        elif method == 'slewtoazimuth':
+            s['azimuth'] = params['azimuth']
+        elif method in ('park', 'unpark'):
+            s['atpark'] = method == 'park'
+        elif method == 'findhome':
+            s['athome'] = True
+        elif method in ('abortslew', 'halt', 'abortexposure', 'stopexposure'):
+            s['slewing'] = s['ismoving'] = False
+        elif method in ('openshutter', 'closeshutter'):
+            s['shutterstatus'] = 0 if method == 'openshutter' else 1
+        elif method in ('opencover', 'closecover'):
+            s['coverstate'] = 3 if method == 'opencover' else 1
+        elif method == 'calibratoron':
+            s['calibratorstate'], s['brightness'] = 3, params.get('brightness', s['maxbrightness'])
+        elif method == 'calibratoroff':
+            s['calibratorstate'], s['brightness'] = 1, 0
+        elif method == 'move' and self.kind == StandardTelescopeComponents.ROTATOR:
+            s['position'] = (s['position'] + params['position']) % 360
+        elif method in ('move', 'moveabsolute', 'movemechanical'):
+            s['position'] = params['position']
+            if 'mechanicalposition' in s:
+                s['mechanicalposition'] = params['position']
+        elif method == 'startexposure':
+            s['imageready'] = True
+            s['camerastate'] = 0
+        elif method == 'setswitchvalue' or method == 'setswitch':
+            s['switchvalues'][int(params['id'])] = float(params['value'] if 'value' in params else params['state'])
+        elif method in s:
+            # plain property, the parameter has the property name (e.g. Tracking=True)
+            s[method] = params[method]
+        else:
+            raise KeyError(method)
+        return None
+
+    def device_state(self):
+        return [{'Name': k, 'Value': v} for k, v in self.state.items()
+                if k not in _COMMON_STATE and k != 'name' and not isinstance(v, list)]
+
+    def image_pixels(self) -> bytes:
+        w, h = self.image_size
+        return struct.pack(f'<{w}i', *range(w)) * h
+
+
+class AlpacaSimulator:
+    """
+    aiohttp application serving the Alpaca device API (``/api/v1/{kind}/{number}/{method}``) and the management
+    API of simulated devices.
+
+    :param config: simulator configuration (see module docstring), missing keys take defaults
+    :param seed: seed of latency and fault draws, for reproducible runs
+    """
+
+    def __init__(self, config: Optional[dict] = None, seed: Optional[int] = None):
+        self.config: Dict[str, Any] = dict(_DEFAULT_CONFIG)
+        self.config.update(config or {})
+        self._rng = random.Random(seed)
+        self.devices: Dict[tuple, SimulatedDevice] = {}
+        for d in self.config['devices']:
+            kind, number = d['kind'], int(d.get('number', 0))
+            self.devices[(kind, number)] = SimulatedDevice(kind, number, self.config['image_size'])
+        self.stats: Counter = Counter()  # requests per 'kind.method' and injected faults per 'fault:<name>'
+        self._server_transaction_id = 0
+        self._runner: Optional[web.AppRunner] = None
+        self.app = web.Application()
+        self.app.router.add_route('GET', '/api/v1/{kind}/{number}/{method}', self._handle)
+        self.app.router.add_route('PUT', '/api/v1/{kind}/{number}/{method}', self._handle)
+        self.app.router.add_get('/management/apiversions', self._apiversions)
+        self.app.router.add_get('/management/v1/description', self._description)
+        self.app.router.add_get('/management/v1/configureddevices', self._configured_devices)
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Start serving, port 0 picks a free port. Returns the base URL of the device API."""
+        self._runner = web.AppRunner(self.app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        logger.info(f'Alpaca simulator listening on {host}:{port}')
+        return f'http://{host}:{port}/api/v1'
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _answer(self, value=None, client_transaction_id: int = 0, error_number: int = 0, error_message: str = ''):
+        self._server_transaction_id += 1
+        return web.json_response({'Value': value, 'ClientTransactionID': client_transaction_id,
+                                  'ServerTransactionID': self._server_transaction_id,
+                                  'ErrorNumber': error_number, 'ErrorMessage': error_message})
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        kind = request.match_info['kind'].lower()
+        method = request.match_info['method'].lower()
+        endpoint = f'{kind}.{method}'
+        self.stats[endpoint] += 1
+        if request.method == 'PUT':
+            raw = await request.post()
+        else:
+            raw = request.query
+        params = {k.lower(): _parse_form_value(v) for k, v in raw.items()}
+        client_transaction_id = int(params.get('clienttransactionid', 0) or 0)
+
+        delay = sample_latency(_match(self.config['latency'], endpoint), self._rng)
+        if delay:
+            await asyncio.sleep(delay)
+        faults = _match(self.config['faults'], endpoint)
+        if faults.get('reset') and self._rng.random() < faults['reset']:
+            self.stats['fault:reset'] += 1
+            request.transport.abort()
+            return web.Response()
+        if faults.get('http_500') and self._rng.random() < faults['http_500']:
+            self.stats['fault:http_500'] += 1
+            return web.Response(status=500, text='Simulated internal server error')
+        if faults.get('busy') and self._rng.random() < faults['busy']:
+            self.stats['fault:busy'] += 1
+            return self._answer(None, client_transaction_id, ERROR_BUSY, 'DRV_ACQUIRING')
+
+        try:
+            device = self.devices[(kind, int(request.match_info['number']))]
+        except (KeyError, ValueError):
+            return web.Response(status=400, text=f'Device {kind}/{request.match_info["number"]} does not exist')
+        try:
+            if request.method == 'PUT':
+                value = device.put(method, params)
+            elif method == 'devicestate' and self.config['devicestate']:
+                value = device.device_state()
+            elif method in ('imagearray', 'imagearrayvariant') and kind == StandardTelescopeComponents.CAMERA:
+                return self._image(request, device, client_transaction_id)
+            else:
+                value = device.get(method, params)
+        except KeyError as e:
+            if request.method == 'PUT' and method in device.state:
+                return self._answer(None, client_transaction_id, ERROR_INVALID_VALUE, f'Missing parameter {e}')
+            return self._answer(None, client_transaction_id, ERROR_NOT_IMPLEMENTED,
+                                f'{method} is not implemented by the simulator')
+        return self._answer(value, client_transaction_id)
+
+    def _image(self, request: web.Request, device: SimulatedDevice, client_transaction_id: int):
+        w, h = device.image_size
+        if self.config['imagebytes'] and IMAGEBYTES_MIME in request.headers.get('Accept', ''):
+            self._server_transaction_id += 1
+            body = encode_imagebytes(device.image_pixels(), shape=(w, h), transmission_type=_INT32,
+                                     client_transaction_id=client_transaction_id,
+                                     server_transaction_id=self._server_transaction_id)
+            return web.Response(body=body, content_type=IMAGEBYTES_MIME)
+        pixels = memoryview(device.image_pixels()).cast('i', (w, h)).tolist()
+        self._server_transaction_id += 1
+        return web.json_response({'Value': pixels, 'Type': _INT32, 'Rank': 2,
+                                  'ClientTransactionID': client_transaction_id,
+                                  'ServerTransactionID': self._server_transaction_id,
+                                  'ErrorNumber': 0, 'ErrorMessage': ''})
+
+    async def _apiversions(self, request: web.Request):
+        return self._answer([1])
+
+    async def _description(self, request: web.Request):
+        return self._answer({'ServerName': 'ocabox Alpaca simulator', 'Manufacturer': 'ocabox',
+                             'ManufacturerVersion': '1.0', 'Location': 'localhost'})
+
+    async def _configured_devices(self, request: web.Request):
+        return self._answer([{'DeviceName': d.state['name'], 'DeviceType': d.kind, 'DeviceNumber': d.number,
+                              'UniqueID': f'ocabox-sim-{d.kind}-{d.number}'} for d in self.devices.values()])
+
+
+def load_config(path: Optional[str]) -> dict:
+    if not path:
+        return {}
+    with open(path) as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        import yaml
+        return yaml.safe_load(f) or {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Alpaca compatible device simulator')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11111)
+    parser.add_argument('--config', help='YAML or JSON file with simulator configuration')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    simulator = AlpacaSimulator(load_config(args.config), seed=args.seed)
+    web.run_app(simulator.app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
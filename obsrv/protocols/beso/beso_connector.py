@@ -4,7 +4,6 @@ Implements the base Connector interface for BESO spectrograph systems.
 """
 import asyncio
 import logging
-from typing import Iterable, Callable, Tuple
 
 from obsrv.protocols.alpaca.alpaca_connector import Connector
 
@@ -64,12 +63,6 @@ class BesoConnector(Connector):
         logger.info(f"BESO CALL: {component.kind}.{function}")
         return {"status": "called", "function": function}
     
-    async def subscribe(self, variables: Iterable[Tuple[str, str]], callback: Callable):
-        """Subscribe to BESO system updates."""
-        logger.info(f"BESO SUBSCRIBE: {list(variables)}")
-        # Mock subscription - in real implementation would set up TCP/HTTP polling
-        pass
-    
     async def connect(self):
         """Connect to BESO spectrograph system."""
         # Mock connection
@@ -0,0 +1,143 @@
+"""
+Per-host circuit breaker for connectors.
+
+When a device server dies every request to it waits out its full timeout. The breaker counts consecutive failures
+(connection errors, timeouts and calls slower than ``slow_call_threshold``) of one host and after
+``failure_threshold`` of them it opens: requests fail immediately with :class:`CircuitOpenError` (connectors turn it
+into ``TreeOtherError(4005)``). After ``open_duration`` seconds the breaker is half-open and lets exactly one probe
+request through, its success closes the breaker, its failure opens it again.
+
+    breaker = breakers.get(host)
+    probe = breaker.acquire()          # raises CircuitOpenError
+    try:
+        ...request...
+    except ConnectionError:
+        breaker.record_failure()
+        raise
+    else:
+        breaker.record_success(latency)
+"""
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(ConnectionError):
+    """Request rejected without trying because the breaker of the host is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"Circuit breaker for {name} is open, retry in {retry_in:.1f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker of one host.
+
+    :param name: host name used in logs and errors
+    :param failure_threshold: consecutive failures opening the breaker
+    :param open_duration: seconds the breaker stays open before a probe is allowed
+    :param slow_call_threshold: successful calls (and cancelled calls) lasting at least this many seconds count as
+        failures, None or 0 disables it
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, open_duration: float = 30.0,
+                 slow_call_threshold: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.open_duration = float(open_duration)
+        self.slow_call_threshold = float(slow_call_threshold) if slow_call_threshold else None
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.open_count = 0
+        self.rejected_count = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == STATE_OPEN and time.monotonic() - self._opened_at >= self.open_duration:
+            return STATE_HALF_OPEN
+        return self._state
+
+    def acquire(self) -> bool:
+        """
+        Ask for permission to send a request.
+
+        :return: True if the request is the half-open probe (its outcome decides the state)
+        :raise CircuitOpenError: the breaker is open or the probe is already in flight
+        """
+        state = self.state
+        if state == STATE_CLOSED:
+            return False
+        if state == STATE_HALF_OPEN and not self._probe_in_flight:
+            self._state = STATE_HALF_OPEN
+            self._probe_in_flight = True
+            return True
+        self.rejected_count += 1
+        retry_in = max(0.0, self.open_duration - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self, latency: float = 0.0):
+        if self.slow_call_threshold is not None and latency >= self.slow_call_threshold:
+            self.record_failure()
+            return
+        if self._state != STATE_CLOSED:
+            logger.warning(f"Circuit breaker for {self.name} closed, host is responding again")
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        if self._state == STATE_OPEN:
+            # late failure of a call sent before the breaker opened, it must not extend the open window
+            return
+        self._failures += 1
+        if self._state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state == STATE_CLOSED:
+                logger.error(f"Circuit breaker for {self.name} opened after {self._failures} consecutive failures, "
+                             f"requests fail fast for {self.open_duration:.0f}s")
+            self._state = STATE_OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+            self.open_count += 1
+
+    def record_cancelled(self, latency: float):
+        """The request was cancelled (e.g. by the caller's timeout), only a slow one says something about the host."""
+        if self.slow_call_threshold is not None and latency >= self.slow_call_threshold:
+            self.record_failure()
+        elif self._probe_in_flight:
+            # no verdict, let the next request probe
+            self._probe_in_flight = False
+
+    def describe(self) -> dict:
+        return {'state': self.state, 'consecutive_failures': self._failures, 'open_count': self.open_count,
+                'rejected': self.rejected_count}
+
+
+class CircuitBreakerSet:
+    """Breakers of a connector, one per host, created on first use with common settings."""
+
+    def __init__(self, enabled: bool = True, **settings):
+        self.enabled = enabled
+        self._settings = settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, host: str) -> Optional[CircuitBreaker]:
+        """Breaker of the host or None if breakers are disabled."""
+        if not self.enabled:
+            return None
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(host, **self._settings)
+        return breaker
+
+    def describe(self) -> Dict[str, dict]:
+        return {host: b.describe() for host, b in self._breakers.items()}
@@ -2,13 +2,15 @@
 Universal Connector Factory - Creates protocol-specific connectors.
 Lives in protocols/ because it creates protocol connectors.
 """
+import functools
 import logging
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
 
+@functools.lru_cache(maxsize=None)
 def _load_all_protocols():
-    """Load all available protocol connectors."""
+    """Load all available protocol connectors. The table is built once, do not modify the returned dict."""
     classes = {}
     
     # Try to load ALPACA protocol
@@ -49,12 +51,17 @@ def _load_all_protocols():
     return classes
 
 
-def create_connector(protocol: str):
-    """Create a connector for the specified protocol."""
+def get_connector_class(protocol: str):
+    """Return connector class for the specified protocol."""
     connector_classes = _load_all_protocols()
-    
+
     if protocol not in connector_classes:
         available = list(connector_classes.keys())
         raise ValueError(f"Unknown protocol: {protocol}. Available: {available}")
-    
-    return connector_classes[protocol]()
+
+    return connector_classes[protocol]
+
+
+def create_connector(protocol: str):
+    """Create a new (not shared) connector for the specified protocol, see also ``ConnectorRegistry``."""
+    return get_connector_class(protocol)()
@@ -0,0 +1,139 @@
+"""
+Process-wide registry of shared connectors.
+
+Components talking to the same device host share one connector (and so one HTTP session, connection pool, command
+ID space and circuit breaker) instead of building their own. Connectors are keyed by ``(protocol, endpoint)`` and
+reference counted: ``acquire`` returns the existing connector or creates one, ``release`` closes it when the last
+user is gone.
+"""
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+from obsrv.protocols.connector_factory import get_connector_class
+from obsrv.utils.singleton import SingletonMeta
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+
+def normalize_endpoint(address: Optional[str]) -> Optional[str]:
+    """Endpoint of the address: 'scheme://host:port' for URLs (paths on the same server share a connector),
+    the address itself otherwise (e.g. Pilar 'host:port')."""
+    if not address:
+        return None
+    address = str(address).strip()
+    parts = urlsplit(address)
+    if parts.scheme and parts.netloc:
+        return f"{parts.scheme}://{parts.netloc}".lower()
+    return address.lower()
+
+
+@dataclass
+class _Entry:
+    connector: object
+    protocol: str
+    endpoint: Optional[str]
+    refcount: int = 0
+
+
+class ConnectorRegistry(metaclass=SingletonMeta):
+    """Registry of shared, reference counted connectors, ``ConnectorRegistry()`` always returns the same instance."""
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, Optional[str]], _Entry] = {}
+        self._lock = threading.Lock()
+        # closing of async connectors in progress, referenced so the tasks are not garbage collected
+        self._closing_tasks: Set[asyncio.Task] = set()
+
+    def acquire(self, protocol: str, address: Optional[str] = None):
+        """
+        Return connector shared by all users of the protocol on the address endpoint, create it if needed.
+
+        :param protocol: protocol name, e.g. 'alpaca'
+        :param address: device address, it is normalized by :func:`normalize_endpoint`
+        :raise ValueError: when protocol is unknown
+        """
+        key = (protocol, normalize_endpoint(address))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry(connector=self._create(protocol), protocol=protocol, endpoint=key[1])
+                self._entries[key] = entry
+                logger.debug(f"Created shared {protocol} connector for {key[1]}")
+            entry.refcount += 1
+            return entry.connector
+
+    def release(self, connector) -> bool:
+        """
+        Drop one reference to the connector, the last release removes it from the registry and closes it.
+
+        :return: True if the connector was closed
+        """
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry.connector is connector:
+                    entry.refcount -= 1
+                    if entry.refcount > 0:
+                        return False
+                    del self._entries[key]
+                    break
+            else:
+                return False
+        self._close(connector)
+        return True
+
+    def entries(self) -> List[dict]:
+        """Description of registered connectors for diagnostics."""
+        with self._lock:
+            return [{'protocol': e.protocol, 'endpoint': e.endpoint, 'refcount': e.refcount,
+                     'connector': type(e.connector).__name__} for e in self._entries.values()]
+
+    def circuit_breaker_states(self) -> Dict[str, dict]:
+        """Breaker states of all registered connectors which have breakers, keyed by server."""
+        states = {}
+        for connector in self.connectors():
+            get_states = getattr(connector, 'circuit_breaker_states', None)
+            if get_states is not None:
+                states.update(get_states())
+        return states
+
+    def pool_stats(self) -> Dict[str, dict]:
+        """Connection pool occupancy of all registered connectors which have pools, keyed by server."""
+        stats = {}
+        for connector in self.connectors():
+            get_stats = getattr(connector, 'pool_stats', None)
+            if get_stats is not None:
+                stats.update(get_stats())
+        return stats
+
+    def connectors(self) -> List[object]:
+        with self._lock:
+            return [e.connector for e in self._entries.values()]
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _create(protocol: str):
+        return get_connector_class(protocol)()
+
+    def _close(self, connector):
+        close = getattr(connector, 'close', None)
+        if close is None:
+            return
+        try:
+            result = close()
+        except Exception as e:
+            logger.warning(f"Closing connector {type(connector).__name__} failed: {e!r}")
+            return
+        if asyncio.iscoroutine(result):
+            try:
+                task = asyncio.get_running_loop().create_task(result)
+            except RuntimeError:
+                result.close()  # no running loop, nothing to close asynchronously
+            else:
+                self._closing_tasks.add(task)
+                task.add_done_callback(self._closing_tasks.discard)
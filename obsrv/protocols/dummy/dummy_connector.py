@@ -4,28 +4,10 @@ Logs commands and provides example values for telescope mount operations.
 """
 import logging
 import time
-from typing import Iterable, Callable, Tuple
 
-logger = logging.getLogger(__name__.rsplit('.')[-1])
-
-
-class Connector:
-    """Base connector class for all telescope protocols."""
-
-    async def get(self, component: 'Component', variable: str, kind=None, **data):
-        raise NotImplementedError
-
-    async def put(self, component: 'Component', variable: str, kind=None, **data):
-        raise NotImplementedError
+from obsrv.protocols.alpaca.alpaca_connector import Connector
 
-    async def call(self, component: 'Component', function: str, **data):
-        raise NotImplementedError
-
-    async def subscribe(self, variables: Iterable[Tuple[str, str]], callback: Callable):
-        raise NotImplementedError
-
-    def __del__(self):
-        pass
+logger = logging.getLogger(__name__.rsplit('.')[-1])
 
 
 class DummyConnector(Connector):
@@ -142,11 +124,5 @@ class DummyConnector(Connector):
                 
         return True
 
-    async def subscribe(self, variables: Iterable[Tuple[str, str]], callback: Callable):
-        """Subscribe to variable changes (dummy implementation)."""
-        logger.info(f"DUMMY SUBSCRIBE: {list(variables)}")
-        # In a real implementation, this would set up periodic callbacks
-        pass
-
     def __del__(self):
         logger.info("Dummy connector destroyed")
\ No newline at end of file
@@ -1,7 +1,10 @@
 import asyncio
+import functools
+import itertools
 import logging
 import os
-from typing import Iterable, Callable, Tuple, Dict
+from dataclasses import dataclass
+from typing import Tuple, Dict
 import confuse
 
 from obsrv.protocols.alpaca.alpaca_connector import Connector
@@ -23,33 +26,176 @@ CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'iris_ccd_config.yml')
 _TEMPORARY_IO_ERRORS = (ConnectionError, BrokenPipeError, OSError,
                         asyncio.TimeoutError, TimeoutError)
 
+
+class EndpointClosedError(ConnectionError):
+    """The endpoint was closed before the command was sent, the command can be sent again on a new endpoint."""
+
+
 class IrisCcdProtocol(asyncio.DatagramProtocol):
-    def __init__(self, response_future: asyncio.Future):
+    """Datagram protocol of one IRIS CCD address, hands every datagram to the endpoint correlator."""
+    def __init__(self, endpoint: 'IrisCcdEndpoint'):
         super().__init__()
-        self.response_future = response_future
+        self.endpoint = endpoint
         self.transport = None
 
     def connection_made(self, transport: asyncio.DatagramTransport):
         self.transport = transport
 
     def datagram_received(self, data: bytes, addr: Tuple[str, int]):
-        if not self.response_future.done():
-            self.response_future.set_result(data)
+        self.endpoint.response_received(data)
 
     def error_received(self, exc: Exception):
-        if not self.response_future.done():
-            self.response_future.set_exception(exc)
+        self.endpoint.fail_pending(exc)
 
     def connection_lost(self, exc: Exception):
-        if not self.response_future.done():
-            self.response_future.set_exception(exc or ConnectionError("Connection lost"))
+        self.endpoint.fail_pending(exc or ConnectionError("Connection lost"))
+
+
+@dataclass
+class CommandStats:
+    """Latency statistics of one IRIS CCD command (seconds)."""
+    count: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    coalesced: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    last: float = 0.0
+
+    def add(self, latency: float):
+        self.count += 1
+        self.total += latency
+        self.last = latency
+        if latency > self.max:
+            self.max = latency
+
+    def as_dict(self) -> dict:
+        return {'count': self.count, 'errors': self.errors, 'timeouts': self.timeouts, 'coalesced': self.coalesced,
+                'mean': self.total / self.count if self.count else None, 'max': self.max, 'last': self.last}
+
+
+class IrisCcdEndpoint:
+    """
+    Request/response correlator of one IRIS CCD address (UDP socket).
+
+    With ``token_echo`` every command is prefixed with a unique token (``#1a2b sync``), the device repeats it at the
+    start of the response and any number of commands can be in flight; responses are matched to their futures by the
+    token and responses with unknown tokens are dropped. Without it responses carry nothing to match on, so commands
+    go one at a time. In both modes duplicate GETs of the same command already queued or in flight share one datagram
+    (``coalesce=True``).
+
+    :param transport: connected datagram transport
+    :param packet_size: commands are padded with zero bytes to this size
+    :param token_echo: device echoes command tokens
+    :param token_prefix: first character of a token
+    """
+
+    def __init__(self, transport: asyncio.DatagramTransport, packet_size: int, token_echo: bool = False,
+                 token_prefix: str = '#'):
+        self.transport = transport
+        self._packet_size = packet_size
+        self._token_echo = token_echo
+        self._token_prefix = token_prefix
+        self._tokens = itertools.count(1)
+        self._pending: Dict[str, asyncio.Future] = {}  # token -> future, token '' in serialized mode
+        self._serial_lock = asyncio.Lock()
+        self._shared: Dict[str, asyncio.Task] = {}  # coalesced GETs: command -> task
+        self.stats: Dict[str, CommandStats] = {}
+
+    @property
+    def closing(self) -> bool:
+        return self.transport is None or self.transport.is_closing()
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+    def command_stats(self, command_str: str) -> CommandStats:
+        key = command_str.split(' ', 1)[0]
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = CommandStats()
+        return stats
+
+    async def request(self, command_str: str, timeout: float, coalesce: bool = False) -> bytes:
+        """Send command and return the raw response (without the token)."""
+        if not coalesce:
+            return await self._request(command_str, timeout)
+        task = self._shared.get(command_str)
+        if task is None:
+            task = asyncio.ensure_future(self._request(command_str, timeout))
+            self._shared[command_str] = task
+            task.add_done_callback(functools.partial(self._forget_shared, command_str))
+        else:
+            self.command_stats(command_str).coalesced += 1
+        # shield: cancelling one of waiting requests must not cancel the datagram others wait for
+        return await asyncio.shield(task)
+
+    def _forget_shared(self, command_str: str, task: asyncio.Task):
+        if self._shared.get(command_str) is task:
+            del self._shared[command_str]
+        if not task.cancelled():
+            task.exception()  # retrieved, even if all waiters were cancelled
+
+    async def _request(self, command_str: str, timeout: float) -> bytes:
+        stats = self.command_stats(command_str)
+        if self._token_echo:
+            return await self._send_and_wait(f"{self._token_prefix}{next(self._tokens):x}", command_str, timeout,
+                                             stats)
+        async with self._serial_lock:
+            return await self._send_and_wait('', command_str, timeout, stats)
+
+    async def _send_and_wait(self, token: str, command_str: str, timeout: float, stats: CommandStats) -> bytes:
+        if self.closing:
+            raise EndpointClosedError("IRIS CCD endpoint is closed")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending[token] = future
+        packet = f"{token} {command_str}" if token else command_str
+        start = loop.time()
+        try:
+            self.transport.sendto(packet.encode('utf-8').ljust(self._packet_size, b'\0'))
+            data = await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            if self._pending.get(token) is future:
+                del self._pending[token]
+        stats.add(loop.time() - start)
+        return data
+
+    def response_received(self, data: bytes):
+        if not self._token_echo:
+            future = self._pending.get('')
+            if future is not None and not future.done():
+                future.set_result(data)
+            return
+        head, _, rest = data.partition(b' ')
+        future = self._pending.get(head.decode('utf-8', errors='replace'))
+        if future is None or future.done():
+            logger.debug(f"Dropped IRIS CCD response with unknown token: {data[:64]!r}")
+            return
+        future.set_result(rest)
+
+    def fail_pending(self, exc: BaseException):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
 
 class IrisCcdConnector(Connector):
+    _token_echo = False
+    _coalesce_gets = True
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self._load_config()
-        self._endpoints = {} # Map: address -> (transport, protocol)
-        self._locks = {}     # Map: address -> asyncio.Lock
+        self._endpoints: Dict[str, IrisCcdEndpoint] = {}  # Map: address -> endpoint
+        self._locks = {}     # Map: address -> asyncio.Lock, guards endpoint creation
         logger.info('IrisCcdConnector created')
 
     def _load_config(self):
@@ -59,6 +205,14 @@ class IrisCcdConnector(Connector):
             config.set_file(CONFIG_PATH)
             self._packet_size = config['settings']['packet_size'].get(int)
             self._timeout = config['settings']['command_timeout'].get(float)
+            try:
+                self._token_echo = config['settings']['token_echo'].get(bool)
+            except confuse.NotFoundError:
+                self._token_echo = False
+            try:
+                self._coalesce_gets = config['settings']['coalesce_gets'].get(bool)
+            except confuse.NotFoundError:
+                self._coalesce_gets = True
             self._command_map = config['mappings']['commands'].get(dict)
             self._actions_map = config['mappings']['actions'].get(dict)
             logger.info("IRIS CCD configuration loaded successfully.")
@@ -66,72 +220,79 @@ class IrisCcdConnector(Connector):
             logger.error(f"CRITICAL: Could not read IRIS CCD config file. Error: {e}")
             raise RuntimeError("IRIS CCD connector configuration is missing or corrupted.") from e
 
-    async def _get_endpoint(self, address: str):
+    async def _get_endpoint(self, address: str) -> IrisCcdEndpoint:
+        endpoint = self._endpoints.get(address)
+        if endpoint is not None and not endpoint.closing:
+            return endpoint
         if address not in self._locks:
             self._locks[address] = asyncio.Lock()
-        
+
         async with self._locks[address]:
-            if address in self._endpoints:
-                return self._endpoints[address]
-            
+            endpoint = self._endpoints.get(address)
+            if endpoint is not None and not endpoint.closing:
+                return endpoint
+
             try:
                 host, port_str = address.split(':')
                 port = int(port_str)
                 loop = asyncio.get_running_loop()
-                # Create a protocol with a dummy future initially
-                protocol = IrisCcdProtocol(asyncio.Future())
-                transport, protocol = await loop.create_datagram_endpoint(
-                    lambda: protocol,
+                endpoint = IrisCcdEndpoint(None, self._packet_size, token_echo=self._token_echo)
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: IrisCcdProtocol(endpoint),
                     remote_addr=(host, port)
                 )
-                self._endpoints[address] = (transport, protocol)
+                endpoint.transport = transport
+                if address in self._endpoints:
+                    # keep statistics of the replaced endpoint
+                    endpoint.stats = self._endpoints[address].stats
+                self._endpoints[address] = endpoint
                 logger.info(f"UDP endpoint created for {address}")
-                return transport, protocol
+                return endpoint
             except Exception as e:
                 logger.error(f"Failed to connect UDP to {address}: {e}")
                 raise
 
-    async def _execute_command(self, address: str, command_str: str) -> str:
-        # Get endpoint first to ensure locks are created
-        transport, protocol = await self._get_endpoint(address)
-        
-        # Lock per address to ensure sequential request-response on the same socket
-        async with self._locks[address]:
-            if not transport or transport.is_closing():
-                 # Reconnect logic if needed, simplistically removing from cache
-                 if address in self._endpoints: del self._endpoints[address]
-                 transport, protocol = await self._get_endpoint(address)
-
+    async def _execute_command(self, address: str, command_str: str, coalesce: bool = False) -> str:
+        endpoint = await self._get_endpoint(address)
+        try:
+            logger.debug(f"IRIS CCD OUT ({address}) >>> {command_str}")
             try:
-                response_future = asyncio.get_running_loop().create_future()
-                # Update future in the protocol instance
-                protocol.response_future = response_future
-                
-                command_bytes = command_str.encode('utf-8')
-                packet_to_send = command_bytes.ljust(self._packet_size, b'\0')
-                
-                logger.debug(f"IRIS CCD OUT ({address}) >>> {command_str}")
-                transport.sendto(packet_to_send)
-                
-                data = await asyncio.wait_for(response_future, timeout=self._timeout)
-                response = data.split(b'\0', 1)[0].decode('utf-8')
-                logger.debug(f"IRIS CCD IN ({address}) <<< {response}")
-
-                if "OKAY" in response:
-                    # Znajdujemy pozycję słowa OKAY i zwracamy wszystko, co po nim występuje
-                    index = response.find("OKAY")
-                    return response[index + 4:].strip()
-                else:
-                    raise RuntimeError(f"IRIS CCD error: {response}")
+                data = await endpoint.request(command_str, timeout=self._timeout, coalesce=coalesce)
+            except EndpointClosedError:
+                # a timeout of the command before this one closed the endpoint while this one waited for its turn,
+                # it was not sent yet, so it goes once more through the new socket
+                endpoint = await self._get_endpoint(address)
+                data = await endpoint.request(command_str, timeout=self._timeout, coalesce=coalesce)
+            response = data.split(b'\0', 1)[0].decode('utf-8')
+            logger.debug(f"IRIS CCD IN ({address}) <<< {response}")
 
-            except asyncio.TimeoutError:
-                logger.error(f"IRIS CCD command '{command_str}' timed out.")
-                # Force reconnect on timeout to be safe
-                if address in self._endpoints: del self._endpoints[address]
-                raise TimeoutError("IRIS CCD did not respond in time.")
-            except Exception as e:
-                logger.error(f"Error during IRIS CCD command: {e}")
-                raise
+            if "OKAY" in response:
+                # Znajdujemy pozycję słowa OKAY i zwracamy wszystko, co po nim występuje
+                index = response.find("OKAY")
+                return response[index + 4:].strip()
+            else:
+                raise RuntimeError(f"IRIS CCD error: {response}")
+
+        except asyncio.TimeoutError:
+            logger.error(f"IRIS CCD command '{command_str}' timed out.")
+            if not self._token_echo:
+                # A late response would be taken for the answer to the next command, new socket (new local port)
+                # drops it
+                endpoint.close()
+            raise TimeoutError("IRIS CCD did not respond in time.")
+        except Exception as e:
+            logger.error(f"Error during IRIS CCD command: {e}")
+            raise
+
+    async def close(self):
+        for endpoint in self._endpoints.values():
+            endpoint.close()
+        self._endpoints.clear()
+
+    def latency_stats(self) -> Dict[str, Dict[str, dict]]:
+        """Per address and command latency statistics, e.g. ``{'10.0.0.5:7000': {'sync': {'count': 10, ...}}}``."""
+        return {address: {cmd: st.as_dict() for cmd, st in endpoint.stats.items()}
+                for address, endpoint in self._endpoints.items()}
 
     async def get(self, component: 'Component', variable: str, kind=None, **data):
         address = component.get_option_recursive('address')
@@ -162,8 +323,8 @@ class IrisCcdConnector(Connector):
             else:
                 command = command_base
             
-            # 1. Pobieramy surowy tekst z kamery
-            raw_response = await self._execute_command(address, command)
+            # 1. Pobieramy surowy tekst z kamery (identyczne GET-y w locie dzielą jeden datagram)
+            raw_response = await self._execute_command(address, command, coalesce=self._coalesce_gets)
             
             # 2. TŁUMACZENIE STANU KAMERY NA STANDARD ALPACA
             if component.kind == 'camera' and variable == 'camerastate':
@@ -272,7 +433,4 @@ class IrisCcdConnector(Connector):
         except RuntimeError as e:
             raise TreeValueError(address=None, code=2002,
                                  message=f"IRIS CCD device error on CALL {function}: {e}",
-                                 severity=TreeValueError.SEVERITY_NORMAL) from e
-
-    async def subscribe(self, variables: Iterable[Tuple[str, str]], callback: Callable):
-        pass
\ No newline at end of file
+                                 severity=TreeValueError.SEVERITY_NORMAL) from e
\ No newline at end of file
@@ -1,11 +1,14 @@
 import asyncio
+import functools
 import logging
 import ssl
 import os
-from typing import Iterable, Callable, Tuple, Dict
+import time
+from typing import Iterable, Callable, Tuple, Dict, List, Set
 import confuse
 
 from obsrv.protocols.alpaca.alpaca_connector import Connector
+from obsrv.protocols.subscription import deliver, combine_unsubscribes, Unsubscribe, DEFAULT_POLL_PERIOD
 from obcom.data_colection.address import AddressError
 from obcom.data_colection.coded_error import TreeOtherError, TreeStructureError
 
@@ -24,24 +27,75 @@ CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'pilar_config.yml')
 _TEMPORARY_IO_ERRORS = (ConnectionError, BrokenPipeError, OSError, asyncio.TimeoutError, TimeoutError)
 
 
+def _parse_value(value_str: str):
+    # Próba konwersji tekstu na liczbę, jeśli to nie liczba, zostaw jako tekst
+    try:
+        if '.' in value_str:
+            return float(value_str)
+        return int(value_str)
+    except ValueError:
+        return value_str
+
+
+class _CommandReply:
+    """Stan odpowiedzi na jedną komendę: zbiera wartość z linii z jej cmd_id aż do statusu zakończenia."""
+    __slots__ = ('command_str', 'value', 'future')
+
+    def __init__(self, command_str: str, future: asyncio.Future = None):
+        self.command_str = command_str
+        self.value = None
+        self.future = future
+
+    @property
+    def result(self):
+        return self.value if self.value is not None else "OK"
+
+    def feed(self, response_line: str) -> bool:
+        """
+        Przetwarza linię odpowiedzi adresowaną do tej komendy.
+
+        :return: True gdy komenda się zakończyła
+        :raise RuntimeError: gdy serwer zgłosił błąd komendy
+        """
+        # Znak = oznacza, że dostaliśmy wartość
+        if "=" in response_line:
+            self.value = _parse_value(response_line.split("=", 1)[1].strip())
+
+        # Rozpoznajemy status zakończenia komendy
+        if "COMMAND COMPLETE" in response_line:
+            return True
+
+        # Rozszerzone wyłapywanie asynchronicznych błędów i ostrzeżeń z serwera
+        if any(error_flag in response_line for error_flag in ["COMMAND FAILED", "DATA ERROR", "FAILED", "EVENT WARN"]):
+            raise RuntimeError(f"Pilar command failed: {self.command_str}. Server said: {response_line}")
+        return False
+
+
 class PilarConnection:
-    """Reprezentuje pojedyncze, aktywne połączenie TCP z serwerem Pilar."""
+    """Reprezentuje pojedyncze, aktywne połączenie TCP z serwerem Pilar.
+
+    Works in one of two modes. By default the caller owns the connection for the whole command
+    (:meth:`execute` reads lines until its own cmd_id completes). After :meth:`start_multiplexing` one reader task
+    owns the socket and demultiplexes response lines by cmd_id into per-command futures, so up to
+    ``max_in_flight`` commands are pipelined on the connection (:meth:`submit`).
+    """
     def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         self.reader = reader
         self.writer = writer
         self.broken = False
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._pending: Dict[int, _CommandReply] = {}
+        self._reader_task: asyncio.Task = None
+        self._in_flight: asyncio.Semaphore = None
+        # Called with unsolicited 'EVENT ...' lines read in multiplexed mode
+        self.event_handler: Callable[[str], None] = None
 
     async def execute(self, cmd_id: int, command_str: str, timeout: float) -> str:
         """Wysyła komendę i czeka na odpowiedź pasującą do cmd_id."""
-        full_command = f"{cmd_id} {command_str}\n"
-        try:
-            self.writer.write(full_command.encode('utf-8'))
-            await self.writer.drain()
-        except _TEMPORARY_IO_ERRORS:
-            self.broken = True
-            raise
+        await self._write_command(cmd_id, command_str)
 
-        value_to_return = None
+        reply = _CommandReply(command_str)
         while True:
             try:
                 line_bytes = await asyncio.wait_for(self.reader.readline(), timeout=timeout)
@@ -51,37 +105,126 @@ class PilarConnection:
             if not line_bytes:
                 self.broken = True
                 raise ConnectionAbortedError("Pilar connection closed unexpectedly.")
-            
+
             response_line = line_bytes.decode('utf-8').strip()
-            
+
             # Sprawdzamy czy odpowiedź dotyczy naszego ID
             if response_line.startswith(f"{cmd_id} "):
-                
-                # Znak = oznacza, że dostaliśmy wartość
-                if "=" in response_line:
-                    value_str = response_line.split("=", 1)[1].strip()
-                    # Próba konwersji tekstu na liczbę musi być pod if "="
-                    try:
-                        if '.' in value_str:
-                            value_to_return = float(value_str)
-                        else:
-                            value_to_return = int(value_str)
-                    except ValueError:
-                        # Jeśli to nie liczba, zostaw jako tekst
-                        value_to_return = value_str
-                        
-                # Rozpoznajemy status zakończenia komendy
-                if "COMMAND COMPLETE" in response_line:
-                    return value_to_return if value_to_return is not None else "OK"
-                
-                # Rozszerzone wyłapywanie asynchronicznych błędów i ostrzeżeń z serwera
-                if any(error_flag in response_line for error_flag in ["COMMAND FAILED", "DATA ERROR", "FAILED", "EVENT WARN"]):
-                    raise RuntimeError(f"Pilar command failed: {command_str}. Server said: {response_line}")
+                if reply.feed(response_line):
+                    return reply.result
+
+    async def _write_command(self, cmd_id: int, command_str: str):
+        full_command = f"{cmd_id} {command_str}\n"
+        self.last_used = time.monotonic()
+        try:
+            self.writer.write(full_command.encode('utf-8'))
+            await self.writer.drain()
+        except _TEMPORARY_IO_ERRORS:
+            self.broken = True
+            raise
+
+    # ------------------------------------------------------------------ multiplexed mode
+
+    @property
+    def multiplexed(self) -> bool:
+        return self._reader_task is not None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    @property
+    def idle_for(self) -> float:
+        """Seconds since the last command was sent on this connection."""
+        return time.monotonic() - self.last_used
+
+    def start_multiplexing(self, max_in_flight: int):
+        """Start the reader task, from now on commands must be sent with :meth:`submit`."""
+        if self._reader_task is None:
+            self._in_flight = asyncio.Semaphore(max_in_flight)
+            self._reader_task = asyncio.create_task(self._read_loop())
+
+    async def submit(self, cmd_id: int, command_str: str, timeout: float):
+        """
+        Send a command on a multiplexed connection and wait for its reply. The cmd_id must not be in flight on this
+        connection. On timeout the command is forgotten, its late response lines are dropped by the reader.
+        """
+        async with self._in_flight:
+            if self.broken:
+                raise ConnectionAbortedError("Pilar connection closed unexpectedly.")
+            reply = _CommandReply(command_str, asyncio.get_running_loop().create_future())
+            self._pending[cmd_id] = reply
+            try:
+                await self._write_command(cmd_id, command_str)
+                return await asyncio.wait_for(reply.future, timeout=timeout)
+            finally:
+                if self._pending.get(cmd_id) is reply:
+                    del self._pending[cmd_id]
+
+    async def _read_loop(self):
+        error = None
+        try:
+            while True:
+                line_bytes = await self.reader.readline()
+                if not line_bytes:
+                    break
+                self._dispatch_line(line_bytes.decode('utf-8', errors='replace').strip())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:  # socket errors, too long lines - the connection can not be trusted anymore
+            error = e
+            logger.debug(f"Pilar reader stopped: {e!r}")
+        finally:
+            self.broken = True
+            self._fail_pending(ConnectionAbortedError(
+                f"Pilar connection closed unexpectedly{f': {error}' if error else '.'}"))
+
+    def _dispatch_line(self, response_line: str):
+        head, _, _ = response_line.partition(' ')
+        if head == 'EVENT' and self.event_handler is not None:
+            self.event_handler(response_line)
+            return
+        try:
+            cmd_id = int(head)
+        except ValueError:
+            logger.debug(f"Dropped Pilar line without command id: {response_line!r}")
+            return
+        reply = self._pending.get(cmd_id)
+        if reply is None or reply.future.done():
+            # late response of a command that timed out (or was cancelled)
+            logger.debug(f"Dropped Pilar line for unknown command id {cmd_id}: {response_line!r}")
+            return
+        try:
+            done = reply.feed(response_line)
+        except RuntimeError as e:
+            reply.future.set_exception(e)
+            del self._pending[cmd_id]
+            return
+        if done:
+            reply.future.set_result(reply.result)
+            del self._pending[cmd_id]
+
+    def _fail_pending(self, exc: BaseException):
+        pending, self._pending = self._pending, {}
+        for reply in pending.values():
+            if not reply.future.done():
+                reply.future.set_exception(exc)
+
+    def close(self):
+        self.broken = True
+        if self._reader_task is not None and not self._reader_task.done():
+            self._reader_task.cancel()
+        try:
+            self.writer.close()
+        except Exception:
+            pass
 
 
 class PilarConnector(Connector):
     # Wait before reconnecting tries.
     _RECONNECT_COOLDOWN = 30.0
+    # Pipelined commands on a few sockets instead of a pool with one command per socket (settings.multiplexing).
+    _multiplexed = False
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -105,7 +248,29 @@ class PilarConnector(Connector):
         self._reconnect_suppressed_until: Dict[str, float] = {}
         self._outage_logged: Dict[str, bool] = {}
 
-        logger.info(f'Pilar advanced connector created with pool size: {self._pool_size}')
+        # Tryb multipleksowany. Klucz: "IP:PORT", Wartość: lista połączeń z działającym czytnikiem
+        self._mux_connections: Dict[str, List[PilarConnection]] = {}
+        self._mux_next: Dict[str, int] = {}
+
+        # Wszystkie żywe połączenia puli (kolejka zawiera tylko wolne). Klucz: "IP:PORT"
+        self._pool_members: Dict[str, Set[PilarConnection]] = {}
+        # Utrzymanie puli w tle: keep-alive, wymiana zepsutych połączeń, uzupełnianie. Klucz: "IP:PORT"
+        self._maintenance_tasks: Dict[str, asyncio.Task] = {}
+        self._refill_tasks: Dict[str, asyncio.Task] = {}
+
+        # Subskrypcje zdarzeń. Klucz: "IP:PORT", Wartość: {komenda Pilara: [(component, variable, callback)]}
+        self._event_listeners: Dict[str, Dict[str, List[Tuple['Component', str, Callable]]]] = {}
+        # Trwające dostarczenia zdarzeń - referencje chronią zadania przed usunięciem przez GC
+        self._delivery_tasks: Set[asyncio.Task] = set()
+
+        if self._multiplexed:
+            logger.info(f'Pilar advanced connector created in multiplexed mode: {self._mux_connection_count} '
+                        f'connections, up to {self._mux_max_in_flight} commands in flight each')
+        else:
+            logger.info(f'Pilar advanced connector created with pool size: {self._pool_size}')
+
+    def _is_connected(self, address: str) -> bool:
+        return address in self._connection_pools or address in self._mux_connections
 
     def _is_outage(self, address: str) -> bool:
         """True while the breaker is open for this address (don't spam per-request logs)."""
@@ -135,6 +300,27 @@ class PilarConnector(Connector):
             except confuse.NotFoundError:
                 self._focuser_multiplier = 1000.0  # Wartość domyślna w razie braku wpisu w configu
                 logger.warning("No settings.focuser.multiplier in configuration. Use default value: 1000.0")
+
+            try:
+                mux_cfg = config['settings']['multiplexing'].get(dict) or {}
+            except confuse.NotFoundError:
+                mux_cfg = {}
+            self._multiplexed = bool(mux_cfg.get('enabled', False))
+            self._mux_connection_count = int(mux_cfg.get('connections', 2))
+            self._mux_max_in_flight = int(mux_cfg.get('max_in_flight', 32))
+
+            try:
+                keepalive_cfg = config['settings']['keepalive'].get(dict) or {}
+            except confuse.NotFoundError:
+                keepalive_cfg = {}
+            self._keepalive = {
+                "enabled": bool(keepalive_cfg.get('enabled', True)),
+                "interval": float(keepalive_cfg.get('interval', 10.0)),
+                "idle": float(keepalive_cfg.get('idle', 30.0)),
+                "max_idle": float(keepalive_cfg.get('max_idle', 0) or 0),
+                "command": str(keepalive_cfg.get('command', 'GET MOTORS.STATUS')),
+                "timeout": float(keepalive_cfg.get('timeout', 5.0)),
+            }
             
             self._resource_lock_map = config['resource_locks'].get(dict)
             self._command_map = {}
@@ -181,7 +367,7 @@ class PilarConnector(Connector):
         Jeśli nie - tworzy 'pool_size' RÓWNOLEGŁYCH połączeń do tego adresu.
         """
         # Szybkie sprawdzenie bez blokady
-        if address in self._connection_pools:
+        if self._is_connected(address):
             return True
 
         # Circuit breaker: don't even try if we recently failed
@@ -194,7 +380,7 @@ class PilarConnector(Connector):
 
         async with self._connection_locks[address]:
             # Ponowne sprawdzenie pod blokadą (double-check locking pattern)
-            if address in self._connection_pools:
+            if self._is_connected(address):
                 return True
             loop_time = asyncio.get_event_loop().time()
             if loop_time < self._reconnect_suppressed_until.get(address, 0.0):
@@ -207,9 +393,10 @@ class PilarConnector(Connector):
                 logger.error(f"Invalid Pilar address format: {address}. Expected host:port")
                 raise AddressError(address, 1003, "Invalid address format")
 
+            pool_size = self._mux_connection_count if self._multiplexed else self._pool_size
             # ID pool persists across reconnect tries — only build it once
             if address not in self._id_pools:
-                logger.info(f"Initializing connection pool for {address} (Size: {self._pool_size})...")
+                logger.info(f"Initializing connection pool for {address} (Size: {pool_size})...")
                 # 1. Przygotowanie puli ID
                 id_pool = asyncio.Queue()
                 for i in range(self._id_range[0], self._id_range[1] + 1):
@@ -217,19 +404,26 @@ class PilarConnector(Connector):
                 self._id_pools[address] = id_pool
 
             # 2. Nawiązywanie wielu połączeń równolegle
-            creation_tasks = [self._create_single_connection(host, port) for _ in range(self._pool_size)]
+            creation_tasks = [self._create_single_connection(host, port) for _ in range(pool_size)]
             connections = await asyncio.gather(*creation_tasks)
-            
-            # 3. Wrzucanie udanych połączeń do kolejki
-            conn_pool = asyncio.Queue()
-            active_count = 0
-            for conn in connections:
-                if conn:
-                    conn_pool.put_nowait(conn)
-                    active_count += 1
+            connections = [conn for conn in connections if conn]
+            active_count = len(connections)
 
             if active_count > 0:
-                self._connection_pools[address] = conn_pool
+                if self._multiplexed:
+                    # 3. Każde połączenie dostaje własny czytnik, komendy są rozdzielane round-robin
+                    for conn in connections:
+                        self._start_multiplexed(address, conn)
+                    self._mux_connections[address] = connections
+                    self._mux_next[address] = 0
+                else:
+                    # 3. Wrzucanie udanych połączeń do kolejki
+                    conn_pool = asyncio.Queue()
+                    for conn in connections:
+                        conn_pool.put_nowait(conn)
+                    self._connection_pools[address] = conn_pool
+                    self._pool_members[address] = set(connections)
+                self._start_maintenance(address)
                 if self._outage_logged.pop(address, False):
                     logger.warning(
                         f"Pilar at {address} reconnected. Active connections: {active_count}"
@@ -245,7 +439,7 @@ class PilarConnector(Connector):
             self._reconnect_suppressed_until[address] = loop_time + self._RECONNECT_COOLDOWN
             if not self._outage_logged.get(address, False):
                 logger.error(
-                    f"Pilar at {address} unreachable (0/{self._pool_size} connections established); "
+                    f"Pilar at {address} unreachable (0/{pool_size} connections established); "
                     f"suppressing further attempts and per-request errors for "
                     f"{self._RECONNECT_COOLDOWN:.0f}s."
                 )
@@ -275,27 +469,260 @@ class PilarConnector(Connector):
 
     async def _return_connection_resources(self, address, conn, cmd_id):
         """Zwraca zasoby do puli po zakończeniu komendy.
-        Zepsute połączenia (broken pipe, reset) są zamykane i zastępowane świeżymi,
-        żeby pula sama się leczyła po restartcie Pilara / idle-timeoucie sieci.
+        Zepsute połączenia (broken pipe, reset) są zamykane, a pula jest uzupełniana w tle
+        (``_refill``), żeby komenda nie czekała na TCP+TLS nowego połączenia.
         """
         if address not in self._connection_pools:
+            # pula zamknięta w trakcie komendy (rozłączenie), pula ID przetrwa ponowne połączenie - ID musi wrócić
+            id_pool = self._id_pools.get(address)
+            if id_pool is not None:
+                id_pool.put_nowait(cmd_id)
             return
         if conn.broken:
-            try:
-                conn.writer.close()
-            except Exception:
-                pass
-            try:
-                host, port_str = address.split(':')
-                replacement = await self._create_single_connection(host, int(port_str))
-            except Exception:
-                replacement = None
-            if replacement is not None:
-                await self._connection_pools[address].put(replacement)
+            self._discard_connection(address, conn)
+            self._schedule_refill(address)
         else:
             await self._connection_pools[address].put(conn)
         await self._id_pools[address].put(cmd_id)
 
+    def _start_multiplexed(self, address: str, conn: PilarConnection):
+        conn.event_handler = functools.partial(self._on_event_line, address)
+        conn.start_multiplexing(self._mux_max_in_flight)
+
+    def _on_event_line(self, address: str, line: str):
+        """Rozsyła wartości ze zdarzeń 'EVENT <poziom> <KOMENDA>=<wartość>' do subskrybentów tej komendy."""
+        listeners = self._event_listeners.get(address)
+        if not listeners or "=" not in line:
+            return
+        key_part, value_str = line.split("=", 1)
+        pilar_cmd = key_part.rsplit(" ", 1)[-1].strip()
+        subscribers = listeners.get(pilar_cmd)
+        if not subscribers:
+            return
+        value = _parse_value(value_str.strip())
+        ts = time.time()
+        for component, variable, callback in list(subscribers):
+            result = self._convert_get_result(component, variable, value)
+            task = asyncio.create_task(deliver(callback, component, variable, result, ts))
+            self._delivery_tasks.add(task)
+            task.add_done_callback(self._delivery_tasks.discard)
+
+    async def _get_multiplexed_resources(self, address) -> Tuple[PilarConnection, int]:
+        """Wybiera połączenie round-robin (pomijając zepsute) i wolny ID z puli."""
+        connected = await self._ensure_connected(address)
+        if not connected:
+            raise ConnectionError(f"Pilar at {address} not reachable")
+        connections = self._mux_connections.get(address)
+        if not connections:
+            raise ConnectionError(f"Pilar at {address} not reachable")
+        try:
+            cmd_id = await asyncio.wait_for(self._id_pools[address].get(), timeout=self._timeouts['pool_get'])
+        except (KeyError, asyncio.TimeoutError):
+            raise TimeoutError(f"No available ID in the pool for {address}.")
+        start = self._mux_next.get(address, 0)
+        for i in range(len(connections)):
+            conn = connections[(start + i) % len(connections)]
+            if not conn.broken:
+                self._mux_next[address] = (start + i + 1) % len(connections)
+                return conn, cmd_id
+        self._id_pools[address].put_nowait(cmd_id)
+        raise ConnectionError(f"Pilar at {address}: all connections are broken")
+
+    async def _return_multiplexed_resources(self, address, conn: PilarConnection, cmd_id: int):
+        """Zwraca ID do puli. Zepsute połączenie jest usuwane, a pula uzupełniana w tle.
+
+        The ID pool is a FIFO, a returned ID is reused only after all other IDs, so a late response of a timed out
+        command can not be taken for the response of a new one.
+        """
+        self._id_pools[address].put_nowait(cmd_id)
+        if conn.broken:
+            self._discard_connection(address, conn)
+            self._schedule_refill(address)
+
+    # ------------------------------------------------------------------ pool maintenance
+
+    def _pool_target_size(self) -> int:
+        return self._mux_connection_count if self._multiplexed else self._pool_size
+
+    def _live_connections(self, address: str) -> List[PilarConnection]:
+        if self._multiplexed:
+            return list(self._mux_connections.get(address, ()))
+        return list(self._pool_members.get(address, ()))
+
+    def pool_stats(self) -> Dict[str, dict]:
+        """Connections of every Pilar server: 'size' live connections, 'in_use' lent to (or busy with) commands."""
+        stats = {}
+        for address in set(self._pool_members) | set(self._mux_connections):
+            connections = self._live_connections(address)
+            if self._multiplexed:
+                in_use = sum(1 for c in connections if c.in_flight)
+            else:
+                pool = self._connection_pools.get(address)
+                in_use = max(0, len(connections) - (pool.qsize() if pool is not None else 0))
+            stats[address] = {'size': len(connections), 'target': self._pool_target_size(), 'in_use': in_use}
+        return stats
+
+    def _discard_connection(self, address: str, conn: PilarConnection):
+        """Zamyka połączenie i usuwa je z puli (nie z kolejki wolnych - tam trafiają tylko zdrowe)."""
+        if self._multiplexed:
+            connections = self._mux_connections.get(address)
+            if connections is not None and conn in connections:
+                connections.remove(conn)
+        else:
+            self._pool_members.get(address, set()).discard(conn)
+        conn.close()
+
+    def _add_connection(self, address: str, conn: PilarConnection):
+        if self._multiplexed:
+            self._start_multiplexed(address, conn)
+            self._mux_connections[address].append(conn)
+        else:
+            self._pool_members[address].add(conn)
+            self._connection_pools[address].put_nowait(conn)
+
+    def _schedule_refill(self, address: str):
+        task = self._refill_tasks.get(address)
+        if task is None or task.done():
+            self._refill_tasks[address] = asyncio.create_task(self._refill(address))
+
+    async def _refill(self, address: str):
+        """Uzupełnia pulę do docelowego rozmiaru poza ścieżką zapytań."""
+        if not self._is_connected(address):
+            return
+        missing = self._pool_target_size() - len(self._live_connections(address))
+        if missing > 0:
+            host, port_str = address.split(':')
+            created = await asyncio.gather(*(self._create_single_connection(host, int(port_str))
+                                             for _ in range(missing)))
+            if not self._is_connected(address):  # pool dropped meanwhile
+                for conn in created:
+                    if conn is not None:
+                        conn.close()
+                return
+            for conn in created:
+                if conn is not None:
+                    self._add_connection(address, conn)
+            logger.debug(f"Pilar pool {address} refilled with {sum(c is not None for c in created)}/{missing} "
+                         f"connections")
+        if not self._live_connections(address):
+            # nothing left, the next request goes through _ensure_connected and its breaker
+            logger.warning(f"Pilar at {address}: all pooled connections lost")
+            self._drop_pool(address)
+
+    def _drop_pool(self, address: str):
+        self._connection_pools.pop(address, None)
+        for conn in self._pool_members.pop(address, set()):
+            conn.close()
+        for conn in self._mux_connections.pop(address, []):
+            conn.close()
+        task = self._maintenance_tasks.pop(address, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    def _start_maintenance(self, address: str):
+        if not self._keepalive['enabled']:
+            return
+        task = self._maintenance_tasks.get(address)
+        if task is None or task.done():
+            self._maintenance_tasks[address] = asyncio.create_task(self._maintenance_loop(address))
+
+    async def _maintenance_loop(self, address: str):
+        interval = self._keepalive['interval']
+        while self._is_connected(address):
+            await asyncio.sleep(interval)
+            try:
+                await self._maintain_pool(address)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Pilar pool maintenance for {address} failed: {e!r}")
+
+    async def _maintain_pool(self, address: str):
+        """Jeden przebieg utrzymania: usuwa zepsute i zbyt długo bezczynne połączenia, sonduje bezczynne
+        komendą keep-alive, a na końcu uzupełnia pulę."""
+        idle = self._keepalive['idle']
+        max_idle = self._keepalive['max_idle']
+        if self._multiplexed:
+            probes = []
+            for conn in [c for c in self._live_connections(address) if c.in_flight == 0]:
+                if conn.broken or (max_idle and conn.idle_for > max_idle):
+                    self._discard_connection(address, conn)
+                elif conn.idle_for > idle:
+                    probes.append(self._probe(address, conn))
+            await asyncio.gather(*probes)
+        else:
+            # only connections waiting in the queue are idle; they are taken out one at a time and each one goes back
+            # right after its probe, so a request arriving meanwhile gets one of the others without waiting
+            conn_pool = self._connection_pools.get(address)
+            for _ in range(conn_pool.qsize() if conn_pool is not None else 0):
+                if self._connection_pools.get(address) is not conn_pool or conn_pool.empty():
+                    break
+                conn = conn_pool.get_nowait()
+                if conn.broken or (max_idle and conn.idle_for > max_idle):
+                    self._discard_connection(address, conn)
+                elif conn.idle_for > idle:
+                    await self._probe(address, conn)
+                else:
+                    conn_pool.put_nowait(conn)
+        self._schedule_refill(address)
+
+    async def _probe(self, address: str, conn: PilarConnection):
+        """Wysyła komendę keep-alive. Błąd komendy zgłoszony przez serwer też oznacza żywe połączenie."""
+        id_pool = self._id_pools.get(address)
+        try:
+            cmd_id = id_pool.get_nowait()
+        except (AttributeError, asyncio.QueueEmpty):
+            cmd_id = None
+        if cmd_id is not None:
+            try:
+                if conn.multiplexed:
+                    await conn.submit(cmd_id, self._keepalive['command'], timeout=self._keepalive['timeout'])
+                else:
+                    await conn.execute(cmd_id, self._keepalive['command'], timeout=self._keepalive['timeout'])
+            except RuntimeError:
+                pass
+            except _TEMPORARY_IO_ERRORS as e:
+                conn.broken = True
+                logger.info(f"Pilar keep-alive to {address} failed ({e!r}), connection will be replaced")
+            finally:
+                id_pool.put_nowait(cmd_id)
+        if conn.broken:
+            self._discard_connection(address, conn)
+        elif not self._multiplexed and address in self._connection_pools:
+            self._connection_pools[address].put_nowait(conn)
+
+    async def close(self):
+        """Zatrzymuje utrzymanie pul i zamyka wszystkie połączenia."""
+        for task in [*self._maintenance_tasks.values(), *self._refill_tasks.values(), *self._delivery_tasks]:
+            task.cancel()
+        self._maintenance_tasks.clear()
+        self._refill_tasks.clear()
+        self._delivery_tasks.clear()
+        for address in list(self._connection_pools) + list(self._mux_connections):
+            self._drop_pool(address)
+
+    async def _execute(self, address: str, command: str, timeout: float):
+        """Wykonuje komendę na wolnym połączeniu z puli lub (w trybie multipleksowanym) na współdzielonym."""
+        if self._multiplexed:
+            conn, cmd_id = await self._get_multiplexed_resources(address)
+            try:
+                return await conn.submit(cmd_id, command, timeout=timeout)
+            finally:
+                await self._return_multiplexed_resources(address, conn, cmd_id)
+        conn, cmd_id = await self._get_connection_resources(address)
+        try:
+            return await conn.execute(cmd_id, command, timeout=timeout)
+        finally:
+            await self._return_connection_resources(address, conn, cmd_id)
+
+    def _convert_get_result(self, component: 'Component', variable: str, result):
+        if component.kind == 'focuser' and variable == 'position':
+            if isinstance(result, (int, float)):
+                # Używamy round() przed int(), aby uniknąć błędów precyzji float
+                # np. 25.123 * 1000 = 25122.9999999 -> bez round wyszłoby 25122
+                result = int(round(result * self._focuser_multiplier))
+        return result
+
     async def _get_address(self, component):
         return component.get_option_recursive('address')
 
@@ -317,18 +744,8 @@ class PilarConnector(Connector):
             command = f"GET {pilar_cmd}"
 
             # Pobierz zasoby (to tu następuje zrównoleglenie - różne wątki dostają różne conn)
-            conn, cmd_id = await self._get_connection_resources(address)
-            try:
-                result = await conn.execute(cmd_id, command, timeout=self._timeouts['get'])
-                if component.kind == 'focuser' and variable == 'position':
-                    if isinstance(result, (int, float)):
-                        # Używamy round() przed int(), aby uniknąć błędów precyzji float
-                        # np. 25.123 * 1000 = 25122.9999999 -> bez round wyszłoby 25122
-                        result = int(round(result * self._focuser_multiplier))
-
-                return result
-            finally:
-                await self._return_connection_resources(address, conn, cmd_id)
+            result = await self._execute(address, command, timeout=self._timeouts['get'])
+            return self._convert_get_result(component, variable, result)
         except _TEMPORARY_IO_ERRORS as e:
             if not self._is_outage(address):
                 logger.warning(f"Pilar not responding at {address} ({component.kind}.{variable}): {e}")
@@ -374,11 +791,7 @@ class PilarConnector(Connector):
             lock = self._resource_locks.get(resource_name) if resource_name else None
             
             async def _do_put():
-                conn, cmd_id = await self._get_connection_resources(address)
-                try:
-                    await conn.execute(cmd_id, command, timeout=self._timeouts['set'])
-                finally:
-                    await self._return_connection_resources(address, conn, cmd_id)
+                await self._execute(address, command, timeout=self._timeouts['set'])
 
             # If the command requires exclusive access (e.g. telescope slew), use a logical lock.
             # Other commands (e.g. lamp on) can run in parallel.
@@ -479,6 +892,28 @@ class PilarConnector(Connector):
         # --- ZMIANA: Zwracamy None, aby poinformować OcaBox o pełnym sukcesie bez ładunku "Value", tak jak to robi Alpaca ---
         return None
 
-    async def subscribe(self, variables: Iterable[Tuple[str, str]], callback: Callable):
-        logger.warning("Pilar protocol does not support subscriptions.")
-        pass
+    async def subscribe(self, variables: Iterable[Tuple['Component', str]], callback: Callable,
+                        period: float = DEFAULT_POLL_PERIOD, **kwargs) -> Unsubscribe:
+        """
+        Variables are polled every period seconds. In multiplexed mode values announced by the server in 'EVENT'
+        lines are additionally delivered as soon as the reader gets them.
+        """
+        variables = list(variables)
+        unsubscribes = []
+        if self._multiplexed:
+            for component, variable in variables:
+                address = await self._get_address(component)
+                pilar_cmd = self._command_map.get(component.kind, {}).get(variable)
+                if not address or not pilar_cmd:
+                    continue
+                subscribers = self._event_listeners.setdefault(address, {}).setdefault(pilar_cmd, [])
+                entry = (component, variable, callback)
+                subscribers.append(entry)
+                unsubscribes.append(functools.partial(self._remove_event_listener, subscribers, entry))
+        unsubscribes.append(await super().subscribe(variables, callback, period=period))
+        return combine_unsubscribes(*unsubscribes)
+
+    @staticmethod
+    def _remove_event_listener(subscribers: list, entry):
+        if entry in subscribers:
+            subscribers.remove(entry)
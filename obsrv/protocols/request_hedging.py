@@ -0,0 +1,140 @@
+"""
+Hedging and retrying of idempotent requests.
+
+A single dropped packet or a slow answer should not cost the client its whole timeout. ``hedged_request`` starts an
+attempt and, when it has not answered within ``hedge_delay`` (the observed p95 latency of the device, see
+:class:`LatencyTracker`), starts a second one and returns whichever answers first; the other is cancelled. An attempt
+failing with a retryable error is retried at once. Every extra attempt is paid from a per-host :class:`RetryBudget`,
+so when a server is overloaded hedging can not multiply its load.
+
+Only for idempotent reads, writes must never be sent twice implicitly.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+
+class LatencyTracker:
+    """
+    Latencies of the last ``window`` successful requests.
+
+    :param window: number of remembered samples
+    :param min_samples: quantiles are not reported below this number of samples
+    """
+
+    def __init__(self, window: int = 100, min_samples: int = 20):
+        self._samples = deque(maxlen=max(1, int(window)))
+        self._min_samples = max(1, int(min_samples))
+
+    def record(self, latency: float):
+        self._samples.append(latency)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Latency quantile (0 < q < 1) or None if there are too few samples yet."""
+        n = len(self._samples)
+        if n < self._min_samples:
+            return None
+        return sorted(self._samples)[min(n - 1, int(q * n))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class RetryBudget:
+    """
+    Token bucket limiting extra attempts of one host. Every original request deposits ``ratio`` tokens and the
+    bucket also refills with ``min_per_second`` tokens per second, every hedge or retry withdraws one token.
+    With the default ratio at most about 10% of requests are sent twice.
+
+    :param ratio: tokens deposited per original request
+    :param min_per_second: tokens added per second regardless of traffic (allows retries of rare requests)
+    :param capacity: maximum number of tokens
+    """
+
+    def __init__(self, ratio: float = 0.1, min_per_second: float = 1.0, capacity: float = 10.0):
+        self.ratio = float(ratio)
+        self.min_per_second = float(min_per_second)
+        self.capacity = float(capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self.spent = 0
+        self.denied = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def deposit(self):
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            self.spent += 1
+            return True
+        self.denied += 1
+        return False
+
+    def describe(self) -> dict:
+        self._refill()
+        return {'tokens': round(self._tokens, 2), 'spent': self.spent, 'denied': self.denied}
+
+
+async def hedged_request(attempt: Callable[[], Awaitable], budget: RetryBudget, hedge_delay: Optional[float] = None,
+                         retryable: Callable[[BaseException], bool] = lambda e: False, max_attempts: int = 2):
+    """
+    Run ``attempt()`` and, paid from the budget, start further attempts when it is slower than ``hedge_delay`` or
+    fails with an error for which ``retryable`` returns True. The first successful result is returned, the remaining
+    attempts are cancelled. When all attempts fail the (preferably non retryable) error is raised.
+
+    :param attempt: factory of one request coroutine
+    :param budget: retry budget of the host
+    :param hedge_delay: seconds after which a second attempt is started, None disables hedging (retries only)
+    :param retryable: predicate telling if an attempt error may be retried
+    :param max_attempts: maximum number of attempts in total
+    :return: result of the first successful attempt
+    """
+    budget.deposit()
+    tasks = {asyncio.ensure_future(attempt())}
+    attempts = 1
+    error: Optional[BaseException] = None
+    fatal: Optional[BaseException] = None
+    try:
+        while tasks:
+            wait_for = hedge_delay if attempts < max_attempts else None
+            done, tasks = await asyncio.wait(tasks, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if budget.try_withdraw():
+                    logger.debug(f"Request slower than {hedge_delay:.3f}s, sending hedged attempt")
+                    tasks.add(asyncio.ensure_future(attempt()))
+                    attempts += 1
+                else:
+                    hedge_delay = None  # no budget, just wait for the running attempt
+                continue
+            done = list(done)
+            errors = [task.exception() for task in done]
+            for task, exc in zip(done, errors):
+                if exc is None:
+                    return task.result()
+            for exc in errors:
+                error = exc
+                if not retryable(exc):
+                    fatal = exc
+                    hedge_delay = None
+            if tasks:
+                continue  # an other attempt may still succeed
+            if fatal is None and attempts < max_attempts and budget.try_withdraw():
+                logger.debug(f"Retrying request after {error!r}")
+                tasks.add(asyncio.ensure_future(attempt()))
+                attempts += 1
+        raise fatal or error
+    finally:
+        for task in tasks:
+            task.cancel()
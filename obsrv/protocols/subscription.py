@@ -0,0 +1,118 @@
+"""Device subscriptions shared by all connectors.
+
+``Connector.subscribe(variables, callback)`` delivers values of device
+variables without a client request. Connectors that receive asynchronous
+events from the device (e.g. Pilar ``EVENT`` lines) push them as they come,
+pull-only connectors use :class:`PollingSubscription`, which reads the
+variables periodically with ``connector.get``. For the tree both look the same:
+
+    unsubscribe = await connector.subscribe([(component, 'rightascension')], callback)
+    ...
+    unsubscribe()
+
+``callback(component, variable, value, ts)`` gets the raw connector value (the
+same as ``connector.get`` returns), it may be sync or async. The returned
+unsubscribe callable is idempotent.
+"""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+SubscriptionCallback = Callable[['Component', str, Any, float], Optional[Awaitable[None]]]
+Unsubscribe = Callable[[], None]
+
+DEFAULT_POLL_PERIOD = 1.0
+
+
+async def deliver(callback: SubscriptionCallback, component, variable: str, value, ts: float):
+    """Call sync or async subscription callback, errors are logged and do not stop the subscription."""
+    try:
+        ret = callback(component, variable, value, ts)
+        if inspect.isawaitable(ret):
+            await ret
+    except Exception as e:
+        logger.error(f'Subscription callback for {getattr(component, "sys_id", component)}.{variable} '
+                     f'raised: {e!r}')
+
+
+class PollingSubscription:
+    """
+    Subscription for connectors without device side events: each variable is read with ``connector.get`` every
+    ``period`` seconds and delivered to the callback when the read succeeds. Failed reads are logged once per
+    outage and retried in the next period.
+
+    :param connector: connector used to read the variables
+    :param variables: pairs (component, variable)
+    :param callback: see module docstring
+    :param period: polling period in seconds
+    :param only_changes: deliver only values different from the previous delivered one
+    """
+
+    def __init__(self, connector, variables: Iterable[Tuple['Component', str]], callback: SubscriptionCallback,
+                 period: float = DEFAULT_POLL_PERIOD, only_changes: bool = False):
+        self._connector = connector
+        self._variables: List[Tuple['Component', str]] = list(variables)
+        self._callback = callback
+        self._period = max(float(period), 0.01)
+        self._only_changes = only_changes
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> Unsubscribe:
+        if self._task is None and self._variables:
+            self._task = asyncio.create_task(self._run())
+        return self.cancel
+
+    def cancel(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def _run(self):
+        last_values = {}
+        failing = set()
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        while True:
+            results = await asyncio.gather(*(self._connector.get(c, v) for c, v in self._variables),
+                                           return_exceptions=True)
+            ts = time.time()
+            for (component, variable), result in zip(self._variables, results):
+                key = (id(component), variable)
+                if isinstance(result, BaseException):
+                    if isinstance(result, asyncio.CancelledError):
+                        raise result
+                    if key not in failing:
+                        failing.add(key)
+                        logger.warning(f'Polling {component.sys_id}.{variable} failed: {result!r}')
+                    continue
+                failing.discard(key)
+                if self._only_changes and key in last_values and last_values[key] == result:
+                    continue
+                last_values[key] = result
+                await deliver(self._callback, component, variable, result, ts)
+            # fixed rate, but never try to catch up missed periods after a long read
+            next_time = max(next_time + self._period, loop.time())
+            await asyncio.sleep(next_time - loop.time())
+
+
+def combine_unsubscribes(*unsubscribes: Unsubscribe) -> Unsubscribe:
+    """Return one idempotent unsubscribe callable calling all given ones."""
+    done = False
+
+    def unsubscribe():
+        nonlocal done
+        if done:
+            return
+        done = True
+        for u in unsubscribes:
+            u()
+    return unsubscribe
@@ -1,14 +1,51 @@
+import functools
+import inspect
 import logging
+from collections import OrderedDict
 from datetime import datetime
 from typing import Optional, Union, List, MutableMapping, Dict, Coroutine, Callable
 
-from obsrv.protocols import create_connector
+from obcom.data_colection.coded_error import TreeOtherError
+
+from obsrv.protocols import ConnectorRegistry
+from obsrv.protocols.connector_registry import normalize_endpoint
+from obsrv.protocols.subscription import DEFAULT_POLL_PERIOD
+from obsrv.protocols.alpaca.alpaca_imagebytes import ImageBytesArray, IMAGE_ARRAY_VARIABLES, DEFAULT_CHUNK_SIZE
 from obsrv.utils.coordinates import check_equatorial_coordinates, check_horizontal_coordinates
 from obsrv.telescope_devices.standard_components import StandardTelescopeComponents
+from obsrv.telescope_devices.request_queue import RequestQueue, QueueTimeoutError, PRIORITY_GET, PRIORITY_PUT, \
+    host_queue
 from obsrv.ob_config import SingletonConfig
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
+# addresses resolved at runtime (attributes without a custom method or processor) remembered by Observatory.dispatch
+DISPATCH_MEMO_SIZE = 1024
+
+
+class DispatchEntry:
+    """
+    Resolved handling of one device variable for one request type: the device method (custom one or plain connector
+    request) and its parameter and result processors, so a request does not look them up again.
+    """
+    __slots__ = ('device', 'attribute', 'call', 'param_processor', 'result_processor')
+
+    def __init__(self, device: 'Component', attribute: str, call: Callable[..., Coroutine],
+                 param_processor: Optional[Callable] = None, result_processor: Optional[Callable] = None):
+        self.device = device
+        self.attribute = attribute
+        self.call = call
+        self.param_processor = param_processor
+        self.result_processor = result_processor
+
+    async def execute(self, **data):
+        if self.param_processor is not None:
+            data = self.param_processor(self.attribute, **data)
+        ret = await self.call(**data)
+        if self.result_processor is not None:
+            return self.result_processor(self.attribute, ret)
+        return ret
+
 
 class Component:
     """
@@ -22,16 +59,16 @@ class Component:
         self.parent: Component = parent
         self.component_options = {}
         self._connector = None
+        self._connector_shared = False  # acquired from ConnectorRegistry, must be released
         self.children: Dict[str, Component] = {}
 
     def _setup(self, options: dict):
         self.component_options: MutableMapping = options.copy()
-        if not self._connector:
-            try:
-                # Create connector for this component's protocol
-                self._connector = create_connector(self.component_options['protocol'])
-            except KeyError:
-                pass
+        if not self._connector and 'protocol' in self.component_options:
+            # Shared connector for this component's protocol and device host
+            self._connector = ConnectorRegistry().acquire(self.component_options['protocol'],
+                                                          self.get_option_recursive('address'))
+            self._connector_shared = True
         try:
             child_options = self.component_options.pop('components')
         except KeyError:
@@ -42,6 +79,14 @@ class Component:
             setattr(self, cid, child)  # allow easy navigation: `parent.child`
             child._setup(op)
 
+    def release_connectors(self):
+        """Release shared connectors of this component and its children (the last user closes a connector)."""
+        for c in self.children_tree_iter():
+            if c._connector_shared:
+                ConnectorRegistry().release(c._connector)
+                c._connector = None
+                c._connector_shared = False
+
     @property
     def device_nr(self) -> int:
         return int(self.component_options.get('device_number', 0))
@@ -123,6 +168,9 @@ class Observatory(Component):
         self.config = configuration
         self.observatory_configuration_rare = {}
         self.preset: List[str] = ['default']
+        self._dispatch_table: Optional[Dict[tuple, DispatchEntry]] = None
+        self._component_paths: Dict[tuple, Component] = {}
+        self._dispatch_memo: OrderedDict = OrderedDict()
         super().__init__('obs', None)
 
     def connect(self, preset: List[str] or str = 'default', connector=None) -> None:
@@ -148,6 +196,7 @@ class Observatory(Component):
         options = o['observatory'].get()
         self.observatory_configuration_rare = options
         self._setup(options)
+        self.build_dispatch_table()
     
     def add_component(self, sys_id: str, kind: str, **config) -> 'Component':
         """Add a component to the observatory
@@ -164,12 +213,102 @@ class Observatory(Component):
         component._setup(config)
         self.children[sys_id] = component
         setattr(self, sys_id, component)  # Allow direct access like obs.telescope
+        self.invalidate_dispatch()
         return component
     
     def get_all_components(self) -> List['Component']:
         """Get all components in the observatory"""
         return list(self.children.values())
 
+    def build_dispatch_table(self) -> None:
+        """
+        Resolve request handling for the tree once: map every component path (address relative to the observatory,
+        e.g. ('telescope', 'derotator')) to the component and every known variable of devices (custom methods and
+        variables with processors) to its ``DispatchEntry``. Other variables are resolved on first use and kept in a
+        bounded memo.
+        """
+        paths: Dict[tuple, Component] = {(): self}
+
+        def walk(component: Component, path: tuple):
+            for cid, child in component.children.items():
+                paths[path + (cid,)] = child
+                walk(child, path + (cid,))
+        walk(self, ())
+
+        table: Dict[tuple, DispatchEntry] = {}
+        for path, component in paths.items():
+            if isinstance(component, Device):
+                for attribute, request_type in component.known_requests():
+                    table[path + (attribute, request_type)] = component.dispatch_entry(attribute, request_type)
+        self._component_paths = paths
+        self._dispatch_table = table
+        self._dispatch_memo.clear()
+
+    def invalidate_dispatch(self) -> None:
+        """Drop resolved entries after the tree or processors changed, rebuilt on the next request."""
+        self._dispatch_table = None
+        self._dispatch_memo.clear()
+
+    def dispatch(self, address: tuple, request_type: str = 'GET') -> DispatchEntry:
+        """
+        Entry handling the request for the address relative to the observatory, e.g. ('telescope', 'rightascension').
+
+        :raise KeyError: no component at the address
+        """
+        key = address + (request_type,)
+        if self._dispatch_table is None:
+            self.build_dispatch_table()
+        entry = self._dispatch_table.get(key)
+        if entry is not None:
+            return entry
+        entry = self._dispatch_memo.get(key)
+        if entry is not None:
+            self._dispatch_memo.move_to_end(key)
+            return entry
+        component = self._component_paths[address[:-1]]
+        attribute = address[-1]
+        if isinstance(component, Device):
+            entry = component.dispatch_entry(attribute, request_type)
+        elif request_type == 'PUT':
+            entry = DispatchEntry(component, attribute, lambda **data: component.put(attribute, **data))
+        else:
+            entry = DispatchEntry(component, attribute, lambda **data: component.get(attribute, **data))
+        self._dispatch_memo[key] = entry
+        if len(self._dispatch_memo) > DISPATCH_MEMO_SIZE:
+            self._dispatch_memo.popitem(last=False)
+        return entry
+
+    async def subscribe_configured(self, callback: Callable) -> List[Callable[[], None]]:
+        """
+        Subscribe to variables listed in the ``subscribe`` option of devices. Variables of devices sharing a connector
+        and polling period go in one ``Connector.subscribe`` call.
+
+        :param callback: ``callback(path, value, ts)``, path is the address of the variable relative to the
+            observatory (e.g. 'mount.rightascension'), value is already processed like a response to GET
+        :return: list of unsubscribe callables
+        """
+        groups: Dict[tuple, list] = {}
+        for component in self.children_tree_iter():
+            variables = component.component_options.get('subscribe') if isinstance(component, Device) else None
+            if not variables:
+                continue
+            period = float(component.get_option_recursive('subscribe_period') or DEFAULT_POLL_PERIOD)
+            connector = component.connector
+            key = (id(connector), period)
+            groups.setdefault(key, [connector, period, []])[2].extend((component, v) for v in variables)
+
+        def on_value(component: 'Device', variable: str, value, ts: float):
+            path = f"{component.sys_id.split('.', 1)[1]}.{variable}"
+            return callback(path, component._process_alpaca_get_result(variable, value), ts)
+
+        unsubscribes = []
+        for connector, period, pairs in groups.values():
+            try:
+                unsubscribes.append(await connector.subscribe(pairs, on_value, period=period))
+            except Exception as e:
+                logger.error(f"Can not subscribe to {[f'{c.sys_id}.{v}' for c, v in pairs]}: {e!r}")
+        return unsubscribes
+
 
 class Device(Component):
     """Common methods across all devices.
@@ -191,6 +330,8 @@ class Device(Component):
         self._process_data_put = {}
         self._process_response_get = {}
         self._process_response_put = {}
+        self._request_queues: Optional[List[RequestQueue]] = None
+        self._dispatch_entries: Dict[tuple, DispatchEntry] = {}
 
     def _get(self, attribute: str, kind=None, **data) -> Coroutine:
         """Send request and check response for errors.
@@ -200,7 +341,7 @@ class Device(Component):
             **data: Data to send with request.
 
         """
-        return self.connector.get(self, attribute, kind=kind, **data)
+        return self._request(PRIORITY_GET, lambda: self.connector.get(self, attribute, kind=kind, **data))
 
     def _put(self, attribute: str, kind=None, **data) -> Coroutine:
         """
@@ -211,7 +352,45 @@ class Device(Component):
             **data: Data to send with request.
 
         """
-        return self.connector.put(self, attribute, kind=kind, **data)
+        return self._request(PRIORITY_PUT, lambda: self.connector.put(self, attribute, kind=kind, **data))
+
+    def _queues(self) -> List[RequestQueue]:
+        """Queues limiting concurrent requests of this device (options ``max_concurrency`` for the device and
+        ``host_max_concurrency`` for its server), created on first request."""
+        if self._request_queues is None:
+            queues = []
+            limit = self.get_option_recursive('max_concurrency')
+            if limit:
+                queues.append(RequestQueue(self.sys_id, limit))
+            host_limit = self.get_option_recursive('host_max_concurrency')
+            host = normalize_endpoint(self.get_option_recursive('address'))
+            if host_limit and host:
+                queues.append(host_queue(host, host_limit))
+            self._request_queues = queues
+        return self._request_queues
+
+    def _request(self, priority: int, request: Callable[[], Coroutine]) -> Coroutine:
+        queues = self._queues()
+        if not queues:
+            return request()
+        return self._queued_request(queues, priority, request)
+
+    async def _queued_request(self, queues: List[RequestQueue], priority: int, request: Callable[[], Coroutine]):
+        timeout = self.get_option_recursive('queue_timeout')
+        acquired = []
+        try:
+            # always device queue first, then the server one
+            for queue in queues:
+                await queue.acquire(priority, timeout=timeout)
+                acquired.append(queue)
+            return await request()
+        except QueueTimeoutError as e:
+            logger.warning(str(e))
+            raise TreeOtherError(address=None, code=4008, message=f"Device {self.sys_id} is busy, {e}",
+                                 severity=TreeOtherError.SEVERITY_TEMPORARY)
+        finally:
+            for queue in reversed(acquired):
+                queue.release()
 
     def _find_attribute(self, attribute):
         try:
@@ -222,15 +401,61 @@ class Device(Component):
 
     def add_alpaca_get_parameters_process(self, attribute: str, processor: Callable):
         self._process_data_get[attribute] = processor
+        self._invalidate_dispatch()
 
     def add_alpaca_put_parameters_process(self, attribute: str, processor: Callable):
         self._process_data_put[attribute] = processor
+        self._invalidate_dispatch()
 
     def add_alpaca_get_response_process(self, attribute: str, processor: Callable):
         self._process_response_get[attribute] = processor
+        self._invalidate_dispatch()
 
     def add_alpaca_put_response_process(self, attribute: str, processor: Callable):
         self._process_response_put[attribute] = processor
+        self._invalidate_dispatch()
+
+    def _invalidate_dispatch(self):
+        self._dispatch_entries.clear()
+        root = self.root
+        if isinstance(root, Observatory):
+            root.invalidate_dispatch()
+
+    def known_requests(self) -> List[tuple]:
+        """(attribute, request type) pairs with a custom method or a processor, resolved ahead in the dispatch
+        table."""
+        known = set()
+        for name in dir(type(self)):
+            if name.startswith('_') or name in ('get', 'put'):
+                continue
+            if inspect.iscoroutinefunction(getattr(type(self), name, None)):
+                known.add((name[:-len('_put')], 'PUT') if name.endswith('_put') else (name, 'GET'))
+        known.update((a, 'GET') for a in self._process_data_get)
+        known.update((a, 'GET') for a in self._process_response_get)
+        known.update((a, 'PUT') for a in self._process_data_put)
+        known.update((a, 'PUT') for a in self._process_response_put)
+        return sorted(known)
+
+    def dispatch_entry(self, attribute: str, request_type: str = 'GET', kind=None) -> DispatchEntry:
+        """Resolve handling of the attribute: custom method (``attribute`` for GET, ``attribute_put`` for PUT) or
+        plain connector request, and processors."""
+        key = (attribute, request_type)
+        entry = self._dispatch_entries.get(key) if kind is None else None
+        if entry is not None:
+            return entry
+        if request_type == 'PUT':
+            method = self._find_attribute(attribute + '_put')
+            call = method if method and callable(method) else functools.partial(self._put, attribute, kind=kind)
+            entry = DispatchEntry(self, attribute, call, self._process_data_put.get(attribute),
+                                  self._process_response_put.get(attribute))
+        else:
+            method = self._find_attribute(attribute)
+            call = method if method and callable(method) else functools.partial(self._get, attribute, kind=kind)
+            entry = DispatchEntry(self, attribute, call, self._process_data_get.get(attribute),
+                                  self._process_response_get.get(attribute))
+        if kind is None and len(self._dispatch_entries) < DISPATCH_MEMO_SIZE:
+            self._dispatch_entries[key] = entry
+        return entry
 
     def _process_alpaca_get_parameters(self, attribute: str, **data):
         processor = self._process_data_get.get(attribute)
@@ -261,22 +486,10 @@ class Device(Component):
             return ret
 
     async def get(self, attribute: str, kind=None, **data):
-        params = self._process_alpaca_get_parameters(attribute, **data)
-        method = self._find_attribute(attribute)
-        if method and callable(method):
-            ret = await method(**params)
-        else:
-            ret = await self._get(attribute, kind=kind, **params)
-        return self._process_alpaca_get_result(attribute, ret)
+        return await self.dispatch_entry(attribute, 'GET', kind=kind).execute(**data)
 
     async def put(self, attribute: str, kind=None, **data):
-        params = self._process_alpaca_put_parameters(attribute, **data)
-        method = self._find_attribute(attribute+'_put')
-        if method and callable(method):
-            ret = await method(**params)
-        else:
-            ret = await self._put(attribute, kind=kind, **params)
-        return self._process_alpaca_put_result(attribute, ret)
+        return await self.dispatch_entry(attribute, 'PUT', kind=kind).execute(**data)
 
     # async def get(self, attribute: str, **data):
     #     method = self._find_attribute(attribute)
@@ -328,6 +541,17 @@ class Camera(Device):
     """Camera specific methods."""
     KIND = StandardTelescopeComponents.CAMERA
 
+    def __init__(self, sys_id: str, parent: Union['Component', None]) -> None:
+        super().__init__(sys_id=sys_id, parent=parent)
+        for attribute in IMAGE_ARRAY_VARIABLES:
+            self.add_alpaca_get_response_process(attribute, lambda at, res: self._image_array_processor(at, res))
+
+    def _image_array_processor(self, attribute, res):
+        # binary frames are delivered as metadata + list of binary chunks, JSON arrays are passed unchanged
+        if isinstance(res, ImageBytesArray):
+            return res.to_value(chunk_size=int(self.get_option_recursive('image_chunk_size') or DEFAULT_CHUNK_SIZE))
+        return res
+
 
 class FilterWheel(Device):
     """Filter wheel specific methods."""
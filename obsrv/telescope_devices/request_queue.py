@@ -0,0 +1,135 @@
+"""
+Concurrency limits of device requests.
+
+Many ASCOM drivers serialize requests internally or misbehave when called concurrently, a burst of GETs for one
+camera then times out all together. A :class:`RequestQueue` lets at most ``limit`` requests run at once and queues
+the rest ordered by priority (PUTs before GETs) and FIFO within a priority. A queued request whose caller gave up
+(cancelled, e.g. by the router timeout) leaves the queue and is never sent; with ``timeout`` a request waiting longer
+raises :class:`QueueTimeoutError` instead of being sent to a device which would not answer in time anyway.
+
+Devices get queues from the ``max_concurrency`` (per device) and ``host_max_concurrency`` (per device server)
+component options, see ``Device._request``.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import weakref
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+PRIORITY_PUT = 0
+PRIORITY_GET = 1
+
+# all live queues, for statistics
+_queues: 'weakref.WeakSet[RequestQueue]' = weakref.WeakSet()
+# queues shared by devices on one server, keyed by endpoint
+_host_queues: Dict[str, 'RequestQueue'] = {}
+
+
+class QueueTimeoutError(asyncio.TimeoutError):
+    """Request waited in the queue longer than the queue timeout and was not sent."""
+
+
+class RequestQueue:
+    """
+    Priority ordered semaphore with statistics.
+
+    :param name: name of the queue in logs and statistics (device sys_id or server endpoint)
+    :param limit: maximum number of requests running at once
+    """
+
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self._active = 0
+        self._waiters: List[list] = []  # heap of [priority, seq, future]
+        self._seq = itertools.count()
+        self.total = 0
+        self.queued_total = 0
+        self.timeouts = 0
+        self.max_depth = 0
+        self.wait_time_total = 0.0
+        self.max_wait_time = 0.0
+        _queues.add(self)
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def depth(self) -> int:
+        """Number of requests waiting in the queue."""
+        return sum(1 for w in self._waiters if not w[2].done())
+
+    async def acquire(self, priority: int = PRIORITY_GET, timeout: Optional[float] = None):
+        """
+        Wait for a free slot.
+
+        :param priority: lower runs first (``PRIORITY_PUT`` < ``PRIORITY_GET``)
+        :param timeout: maximum wait in the queue in seconds, None waits until cancelled
+        :raise QueueTimeoutError: no slot within timeout
+        """
+        self.total += 1
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self._waiters, [priority, next(self._seq), future])
+        self.queued_total += 1
+        self.max_depth = max(self.max_depth, len(self._waiters))
+        start = loop.time()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # the slot was handed over just when the caller gave up, pass it on
+                self.release()
+            else:
+                future.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                self.timeouts += 1
+                raise QueueTimeoutError(f"Request waited {timeout}s in queue of {self.name} "
+                                        f"({self._active} running, {self.depth} queued)") from None
+            raise
+        finally:
+            waited = loop.time() - start
+            self.wait_time_total += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+    def release(self):
+        """Free the slot, it goes to the first waiting request (the slot count does not change then)."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self) -> dict:
+        return {
+            'limit': self.limit,
+            'active': self._active,
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'total': self.total,
+            'queued_total': self.queued_total,
+            'timeouts': self.timeouts,
+            'avg_wait_time': self.wait_time_total / self.queued_total if self.queued_total else 0.0,
+            'max_wait_time': self.max_wait_time,
+        }
+
+
+def host_queue(host: str, limit: int) -> RequestQueue:
+    """Queue shared by all devices of the server, created with the limit of the first device asking for it."""
+    queue = _host_queues.get(host)
+    if queue is None:
+        queue = _host_queues[host] = RequestQueue(host, limit)
+    return queue
+
+
+def queue_stats() -> Dict[str, dict]:
+    """Statistics of all live queues keyed by queue name, exported to diagnostics."""
+    return {q.name: q.stats() for q in list(_queues)}
@@ -5,6 +5,8 @@ from typing import Protocol, runtime_checkable, List, Tuple, Optional
 
 from obsrv.communication.internal_client_api import InternalClientAPI
 from obsrv.tree_components.base_components.address_dispatcher import AddressedProtocol
+from obsrv.utils.tracing import traced
+from obsrv.utils.executors import Executors
 from obsrv.utils.tree_data import TreeData
 from obcom.data_colection.value_call import ValueRequest, ValueResponse
 from obsrv.ob_config import SingletonConfig
@@ -26,6 +28,12 @@ class TreeComponent(ABC):
     COMPONENT_DEFAULT_NAME: str = 'TreeComponent'
     _SUFFIX = "_RESOURCE"
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every implementation of get_response records a span of the component when the request is traced
+        if 'get_response' in cls.__dict__:
+            cls.get_response = traced(cls.__dict__['get_response'])
+
     def __init__(self, component_name: str, **kwargs):
         super().__init__(**kwargs)
         self._component_name: str = component_name  # this is name of tree component, used for debug and errors
@@ -55,6 +63,17 @@ class TreeComponent(ABC):
         if self._tree_data:
             return self._tree_data.nats_messenger
 
+    @property
+    def large_values(self):
+        if self._tree_data:
+            return self._tree_data.large_values
+
+    @property
+    def executors(self) -> Executors:
+        if self._tree_data:
+            return self._tree_data.executors
+        return Executors()
+
     @property
     def api(self):
         if self._api is None:
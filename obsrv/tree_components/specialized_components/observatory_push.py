@@ -0,0 +1,44 @@
+"""
+Push of device subscriptions from an ``Observatory`` provider to the cache above it.
+"""
+from typing import Optional, Callable, Awaitable, List
+
+from obcom.data_colection.value import Value
+
+
+class ObservatoryPushMixin:
+    """
+    Mixin of tree providers wrapping an ``Observatory`` (``self._observatory``): subscribes the variables configured
+    with the component option ``subscribe`` on run, pushes their values to the sink and releases the connectors on
+    stop. Put it before the provider base class.
+    """
+
+    def __init__(self, **kwargs):
+        self._push_sink: Optional[Callable[[str, Value], Awaitable[None]]] = None
+        self._push_address_prefix: str = ''
+        self._unsubscribes: List[Callable[[], None]] = []
+        super().__init__(**kwargs)
+
+    def set_push_sink(self, sink: Callable[[str, Value], Awaitable[None]], address_prefix: str) -> None:
+        """Wire where values of device subscriptions (component option ``subscribe``) go, typically
+        ``cache.ingest_pushed_value`` of the cache above this provider. ``address_prefix`` is the part of the client
+        address before this provider (e.g. 'sim')."""
+        self._push_sink = sink
+        self._push_address_prefix = address_prefix
+
+    async def _on_pushed_value(self, path: str, value, ts: float):
+        await self._push_sink(f'{self._push_address_prefix}.{path}', Value(value, ts))
+
+    async def run(self):
+        """Run the tree component."""
+        await super().run()
+        if self._push_sink is not None:
+            self._unsubscribes = await self._observatory.subscribe_configured(self._on_pushed_value)
+
+    async def stop(self):
+        """Stop the tree component."""
+        for unsubscribe in self._unsubscribes:
+            unsubscribe()
+        self._unsubscribes = []
+        self._observatory.release_connectors()
+        await super().stop()
@@ -3,7 +3,6 @@ TreeAlpacaObservatory - Tree adapter for universal Observatory class.
 This maintains backward compatibility while using the simplified universal architecture.
 """
 import logging
-import time
 from typing import Optional
 
 from obcom.data_colection.address import AddressError
@@ -12,14 +11,16 @@ from obcom.data_colection.value import Value, TreeValueError
 from obcom.data_colection.value_call import ValueRequest
 
 from obsrv.tree_components.base_components.tree_base_provider import TreeBaseProvider
+from obsrv.tree_components.specialized_components.observatory_push import ObservatoryPushMixin
 from obsrv.tree_components.specialized_components.tree_conditional_freezer import strip_tree_internal_fields
 from obsrv.telescope_devices.device_tree import Observatory
 from obsrv.utils.asyncio_util_functions import wait_for_psce
+from obsrv.utils.clock import get_clock
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
 
-class TreeAlpacaObservatory(TreeBaseProvider):
+class TreeAlpacaObservatory(ObservatoryPushMixin, TreeBaseProvider):
     """
     Tree adapter for universal Observatory class.
     This is a simplified version that wraps the universal Observatory
@@ -57,19 +58,11 @@ class TreeAlpacaObservatory(TreeBaseProvider):
             # Create a minimal observatory for testing/demo purposes
             self._observatory.observatory_configuration_rare = {"protocol": "alpaca"}
     
-    async def run(self):
-        """Run the tree component."""
-        await super().run()
-    
-    async def stop(self):
-        """Stop the tree component."""
-        await super().stop()
-    
     async def get_value(self, request: ValueRequest, **kwargs) -> Value or None:
         """Get value by routing request to the appropriate observatory component."""
         address = request.address
         index = request.index
-        alpaca_address = address[index:].copy()
+        alpaca_address = tuple(address[index:])
         request_type = request.request_type
         request_arguments = strip_tree_internal_fields(request.request_data)
         request_timeout = request.request_timeout
@@ -78,27 +71,15 @@ class TreeAlpacaObservatory(TreeBaseProvider):
             logger.debug(f"Incoming address to the {self._component_name} module is too short. Address: {address}")
             raise AddressError(address=address, code=1001, message="Incoming address is too short")
 
-        # Find the target component
         try:
-            component = self._observatory
-            for addr_part in alpaca_address[:-1]:
-                component = component.children[addr_part]
-            
-            method_name = alpaca_address[-1]
-            
-            # Execute GET or PUT on the component
-            if request_type == 'PUT':
-                result = await wait_for_psce(
-                    component.put(method_name, **request_arguments),
-                    timeout=(request_timeout - time.time()) * self._timeout_multiplier
-                )
-            else:
-                result = await wait_for_psce(
-                    component.get(method_name, **request_arguments),
-                    timeout=(request_timeout - time.time()) * self._timeout_multiplier
-                )
-            
-            return Value(result, time.time())
+            # resolved handler of the device variable (dispatch table of the observatory)
+            entry = self._observatory.dispatch(alpaca_address, 'PUT' if request_type == 'PUT' else 'GET')
+            result = await wait_for_psce(
+                entry.execute(**request_arguments),
+                timeout=(request_timeout - get_clock().time()) * self._timeout_multiplier
+            )
+
+            return Value(result, get_clock().time())
             
         except KeyError:
             raise AddressError(address=address, code=1002, message="Observatory component not found",
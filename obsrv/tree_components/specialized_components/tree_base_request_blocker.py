@@ -1,6 +1,5 @@
 
 import logging
-import time
 from typing import Awaitable, Callable, Dict, List, Optional
 
 from obcom.data_colection.address import AddressError
@@ -11,6 +10,7 @@ from obcom.data_colection.tree_user import BaseTreeUser, TreeServiceUser
 from obcom.data_colection.value import Value
 from obcom.data_colection.value_call import ValueRequest
 from obsrv.utils.observable import Observable
+from obsrv.utils.clock import get_clock
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
@@ -93,9 +93,9 @@ class TreeBaseRequestBlocker(TreeBaseProvider):
         current_user = self._get_current_reservation()
         if current_user is not None and current_user != user:
             raise ReservationError
-        timeout_reservation = time.time() + self._get_cfg('default_control_time',
+        timeout_reservation = get_clock().time() + self._get_cfg('default_control_time',
                                                           0) if timeout_reservation is None else timeout_reservation
-        if timeout_reservation-time.time() > self._get_cfg('max_control_time', 60):
+        if timeout_reservation-get_clock().time() > self._get_cfg('max_control_time', 60):
             raise ReservationError
         self._current_user = user
         self._timeout_reservation = timeout_reservation
@@ -107,7 +107,7 @@ class TreeBaseRequestBlocker(TreeBaseProvider):
         :return: Current user or None
         """
         if self._current_user:
-            if self._timeout_reservation <= time.time():
+            if self._timeout_reservation <= get_clock().time():
                 self.cancel_reservation()
         return self._current_user
 
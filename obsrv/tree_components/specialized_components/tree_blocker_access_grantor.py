@@ -1,5 +1,4 @@
 import logging
-import time
 from typing import Awaitable, Callable, ClassVar, List, Optional
 
 from obcom.data_colection.address import AddressError
@@ -9,6 +8,7 @@ from obsrv.tree_components.specialized_components.tree_base_request_blocker impo
     ReservationError
 from obcom.data_colection.value import Value
 from obcom.data_colection.value_call import ValueRequest
+from obsrv.utils.clock import get_clock
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
@@ -67,29 +67,29 @@ class TreeBlockerAccessGrantor(TreeProvider):
             try:
                 self._target_blocker.make_reservation(user=user, timeout_reservation=timeout_reservation)
                 logger.info(f"The user: {user} successfully take control of the blocker.")
-                return Value(v=True, ts=time.time())
+                return Value(v=True, ts=get_clock().time())
             except ReservationError:
                 logger.info(f"The user: {user} failed to take control of the blocker. Blocker is already in use.")
-                return Value(v=False, ts=time.time())
+                return Value(v=False, ts=get_clock().time())
 
         if command == 'break_control' and request_type == 'PUT':
             current_user = self._target_blocker.get_current_user()
             if current_user is None:
                 logger.info(f"The user: {user} tried to take control of the blocker, but no one had it.")
-                return Value(v=True, ts=time.time())
+                return Value(v=True, ts=get_clock().time())
             else:
                 logger.info(f"The user: {user} cancel control of the blocker for current user {current_user}.")
                 self._target_blocker.cancel_reservation()
-                return Value(v=True, ts=time.time())
+                return Value(v=True, ts=get_clock().time())
 
         if command == 'return_control' and request_type == 'PUT':
             current_user = self._target_blocker.get_current_user()
             if current_user is None or current_user == user:
                 logger.info(f"The user: {user} successfully return control of the blocker.")
                 self._target_blocker.cancel_reservation()
-                return Value(v=True, ts=time.time())
+                return Value(v=True, ts=get_clock().time())
             logger.info(f"The user: {user} failed return control of the blocker.")
-            return Value(v=False, ts=time.time())
+            return Value(v=False, ts=get_clock().time())
 
         if command == 'current_user':
             # this must be first before get user otherwise may hit the moment when the user expires
@@ -102,36 +102,36 @@ class TreeBlockerAccessGrantor(TreeProvider):
                 out['name'] = current_user.name
                 out['login_date'] = current_user.login_date
                 out['timeout_control'] = timeout_control
-            return Value(v=out, ts=time.time())
+            return Value(v=out, ts=get_clock().time())
 
         if command == 'timeout_current_control':
             # this must be first before get user otherwise may hit the moment when the user expires
             timeout_control = self._target_blocker.get_timeout_current_reservation()
-            return Value(v=timeout_control, ts=time.time())
+            return Value(v=timeout_control, ts=get_clock().time())
 
         if command == 'is_access':
             current_user = self._target_blocker.get_current_user()
             if current_user is not None and current_user == user:
-                return Value(v=True, ts=time.time())
+                return Value(v=True, ts=get_clock().time())
             else:
-                return Value(v=False, ts=time.time())
+                return Value(v=False, ts=get_clock().time())
 
         if command == 'engage_safety_cutoff' and request_type == 'PUT':
             self._target_blocker.engage_safety_cutoff()
             logger.info(f"The user: {user} engaged the safety cutoff.")
-            return Value(v=True, ts=time.time())
+            return Value(v=True, ts=get_clock().time())
 
         if command == 'disengage_safety_cutoff' and request_type == 'PUT':
             self._target_blocker.disengage_safety_cutoff()
             logger.info(f"The user: {user} disengaged the safety cutoff.")
-            return Value(v=True, ts=time.time())
+            return Value(v=True, ts=get_clock().time())
 
         if command == 'safety_cutoff_state':
             out = {
                 'engaged': self._target_blocker.is_safety_cutoff_engaged(),
                 'blocked_commands': self._target_blocker.get_safety_cutoff_list(),
             }
-            return Value(v=out, ts=time.time())
+            return Value(v=out, ts=get_clock().time())
 
         raise AddressError(code=1002, message=f'Unrecognised method for module {self.get_name()}',
                            severity=AddressError.SEVERITY_CRITICAL)
@@ -1,20 +1,29 @@
 import asyncio
 import re
+import sys
+import weakref
+from collections import Counter
 from dataclasses import dataclass
 import logging
 from asyncio import Task
-from typing import List
+from typing import List, Tuple, Dict, Optional, Pattern
 from obcom.data_colection.address import Address
 from obsrv.tree_components.base_components.tree_base_provider import TreeBaseProvider
 from obsrv.tree_components.base_components.tree_component import ProvidesResponseProtocol
-from obcom.data_colection.coded_error import TreeStructureError
+from obcom.data_colection.coded_error import TreeStructureError, TreeOtherError
 from obsrv.tree_components.specialized_components.tree_cache_observatory_protocols import KnownValueProtocol
 from obsrv.tree_components.specialized_components.tree_conditional_freezer_protocol import TreeConditionalFreezerProtocol
 from obcom.data_colection.value import Value
 from obcom.data_colection.value_call import ValueRequest, ValueResponse
+from obsrv.utils.shared_cache_view import SharedCacheViewWriter
+from obsrv.utils.clock import get_clock
+from obsrv.utils.value_history import ValueHistory, DEFAULT_TIERS
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
+# all live caches, for statistics
+_caches: 'weakref.WeakSet[TreeCache]' = weakref.WeakSet()
+
 
 class TreeCache(TreeBaseProvider):
     """
@@ -27,6 +36,8 @@ class TreeCache(TreeBaseProvider):
     """
 
     COMPONENT_DEFAULT_NAME: str = 'TreeCache'
+    HISTORY_REQUEST_TYPE: str = 'HISTORY'
+    DEFAULT_HISTORY_WINDOW: float = 600
 
     def __init__(self, component_name: str, subcontractor: ProvidesResponseProtocol = None, **kwargs):
         super().__init__(component_name=component_name, subcontractor=subcontractor, **kwargs)
@@ -39,6 +50,24 @@ class TreeCache(TreeBaseProvider):
         # self._no_cachable_address = []
         self._no_cachable_regex = []
         self._load_no_cachable_address()
+        self._shared_view: SharedCacheViewWriter or None = self._init_shared_view()
+        self._history_enabled: bool = False
+        self._history_regex: List[str] = []
+        self._history_tiers: Tuple[Tuple[float, int], ...] = DEFAULT_TIERS
+        self._load_history_cfg()
+        self._invalidation_rules: List[Tuple[Pattern, List[str]]] = []
+        self._load_invalidation_rules()
+        self._coalesce_puts: bool = False
+        self._coalesce_puts_regex: List[str] = []
+        self._put_slots: Dict[tuple, TreeCache._PutSlot] = {}
+        self._load_coalesce_puts_cfg()
+        self._stats: Counter = Counter()
+        _caches.add(self)
+
+    @dataclass
+    class _PutSlot:
+        """PUTs of one address from one client: one is sent at a time, only the latest one waits for it."""
+        waiting: Optional[asyncio.Future] = None
 
     @dataclass
     class _KnownValue:
@@ -46,6 +75,7 @@ class TreeCache(TreeBaseProvider):
         value: Value or None
         task: Task or None
         change_time: float
+        history: ValueHistory or None = None
 
         def get_change_time(self) -> float:
             return self.change_time
@@ -62,14 +92,160 @@ class TreeCache(TreeBaseProvider):
         # self._no_cachable_address = self._get_cfg("no_cachable_address", [])
         self._no_cachable_regex = self._get_cfg("no_cachable_regex", [])
 
+    def _init_shared_view(self) -> SharedCacheViewWriter or None:
+        """Create the shared-memory view of the cache if it is enabled in configuration."""
+        cfg = self._get_cfg('shared_view', {}) or {}
+        if not cfg.get('enabled', False):
+            return None
+        path = cfg.get('path') or f'/dev/shm/ocabox_cache_{self._component_name}'
+        try:
+            writer = SharedCacheViewWriter(path=path, slots=cfg.get('slots', 4096),
+                                           slot_size=cfg.get('slot_size', 512))
+        except (OSError, ValueError) as e:
+            logger.error(f'Can not create shared cache view {path}: {e}')
+            return None
+        logger.info(f'Cache {self._component_name} exports values to shared memory view {path}')
+        return writer
+
+    def _load_history_cfg(self):
+        cfg = self._get_cfg('history', {}) or {}
+        self._history_enabled = bool(cfg.get('enabled', False))
+        self._history_regex = list(cfg.get('address_regex', []) or [])
+        tiers = cfg.get('tiers') or DEFAULT_TIERS
+        self._history_tiers = tuple((float(step), int(capacity)) for step, capacity in tiers)
+
+    def _load_invalidation_rules(self):
+        rules = self._get_cfg('invalidation_rules', []) or []
+        self._invalidation_rules = []
+        for rule in rules:
+            try:
+                self._invalidation_rules.append((re.compile(rule['put']), list(rule.get('invalidate', []))))
+            except (KeyError, TypeError, re.error) as e:
+                logger.error(f'Wrong cache invalidation rule {rule}: {e!r}')
+
+    def _load_coalesce_puts_cfg(self):
+        cfg = self._get_cfg('coalesce_puts', {}) or {}
+        self._coalesce_puts = bool(cfg.get('enabled', False))
+        self._coalesce_puts_regex = list(cfg.get('address_regex', []) or [])
+
+    def _is_history_tracked(self, address: Address) -> bool:
+        if not self._history_enabled:
+            return False
+        if not self._history_regex:
+            return True
+        address_str = str(address)
+        return any(re.match(r, address_str) for r in self._history_regex)
+
+    def _on_value_stored(self, kv: _KnownValue):
+        """Called every time a new value is stored in cache, feeds the optional exports."""
+        if kv.history is None and self._is_history_tracked(kv.address):
+            kv.history = ValueHistory(self._history_tiers)
+        if kv.history is not None:
+            kv.history.add(kv.value.ts, kv.value.v)
+        if self._shared_view is not None:
+            self._shared_view.publish(str(kv.address), kv.value.v, kv.value.ts, kv.change_time)
+
+    def _get_history(self, request: ValueRequest) -> Value:
+        """
+        Answer the 'HISTORY' request. Request data may contain 'since' and 'until' (unix time, default last
+        DEFAULT_HISTORY_WINDOW seconds) and 'tier' (e.g. 'raw', '10s'), by default the finest tier covering the
+        window is used. Timestamps and values are returned as packed float64 arrays in the machine byte order
+        given in 'dtype', so the client can use them directly (e.g. ``numpy.frombuffer``).
+        """
+        kv = self._find_in_known_values(request.address)
+        if kv is None or kv.history is None:
+            raise TreeOtherError(code=4001, message=f'History is not recorded for address {request.address}')
+        now = get_clock().time()
+        try:
+            until = float(request.request_data.get('until', now))
+            since = float(request.request_data.get('since', until - self.DEFAULT_HISTORY_WINDOW))
+            tier, ts, v = kv.history.window(since, until, request.request_data.get('tier'))
+        except (TypeError, ValueError):
+            raise TreeOtherError(code=4007, message='Wrong history window arguments')
+        except KeyError as e:
+            raise TreeOtherError(code=4007, message=f'Unknown history tier {e}. '
+                                                    f'Available: {kv.history.tier_names()}')
+        out = {'tier': tier.name,
+               'step': tier.step,
+               'count': len(ts),
+               'dtype': ('<' if sys.byteorder == 'little' else '>') + 'f8',
+               'ts': ts.tobytes(),
+               'v': v.tobytes()}
+        return Value(v=out, ts=now)
+
+    async def stop(self):
+        if self._shared_view is not None:
+            self._shared_view.close()
+            self._shared_view = None
+        await super().stop()
+
+    async def get_response(self, request: ValueRequest) -> ValueResponse:
+        # docstring is imported from parent
+        if request.request_type == 'PUT' and self._is_coalesced_put(request.address):
+            return await self._coalesced_put(request)
+        return await super().get_response(request)
+
+    def _is_coalesced_put(self, address: Address) -> bool:
+        if not self._coalesce_puts:
+            return False
+        address_str = str(address)
+        return any(re.match(r, address_str) for r in self._coalesce_puts_regex)
+
+    async def _coalesced_put(self, request: ValueRequest) -> ValueResponse:
+        """
+        Send the PUT when no other PUT of the same address and client is in progress, otherwise wait for it. A PUT
+        still waiting when a newer one comes is not sent at all and answers successfully with None value tagged
+        'superseded', e.g. only the last position of a slider drag reaches the device.
+        """
+        user = request.user
+        key = (str(request.address), getattr(user, 'name', None), getattr(user, 'socket_id', None))
+        slot = self._put_slots.get(key)
+        if slot is None:
+            slot = self._put_slots[key] = self._PutSlot()
+        else:
+            if slot.waiting is not None and not slot.waiting.done():
+                slot.waiting.set_result(False)
+            future = asyncio.get_running_loop().create_future()
+            slot.waiting = future
+            try:
+                go = await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled() and future.result():
+                    self._pass_put_slot(key, slot)  # turn came just when the client gave up
+                elif slot.waiting is future:
+                    slot.waiting = None
+                raise
+            if not go:
+                value = Value(v=None, ts=get_clock().time())
+                value.tags['superseded'] = True
+                return ValueResponse(request.address, value, True)
+        try:
+            return await super().get_response(request)
+        finally:
+            self._pass_put_slot(key, slot)
+
+    def _pass_put_slot(self, key: tuple, slot: _PutSlot):
+        waiting, slot.waiting = slot.waiting, None
+        if waiting is not None and not waiting.done():
+            waiting.set_result(True)
+        else:
+            self._put_slots.pop(key, None)
+
     async def get_value(self, request: ValueRequest, **kwargs) -> Value or None:
         # docstring is imported from parent
         recall = kwargs.get('recall', 0)
         address = request.address
+        if request.request_type == self.HISTORY_REQUEST_TYPE:
+            return self._get_history(request)
         # skip cache if request is not cachable all other values should be initialized in cache
         if not self.is_cachable_request(request=request):
+            self._stats['uncachable'] += 1
             raise TreeStructureError
         known_value = self._find_in_known_values(address)
+        if known_value and known_value.value is not None and self.large_values is not None \
+                and not self.large_values.is_alive(known_value.value.v):
+            # payload was evicted from the large value store, handle is useless for clients
+            known_value.value = None
         if not known_value:
             # Initializing this value even when it cannot be updated later means the request is cachable
             known_value = self._KnownValue(address=address, value=None, task=None, change_time=0)
@@ -78,6 +254,7 @@ class TreeCache(TreeBaseProvider):
                                                                     request.time_of_data_tolerance) else None
         # found in known values
         if value:
+            self._stats['hits' if recall == 0 else 'shared'] += 1
             return value
         else:
             if recall > 0:
@@ -89,6 +266,7 @@ class TreeCache(TreeBaseProvider):
         if not task or task.done():
             known_value.task = None
             known_value.task = asyncio.current_task()
+            self._stats['misses'] += 1
             raise TreeStructureError
         # not found but someone asks about it and waiting for answer
         if task and not task.done():
@@ -101,8 +279,19 @@ class TreeCache(TreeBaseProvider):
                 await asyncio.wait([task])
                 return await self.get_value(request, recall=recall + 1)
         logger.info(f"stop waiting for other task and try ask by yourself")
+        self._stats['misses'] += 1
         raise TreeStructureError
 
+    def stats(self) -> dict:
+        """
+        Counters of GET lookups: 'hits' answered from cache, 'shared' answered by the refresh of another waiting
+        request, 'misses' forwarded to the device and 'uncachable' requests not handled by the cache.
+        """
+        hits, shared, misses = self._stats['hits'], self._stats['shared'], self._stats['misses']
+        lookups = hits + shared + misses
+        return {'hits': hits, 'shared': shared, 'misses': misses, 'uncachable': self._stats['uncachable'],
+                'hit_ratio': (hits + shared) / lookups if lookups else None, 'values': len(self._known_values)}
+
     def is_cachable_request(self, request: ValueRequest) -> bool:
         if request.request_type != 'GET':
             return False
@@ -115,14 +304,73 @@ class TreeCache(TreeBaseProvider):
 
     async def _on_subcontractor_return(self, result: ValueResponse, request: ValueRequest):
         # docstring is imported from parent
+        if request.request_type == 'PUT' and result.status:
+            await self._invalidate_after_put(request.address)
+            return
         if not self.is_cachable_request(request=request):
             return
         kv = self._find_in_known_values(result.address)
         if not kv:
             logger.error(f'Can not find current value in list cached values and should be')
+        result.value = self._offload_large_value(result.value)
         await self._update_known_value(result.address, result.value, kv)
         self._remove_the_value_lock(result.address, kv)
 
+    async def ingest_pushed_value(self, address: Address or str, value: Value):
+        """
+        Store value delivered by a device subscription (not requested by any client) as if it was returned by the
+        subcontractor. Cycle queries waiting in the conditional freezer are woken up when the value changed.
+
+        :param address: full address of the value as clients ask for it
+        :param value: Value with the device timestamp
+        """
+        if value is None:
+            return
+        if not isinstance(address, Address):
+            address = Address(address)
+        for r in self._no_cachable_regex:
+            if re.match(r, address.__str__()):
+                return
+        await self._update_known_value(address, self._offload_large_value(value))
+
+    def _invalidation_targets(self, address: Address) -> set:
+        address_str = str(address)
+        targets = set()
+        for rx, templates in self._invalidation_rules:
+            m = rx.match(address_str)
+            if m:
+                targets.update(m.expand(t) for t in templates)
+        return targets
+
+    async def _invalidate_after_put(self, address: Address):
+        """
+        Expire cached values related to the address of a successful PUT (``invalidation_rules``), so the next GET
+        reads the device instead of serving the value from before the write. Cycle queries waiting in the
+        conditional freezer are woken up and refresh the value (once, concurrent refreshes wait for the first one).
+        """
+        targets = self._invalidation_targets(address)
+        if not targets:
+            return
+        expired = False
+        for kv in self._known_values:
+            if kv.value is not None and str(kv.address) in targets:
+                kv.value = None
+                expired = True
+        if expired:
+            logger.debug(f'PUT {address} expired cached values {sorted(targets)}')
+            await self._report_new_value()
+
+    def _offload_large_value(self, value: Value or None) -> Value or None:
+        """Replace large payload by a handle to the large value store, so the payload is not copied by the cache,
+        freezer and every response."""
+        store = self.large_values
+        if store is None or value is None:
+            return value
+        handle = store.offload(value.v)
+        if handle is not None:
+            return Value(v=handle, ts=value.ts)
+        return value
+
     def _find_in_known_values(self, address: Address) -> _KnownValue or None:
         """
         This method check if value for given address exists in known values and return it.
@@ -170,18 +418,21 @@ class TreeCache(TreeBaseProvider):
             if not kv:
                 kv = self._KnownValue(address=address, value=value, task=None, change_time=value.ts)  # first initial
                 self._known_values.append(kv)
+                self._on_value_stored(kv)
                 return
             # if new provided data is earlier than the date currently stored in list
             if not kv.value:
                 # initial know value after create it
                 kv.value = value
                 kv.change_time = value.ts
+                self._on_value_stored(kv)
             else:
                 if kv.value.ts < value.ts:
                     if self._is_changed(new_v=value, old_v=kv.value):
                         kv.change_time = value.ts
                         await self._report_new_value()  # report that there is new value if conditional_freezer is known
                     kv.value = value
+                    self._on_value_stored(kv)
 
     def _remove_the_value_lock(self, address, known_value: _KnownValue = None):
         kv = known_value if known_value else self._find_in_known_values(address)
@@ -214,3 +465,8 @@ class TreeCache(TreeBaseProvider):
 
     def get_k_val(self, address: Address) -> KnownValueProtocol or None:
         return self._find_in_known_values(address=address)
+
+
+def cache_stats() -> Dict[str, dict]:
+    """Statistics of all live caches keyed by component name (see ``TreeCache.stats``)."""
+    return {c._component_name: c.stats() for c in list(_caches)}
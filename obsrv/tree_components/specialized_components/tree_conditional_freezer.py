@@ -1,5 +1,4 @@
 import asyncio
-import time
 import logging
 from typing import Optional
 
@@ -11,7 +10,9 @@ from obsrv.tree_components.specialized_components.tree_cache_observatory_protoco
     KnownValueProtocol
 from obcom.data_colection.value import Value, TreeValueError
 from obcom.data_colection.value_call import ValueRequest
+from obsrv.utils import metrics
 from obsrv.utils.asyncio_util_functions import wait_for_psce
+from obsrv.utils.clock import get_clock
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
@@ -42,6 +43,13 @@ def strip_tree_internal_fields(request_arguments: dict) -> dict:
     return {k: v for k, v in request_arguments.items() if k not in TREE_INTERNAL_REQUEST_FIELDS}
 
 
+_WAKEUPS = metrics.counter('ocabox_freezer_wakeups_total',
+                           'Wakeups of cycle queries waiting in the freezer: value change or refresh due',
+                           ('freezer', 'reason'))
+_TIMEOUTS = metrics.counter('ocabox_freezer_timeouts_total', 'Cycle queries answered empty because of timeout',
+                            ('freezer',))
+
+
 # todo zapytać  o podwojne zapytania do rutera, jedna wartość może się zmienić szybciej nisz druga i co wtedy?
 #  Zdajemy się na inteligęcje urzytkownika? może niech będzie taka opcja ale w client_API się to uniemożliwi?
 
@@ -59,6 +67,9 @@ class TreeConditionalFreezer(TreeBaseProvider):
         # how many seconds before timeout expires component is to return an empty message to the clone
         self._alarm_timeout_offset: float = self._get_cfg('alarm_timeout')
         self._min_time_of_data_tolerance = self._get_cfg('min_time_of_data_tolerance')
+        self._m_wakeup_change = _WAKEUPS.labels(component_name, 'change')
+        self._m_wakeup_refresh = _WAKEUPS.labels(component_name, 'refresh')
+        self._m_timeouts = _TIMEOUTS.labels(component_name)
 
     def set_max_refreshes(self, max_: int):
         self._max_unsuccessful_refreshes = max_
@@ -139,15 +150,17 @@ class TreeConditionalFreezer(TreeBaseProvider):
                                                min_wait=wait_offset_error)  # can raise TreeValueError
             # if event was call - that mean some other task refreshes value
             if result_waiter:
+                self._m_wakeup_change.inc()
                 continue  # continue because event was call so is not necessary to update value again
 
             # check is time to return anything because timeout is coming
             await self._expire_checker(waiting_timeout, nr_of_unsuccessful_refreshes)  # can raise TreeOtherError
 
             # update value
+            self._m_wakeup_refresh.inc()
             try:
                 logger.debug(f"Update value ({request.address})")
-                status_update, err = await wait_for_psce(self._update_value(request), waiting_timeout - time.time())
+                status_update, err = await wait_for_psce(self._update_value(request), waiting_timeout - get_clock().time())
             except asyncio.CancelledError:
                 raise
             except asyncio.TimeoutError:
@@ -181,9 +194,10 @@ class TreeConditionalFreezer(TreeBaseProvider):
 
         :raise TreeOtherError:
         """
-        if waiting_timeout - time.time() <= 0:
+        if waiting_timeout - get_clock().time() <= 0:
             # response timeout so stop refreshing value and send empty message
             # Send subscription details so that it can be reopened when will be requested again
+            self._m_timeouts.inc()
             raise TreeOtherError(code=4004, nr_of_unsuccessful_refreshes=nr_of_unsuccessful_refreshes)
 
     async def _waiter(self, k_value: KnownValueProtocol or None, t_tolerance: float, waiting_timeout: float,
@@ -200,7 +214,7 @@ class TreeConditionalFreezer(TreeBaseProvider):
         :return: True if waiter finish by event call
         """
         while True:
-            current_time = time.time()
+            current_time = get_clock().time()
             if k_value is None or k_value.get_timestamp() is None:
                 waiting_time = 0
             else:
@@ -233,7 +247,7 @@ class TreeConditionalFreezer(TreeBaseProvider):
 
     async def _delayer(self, wait_to, waiting_timeout):
         """The method implements the query delay, taking care not to exceed the timeout"""
-        current_time = time.time()
+        current_time = get_clock().time()
         if current_time > wait_to:
             return
         if wait_to < waiting_timeout:
@@ -251,7 +265,7 @@ class TreeConditionalFreezer(TreeBaseProvider):
         :return: return True if value was updated
         """
 
-        request.time_of_data = time.time()
+        request.time_of_data = get_clock().time()
         result = await self._subcontractor.get_response(request=request.copy())
         if result.status:
             return True, result.error
@@ -1,15 +1,21 @@
 from __future__ import annotations
 
+import asyncio
 import astropy.units as u
 import functools
 import logging
+import numpy as np
 import param
 import time as time_module
+from collections import OrderedDict
 from typing import Awaitable, Callable, ClassVar, Optional
 from astropy.coordinates import EarthLocation, get_moon, get_sun, AltAz, SkyCoord
 from astropy.time import Time
 from obcom.data_colection.address import AddressError
 from obsrv.tree_components.base_components.tree_provider import TreeProvider
+from obsrv.utils.coordinates import check_equatorial_coordinates
+from obsrv.utils.ephemeris_tables import NightlyEphemeris, night_start
+from obsrv.utils.visibility import target_visibility
 from obsrv.utils.observable import Observable
 from obsrv.utils.ocaboxtask import OcaboxTask
 from obcom.data_colection.value import Value
@@ -38,7 +44,7 @@ class EphemerisData(OcaboxTask):
         return self._as_time_obj(time)
 
     @staticmethod
-    @functools.lru_cache()
+    @functools.lru_cache(maxsize=8)
     def _as_time_obj(time: float | Time) -> Time:
         if isinstance(time, Time):
             return time
@@ -52,11 +58,11 @@ class EphemerisData(OcaboxTask):
         t = self.as_time_obj(time)
         return self._get_sun(t)
 
-    @functools.lru_cache()
+    @functools.lru_cache(maxsize=8)
     def _get_moon(self, time: Time) -> SkyCoord:
         return get_moon(time)
 
-    @functools.lru_cache()
+    @functools.lru_cache(maxsize=8)
     def _get_sun(self, time: Time) -> SkyCoord:
         return get_sun(time)
 
@@ -73,7 +79,7 @@ class EphemerisData(OcaboxTask):
         t = self.as_time_obj(time)
         return self._get_obs_az_frame(t)
 
-    @functools.lru_cache()
+    @functools.lru_cache(maxsize=8)
     def _get_obs_az_frame(self, time: Time) -> AltAz:
         return AltAz(obstime=time,
                      location=self.obs_location,
@@ -90,9 +96,24 @@ class TreeEphemeris(TreeProvider):
     """
     This module provides current information about sky position of the celestial object and current time
     in various timescales.
+
+    Sun and Moon positions are interpolated from tables precomputed once per night (see
+    :mod:`obsrv.utils.ephemeris_tables`) for the observatory location from the component config. Commands:
+    ``utc``, ``sun_alt``, ``sun_az``, ``moon_alt``, ``moon_az``, ``moon_phase`` (illuminated fraction),
+    ``twilight`` (unix times of the night events) and ``moon_separation`` (degrees from the ``ra``, ``dec`` request
+    arguments). A ``time`` request argument (unix time) asks for another moment than now.
+
+    The ``visibility`` command computes alt-az, airmass and rising / setting of many targets at once (see
+    :func:`obsrv.utils.visibility.target_visibility`), arguments: ``ra``, ``dec`` (lists, degrees or sexagesimal
+    strings), optional ``start``, ``end`` (unix times, now and 12 h later by default), ``step`` (seconds) and
+    ``min_alt`` (degrees). The grid starts at ``start`` rounded down to the step, so the results of a target set are
+    cached and shared by the requests within one step.
     """
 
+    COMPONENT_DEFAULT_NAME: str = 'TreeEphemeris'
     PUSH_DRIVEN: ClassVar[bool] = True
+    _TABLE_COMMANDS: ClassVar[frozenset] = frozenset({'sun_alt', 'sun_az', 'moon_alt', 'moon_az', 'moon_phase',
+                                                      'twilight', 'moon_separation'})
 
     def __init__(self, component_name: str, source_name: str, **kwargs):
         self.data = EphemerisData()
@@ -105,6 +126,18 @@ class TreeEphemeris(TreeProvider):
         self.data.param.watch(self._sync_utc_to_observable, 'utc')
         self._utc_unsub: Optional[Callable[[], None]] = None
         super().__init__(component_name=component_name, source_name=source_name, subcontractor=None, **kwargs)
+        self.ephemeris = NightlyEphemeris(latitude=self._get_cfg('latitude', 0.0),
+                                          longitude=self._get_cfg('longitude', 0.0),
+                                          height=self._get_cfg('elevation', 0.0),
+                                          pressure=self._get_cfg('pressure', 0.0),
+                                          step=self._get_cfg('table_step', 60.0))
+        self._tables_task: Optional[asyncio.Task] = None
+        visibility_cfg = self._get_cfg('visibility', {}) or {}
+        self._visibility_step: float = float(visibility_cfg.get('step', 300))
+        self._visibility_min_alt: float = float(visibility_cfg.get('min_alt', 0.0))
+        self._visibility_max_points: int = int(visibility_cfg.get('max_points', 500000))
+        self._visibility_cache_size: int = int(visibility_cfg.get('cache_size', 32))
+        self._visibility_cache: OrderedDict[tuple, dict] = OrderedDict()
         logger.info(f'Created {self}')
 
     def _sync_utc_to_observable(self, event: param.Event) -> None:
@@ -141,14 +174,96 @@ class TreeEphemeris(TreeProvider):
         if command == 'method2':
             timeout_control = "response string"
             return Value(v=timeout_control, ts=time_module.time())
+
+        if command in self._TABLE_COMMANDS:
+            args = request.request_data
+            try:
+                t = float(args.get('time') or time_module.time())
+                if command == 'moon_separation':
+                    ra, dec = check_equatorial_coordinates(args.get('ra'), args.get('dec'))
+                    if ra is None or dec is None:
+                        raise ValueError('ra and dec are required')
+                    ra, dec = float(ra), float(dec)
+            except (TypeError, ValueError) as e:
+                raise AddressError(code=1003, message=f'Wrong arguments for {command}: {e}')
+            tables = await self.ephemeris.tables(t)
+            if command == 'sun_alt':
+                v = tables.sun_altaz(t)[0]
+            elif command == 'sun_az':
+                v = tables.sun_altaz(t)[1]
+            elif command == 'moon_alt':
+                v = tables.moon_altaz(t)[0]
+            elif command == 'moon_az':
+                v = tables.moon_altaz(t)[1]
+            elif command == 'moon_phase':
+                v = tables.moon_phase(t)
+            elif command == 'twilight':
+                v = tables.twilight_times()
+            else:
+                v = tables.moon_separation(ra, dec, t)
+            return Value(v=v, ts=time_module.time())
+
+        if command == 'visibility':
+            return Value(v=await self._visibility(request.request_data), ts=time_module.time())
         raise AddressError(code=1002, message=f'Unrecognised method for module {self.get_name()}',
                            severity=AddressError.SEVERITY_CRITICAL)
 
+    async def _visibility(self, args: dict) -> dict:
+        try:
+            ra, dec = args['ra'], args['dec']
+            if len(ra) != len(dec) or not ra:
+                raise ValueError('ra and dec must be non empty lists of the same length')
+            targets = [check_equatorial_coordinates(r, d) for r, d in zip(ra, dec)]
+            ra = tuple(float(r) for r, _ in targets)
+            dec = tuple(float(d) for _, d in targets)
+            step = float(args.get('step') or self._visibility_step)
+            start = float(args.get('start') or time_module.time())
+            duration = float(args.get('end') or start + 43200) - start
+            min_alt = float(args.get('min_alt', self._visibility_min_alt))
+            if step <= 0 or duration <= 0:
+                raise ValueError('step and time range must be positive')
+        except (KeyError, TypeError, ValueError) as e:
+            raise AddressError(code=1003, message=f'Wrong arguments for visibility: {e}')
+        bucket = step * (start // step)
+        n_times = int(-(-(start + duration - bucket) // step)) + 1  # grid reaching the end of the range
+        if n_times * len(ra) > self._visibility_max_points:
+            raise AddressError(code=1003, message=f'Visibility request too large: {len(ra)} targets x {n_times} '
+                                                  f'times, limit {self._visibility_max_points} points')
+        key = (ra, dec, bucket, n_times, step, min_alt)
+        result = self._visibility_cache.get(key)
+        if result is None:
+            result = await self.executors.run(target_visibility, ra, dec, bucket + step * np.arange(n_times),
+                                              latitude=self.ephemeris.latitude, longitude=self.ephemeris.longitude,
+                                              min_alt=min_alt, size=n_times * len(ra), threshold='visibility_points')
+            self._visibility_cache[key] = result
+            while len(self._visibility_cache) > self._visibility_cache_size:
+                self._visibility_cache.popitem(last=False)
+        else:
+            self._visibility_cache.move_to_end(key)
+        return result
+
+    async def _keep_tables(self):
+        """Build the tables of the current night ahead of queries, and of the next one at its start."""
+        while True:
+            now = time_module.time()
+            try:
+                await self.ephemeris.tables(now)
+            except Exception as e:  # queries retry the build anyway
+                logger.error(f'Can not build ephemeris tables: {e}')
+                await asyncio.sleep(60)
+                continue
+            await asyncio.sleep(max(1.0, night_start(now, self.ephemeris.longitude) + 86400 - now))
+
     async def run(self):
         await self.data.run()
+        if self._tables_task is None:
+            self._tables_task = asyncio.create_task(self._keep_tables())
         return await super().run()
 
     async def stop(self):
+        if self._tables_task is not None:
+            self._tables_task.cancel()
+            self._tables_task = None
         await self.data.stop()
         return await super().stop()
 
@@ -2,7 +2,6 @@
 TreeIrisObservatory - Tree adapter for IRIS Observatory.
 """
 import logging
-import time
 from typing import Optional
 
 from obcom.data_colection.address import AddressError
@@ -11,14 +10,16 @@ from obcom.data_colection.value import Value, TreeValueError
 from obcom.data_colection.value_call import ValueRequest
 
 from obsrv.tree_components.base_components.tree_base_provider import TreeBaseProvider
+from obsrv.tree_components.specialized_components.observatory_push import ObservatoryPushMixin
 from obsrv.tree_components.specialized_components.tree_conditional_freezer import strip_tree_internal_fields
 from obsrv.telescope_devices.device_tree import Observatory
 from obsrv.utils.asyncio_util_functions import wait_for_psce
+from obsrv.utils.clock import get_clock
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
 
-class TreeIrisObservatory(TreeBaseProvider):
+class TreeIrisObservatory(ObservatoryPushMixin, TreeBaseProvider):
     """
     Tree adapter specific for IRIS Observatory.
     Handles mixed protocols (Pilar, IrisCCD, Alpaca).
@@ -55,16 +56,10 @@ class TreeIrisObservatory(TreeBaseProvider):
             # Fallback configuration if needed
             self._observatory.observatory_configuration_rare = {"protocol": "pilar"}
     
-    async def run(self):
-        await super().run()
-    
-    async def stop(self):
-        await super().stop()
-    
     async def get_value(self, request: ValueRequest, **kwargs) -> Value or None:
         address = request.address
         index = request.index
-        iris_address = address[index:].copy()
+        iris_address = tuple(address[index:])
         request_type = request.request_type
         request_arguments = strip_tree_internal_fields(request.request_data)
         request_timeout = request.request_timeout
@@ -74,26 +69,14 @@ class TreeIrisObservatory(TreeBaseProvider):
             raise AddressError(address=address, code=1001, message="Incoming address is too short")
 
         try:
-            # Navigate to component in the Observatory tree
-            component = self._observatory
-            for addr_part in iris_address[:-1]:
-                component = component.children[addr_part]
-            
-            method_name = iris_address[-1]
-            
-            # Execute request - the component will use its assigned connector (Pilar, IrisCCD or Alpaca)
-            if request_type == 'PUT':
-                result = await wait_for_psce(
-                    component.put(method_name, **request_arguments),
-                    timeout=(request_timeout - time.time()) * self._timeout_multiplier
-                )
-            else:
-                result = await wait_for_psce(
-                    component.get(method_name, **request_arguments),
-                    timeout=(request_timeout - time.time()) * self._timeout_multiplier
-                )
-            
-            return Value(result, time.time())
+            # resolved handler of the device variable, it uses the component's connector (Pilar, IrisCCD or Alpaca)
+            entry = self._observatory.dispatch(iris_address, 'PUT' if request_type == 'PUT' else 'GET')
+            result = await wait_for_psce(
+                entry.execute(**request_arguments),
+                timeout=(request_timeout - get_clock().time()) * self._timeout_multiplier
+            )
+
+            return Value(result, get_clock().time())
             
         except KeyError:
             raise AddressError(address=address, code=1002, message="Observatory component not found",
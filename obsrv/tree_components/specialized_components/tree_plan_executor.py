@@ -1,11 +1,11 @@
 import logging
-import time
 from typing import Optional
 
 from obcom.data_colection.address import AddressError
 from obsrv.tree_components.base_components.tree_provider import TreeProvider
 from obcom.data_colection.value import Value
 from obcom.data_colection.value_call import ValueRequest
+from obsrv.utils.clock import get_clock
 
 logger = logging.getLogger(__name__.rsplit('.')[-1])
 
@@ -31,11 +31,11 @@ class TreePlanExecutor(TreeProvider):
 
         if command == 'method1':
             timeout_control = "response string"
-            return Value(v=timeout_control, ts=time.time())
+            return Value(v=timeout_control, ts=get_clock().time())
 
         if command == 'method2':
             timeout_control = "response string"
-            return Value(v=timeout_control, ts=time.time())
+            return Value(v=timeout_control, ts=get_clock().time())
         raise AddressError(code=1002, message=f'Unrecognised method for module {self.get_name()}',
                            severity=AddressError.SEVERITY_CRITICAL)
 
@@ -0,0 +1,140 @@
+"""
+Injectable clock of the tree.
+
+Tree components read the current time through ``get_clock().time()`` instead of ``time.time()``, and wait with
+asyncio (``asyncio.sleep``, ``wait_for_psce``), which follows the time of the event loop. By default the clock is
+``SystemClock`` and nothing changes.
+
+Simulations and tests replace both with virtual time::
+
+    async def scenario():
+        ...  # e.g. hours of cycle queries against a tree with a fake provider
+
+    result = run_virtual(scenario())
+
+``run_virtual`` runs the coroutine on ``VirtualTimeEventLoop`` with a ``VirtualClock`` installed. Whenever the loop
+has nothing to do until the next timer it does not block but moves the virtual time forward to that timer, so an hour
+of waiting for refreshes, reservation expirations or timeouts takes as long as the processing of the events in it.
+Real IO (sockets) still works but does not advance virtual time by itself.
+"""
+import asyncio
+import selectors
+import time
+from typing import Awaitable, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class Clock:
+    """Source of the current time."""
+
+    def time(self) -> float:
+        """Current unix time in seconds (as ``time.time()``)."""
+        raise NotImplementedError
+
+    def monotonic(self) -> float:
+        """Monotonic time in seconds (as ``time.monotonic()``)."""
+        raise NotImplementedError
+
+
+class SystemClock(Clock):
+    """Real time."""
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+
+class VirtualClock(Clock):
+    """
+    Time advanced explicitly by ``advance()`` or by ``VirtualTimeEventLoop`` when it would otherwise wait.
+
+    :param start: unix time at the beginning, current time by default
+    """
+
+    def __init__(self, start: Optional[float] = None):
+        self._start = time.time() if start is None else start
+        self._elapsed = 0.0
+
+    def time(self) -> float:
+        return self._start + self._elapsed
+
+    def monotonic(self) -> float:
+        return self._elapsed
+
+    def advance(self, seconds: float):
+        if seconds < 0:
+            raise ValueError('Virtual time can not go back')
+        self._elapsed += seconds
+
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    """Selector polling IO without blocking, the wait for the next timer is skipped by advancing the clock."""
+
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            # no timers, only IO or other threads (call_soon_threadsafe) can wake the loop
+            return super().select(None)
+        ready = super().select(0)
+        if not ready and timeout > 0:
+            self._clock.advance(timeout)
+        return ready
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """Event loop keeping time of the virtual clock (``loop.time()`` is ``clock.monotonic()``)."""
+
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        super().__init__(selector=_VirtualTimeSelector(clock))
+
+    def time(self) -> float:
+        return self.clock.monotonic()
+
+
+_clock: Clock = SystemClock()
+
+
+def get_clock() -> Clock:
+    return _clock
+
+
+def set_clock(clock: Clock) -> Clock:
+    """Install the clock used by the tree, returns the previous one."""
+    global _clock
+    previous, _clock = _clock, clock
+    return previous
+
+
+def run_virtual(main: Awaitable[T], clock: Optional[VirtualClock] = None) -> T:
+    """
+    Run the awaitable to the end in virtual time and return its result. Tasks left running are cancelled, the
+    previous clock is restored.
+
+    :param main: coroutine to run
+    :param clock: virtual clock to use (e.g. with a fixed start), a new one by default
+    """
+    clock = clock if clock is not None else VirtualClock()
+    loop = VirtualTimeEventLoop(clock)
+    previous = set_clock(clock)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        try:
+            tasks = asyncio.all_tasks(loop)
+            for t in tasks:
+                t.cancel()
+            if tasks:
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            set_clock(previous)
+            asyncio.set_event_loop(None)
+            loop.close()
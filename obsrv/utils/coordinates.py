@@ -1,18 +1,31 @@
+import functools
+
 from astropy.coordinates import Angle
-from astropy import units as u
+
+_DEGREES_PER_UNIT = {'hourangle': 15.0, 'deg': 1.0}
+
+
+# Parsing an Angle string costs astropy's parser on every slew / sync PUT, clients resend the same target strings,
+# so the results are memoized. Plain numbers skip the parser. The work is far below the cost of an executor hop.
+@functools.lru_cache(maxsize=1024)
+def _parse_angle(value: str, unit: str) -> float:
+    try:
+        return float(value) * _DEGREES_PER_UNIT[unit]
+    except ValueError:
+        return Angle(value, unit=unit).deg
 
 
 def check_equatorial_coordinates(ra, dec):
     if isinstance(ra, str) and ra:
-        ra = Angle(ra, unit=u.hourangle).deg
+        ra = _parse_angle(ra, 'hourangle')
     if isinstance(dec, str) and dec:
-        dec = Angle(dec, unit=u.deg).deg
+        dec = _parse_angle(dec, 'deg')
     return ra, dec
 
 
 def check_horizontal_coordinates(az, alt):
     if isinstance(az, str) and az:
-        az = Angle(az, unit=u.deg).deg
+        az = _parse_angle(az, 'deg')
     if isinstance(alt, str) and alt:
-        alt = Angle(alt, unit=u.deg).deg
+        alt = _parse_angle(alt, 'deg')
     return az, alt
@@ -0,0 +1,123 @@
+"""
+Shared worker pools for synchronous work which would stall the event loop.
+
+``Executors()`` (a singleton, also reachable as ``TreeData.executors``) owns a thread pool for work releasing the GIL
+or doing IO (JSON decoding, YAML config parsing) and a process pool for pure-CPU Python work (astropy ephemeris
+tables). Pools are created on first use. A job can carry its size and the name of a threshold from the ``executors``
+config section - jobs smaller than the threshold run inline, as a pool round trip would cost more than the work.
+
+The wait of jobs in the pool queues is exported as ``ocabox_executor_queue_wait_seconds``, inline and offloaded jobs
+are counted by ``ocabox_executor_jobs_total``.
+"""
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional, TypeVar
+
+import confuse
+
+from obsrv.ob_config import SingletonConfig
+from obsrv.utils import metrics
+from obsrv.utils.singleton import SingletonMeta
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+T = TypeVar('T')
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+DEFAULT_THRESHOLDS = {
+    'alpaca_json': 256 * 1024,  # bytes of an Alpaca JSON response body
+    'ephemeris_points': 100,  # time points of an ephemeris table
+    'visibility_points': 20000,  # targets x time points of a visibility request
+}
+
+_QUEUE_WAIT = metrics.histogram('ocabox_executor_queue_wait_seconds', 'Wait of jobs for a worker of the shared pools',
+                                ('pool',), buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0))
+_JOBS = metrics.counter('ocabox_executor_jobs_total', 'Jobs of the shared pools, run inline below the size threshold',
+                        ('pool', 'mode'))
+
+
+def _timed(submitted: float, func: Callable, args: tuple, kwargs: dict):
+    """Run in the worker, returns the queue wait with the result (wall clock, comparable between processes)."""
+    wait = time.time() - submitted
+    return wait, func(*args, **kwargs)
+
+
+def _settings() -> dict:
+    try:
+        cfg = SingletonConfig.get_config()['executors'].get()
+    except confuse.exceptions.NotFoundError:
+        cfg = None
+    return cfg or {}
+
+
+class Executors(metaclass=SingletonMeta):
+    """Thread and process pools shared by the whole server, ``Executors()`` always returns the same instance."""
+
+    def __init__(self):
+        cfg = _settings()
+        self.thread_workers: int = int(cfg.get('thread_workers', 4))
+        self.process_workers: int = int(cfg.get('process_workers', 2))  # 0 runs process jobs in the thread pool
+        self.thresholds: Dict[str, float] = {**DEFAULT_THRESHOLDS, **(cfg.get('thresholds') or {})}
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._m_wait = {pool: _QUEUE_WAIT.labels(pool) for pool in (THREAD, PROCESS)}
+        self._m_jobs = {(pool, mode): _JOBS.labels(pool, mode) for pool in (THREAD, PROCESS)
+                        for mode in ('inline', 'offloaded')}
+
+    def _pool(self, pool: str) -> Executor:
+        with self._lock:
+            if pool == PROCESS and self.process_workers > 0:
+                if self._process_pool is None:
+                    # spawned workers do not inherit the loop, the threads and the locks of the server
+                    self._process_pool = ProcessPoolExecutor(max_workers=self.process_workers,
+                                                             mp_context=multiprocessing.get_context('spawn'))
+                return self._process_pool
+            if self._thread_pool is None:
+                self._thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix='ocabox')
+            return self._thread_pool
+
+    def inline(self, threshold: str, size: float) -> bool:
+        """True when a job of ``size`` is below the named threshold and should run on the loop."""
+        return size < self.thresholds.get(threshold, 0)
+
+    async def run(self, func: Callable[..., T], *args, pool: str = THREAD, size: Optional[float] = None,
+                  threshold: Optional[str] = None, **kwargs) -> T:
+        """
+        Run ``func(*args, **kwargs)`` in a shared pool and return its result.
+
+        :param pool: ``THREAD`` or ``PROCESS`` (``func``, arguments and result must be picklable)
+        :param size: size of the job in the units of the threshold, e.g. bytes to decode
+        :param threshold: name of the threshold in the ``executors.thresholds`` config, smaller jobs run inline
+        """
+        if threshold is not None and size is not None and self.inline(threshold, size):
+            self._m_jobs[(pool, 'inline')].inc()
+            return func(*args, **kwargs)
+        self._m_jobs[(pool, 'offloaded')].inc()
+        executor = self._pool(pool)
+        try:
+            wait, result = await asyncio.get_running_loop().run_in_executor(executor, _timed, time.time(), func,
+                                                                            args, kwargs)
+        except BrokenProcessPool:
+            logger.error('Process pool is broken (a worker died), it will be recreated')
+            with self._lock:
+                if self._process_pool is executor:
+                    self._process_pool = None
+            executor.shutdown(wait=False)
+            raise
+        self._m_wait[pool].observe(max(0.0, wait))
+        return result
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pools, self._thread_pool, self._process_pool = (self._thread_pool, self._process_pool), None, None
+        for p in pools:
+            if p is not None:
+                p.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,84 @@
+"""
+Fixed bucket latency histogram.
+
+Buckets are log spaced (four per power of two) from 50 µs up to about two minutes, so one histogram costs a few
+hundred integers regardless of the number of observations and percentiles are accurate to about 10 %.
+"""
+import bisect
+import math
+from typing import Dict, List, Optional, Sequence
+
+MIN_BOUND = 50e-6
+BUCKETS_PER_OCTAVE = 4
+OCTAVES = 21
+
+
+def _default_bounds() -> List[float]:
+    return [MIN_BOUND * 2 ** (i / BUCKETS_PER_OCTAVE) for i in range(OCTAVES * BUCKETS_PER_OCTAVE + 1)]
+
+
+DEFAULT_BOUNDS: List[float] = _default_bounds()
+
+
+class LatencyHistogram:
+    """
+    Histogram of durations in seconds.
+
+    :param bounds: increasing upper bounds of the buckets, values above the last one go to the overflow bucket
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, bounds: Optional[Sequence[float]] = None):
+        self.bounds: Sequence[float] = DEFAULT_BOUNDS if bounds is None else bounds
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'LatencyHistogram'):
+        if other.bounds is not self.bounds and list(other.bounds) != list(self.bounds):
+            raise ValueError('Can not merge histograms with different buckets')
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """
+        Estimated q-quantile (0..1), linear interpolation inside the bucket. NaN when empty.
+        """
+        if not self.count:
+            return math.nan
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if not c:
+                continue
+            if seen + c >= rank:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max
+                return min(lower + (upper - lower) * max(0.0, rank - seen) / c, self.max)
+            seen += c
+        return self.max
+
+    def to_dict(self, with_buckets: bool = False) -> Dict[str, object]:
+        """Summary in milliseconds: count, mean, p50, p95, p99 and max (plus non empty buckets if requested)."""
+        out = {'count': self.count,
+               'mean_ms': self.sum / self.count * 1000 if self.count else None,
+               'p50_ms': self.percentile(0.5) * 1000 if self.count else None,
+               'p95_ms': self.percentile(0.95) * 1000 if self.count else None,
+               'p99_ms': self.percentile(0.99) * 1000 if self.count else None,
+               'max_ms': self.max * 1000 if self.count else None}
+        if with_buckets:
+            out['buckets'] = {(f'{self.bounds[i] * 1000:.4g}' if i < len(self.bounds) else 'inf'): c
+                              for i, c in enumerate(self.counts) if c}
+        return out
@@ -0,0 +1,292 @@
+"""Out-of-band store for large values.
+
+Big payloads (camera frames, long arrays, plan documents) should not travel
+inline through ``Value`` objects: every layer of the tree, the cache and
+``Value.copy()`` in the conditional freezer would carry or copy them. When
+the store is enabled, ``TreeCache`` writes payloads above ``threshold`` bytes
+once into a memory mapped spool file and keeps in the ``Value`` only a small
+handle dict::
+
+    {'__large_value__': '<handle>', 'nbytes': 67108864, 'encoding': 'imagebytes', 'meta': {...}}
+
+Clients fetch the bytes with the router service command ``fetch_large_value``
+which answers with a header frame followed by the payload split in chunks
+(one ZMQ frame per chunk).
+
+The spool is a ring: new objects are appended after the previous one and the
+oldest objects overlapping the written region are evicted, so the total size
+of stored objects never exceeds the spool size. A handle of an evicted object
+is simply unknown to the store, the cache then treats the value as expired
+and asks the device again.
+"""
+from __future__ import annotations
+
+import itertools
+import logging
+import mmap
+import os
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Iterator, List, Optional, Tuple
+
+import confuse
+
+from obsrv.ob_config import SingletonConfig
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+LARGE_VALUE_KEY = '__large_value__'
+
+ENCODING_RAW = 'raw'
+ENCODING_STR = 'utf-8'
+ENCODING_MSGPACK = 'msgpack'
+ENCODING_IMAGEBYTES = 'imagebytes'
+
+
+_SCALARS = frozenset({int, bool, float, type(None)})
+
+
+def _packed_size_lower_bound(v: Any, limit: int) -> int:
+    """
+    Lower bound of the msgpack size of v in bytes. Element types of containers are checked at C speed, so big
+    arrays of numbers are never walked in Python, and the walk of nested containers stops as soon as the bound
+    reaches limit.
+    """
+    if isinstance(v, (str, bytes, bytearray)):
+        return len(v) + 1
+    if isinstance(v, float):
+        return 9
+    if isinstance(v, dict):
+        v = [*v.keys(), *v.values()]
+    elif not isinstance(v, (list, tuple)):
+        return 1
+    types = list(map(type, v))
+    n = 1 + len(v) + 8 * types.count(float)  # every element takes at least one byte, a float nine
+    if _SCALARS.issuperset(types):
+        return n
+    for item, t in zip(v, types):
+        if n >= limit:
+            break
+        if t not in _SCALARS:
+            n += _packed_size_lower_bound(item, limit - n + 1) - 1  # its first byte is already counted
+    return n
+
+
+@dataclass
+class _StoredObject:
+    offset: int
+    nbytes: int
+    encoding: str
+    meta: dict = field(default_factory=dict)
+
+
+class LargeValueStore:
+    """
+    Ring spool of large payloads addressed by handles.
+
+    :param spool_size: size of the spool file in bytes, maximum total size of stored objects
+    :param threshold: payloads of at least this size (bytes) are moved to the store
+    :param path: spool file path, by default an anonymous file in /dev/shm (or the temp dir)
+    :param chunk_size: size of chunks returned by :meth:`iter_chunks`
+    :param max_chunks: maximum number of chunks returned by one :meth:`fetch`
+    """
+
+    def __init__(self, spool_size: int = 512 * 1024 * 1024, threshold: int = 1024 * 1024, path: str = None,
+                 chunk_size: int = 1024 * 1024, max_chunks: int = 64):
+        if spool_size <= 0 or threshold <= 0 or chunk_size <= 0 or max_chunks <= 0:
+            raise ValueError('spool_size, threshold, chunk_size and max_chunks must be positive')
+        self.threshold = int(threshold)
+        self.chunk_size = int(chunk_size)
+        self.max_chunks = int(max_chunks)
+        self._spool_size = int(spool_size)
+        if path:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        else:
+            directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            fd, path = tempfile.mkstemp(prefix='ocabox_spool_', dir=directory)
+            os.unlink(path)  # anonymous, released with the mapping
+        try:
+            os.ftruncate(fd, self._spool_size)
+            self._mm = mmap.mmap(fd, self._spool_size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+        self._objects: OrderedDict[str, _StoredObject] = OrderedDict()  # oldest first
+        self._write_pos = 0
+        self._total_bytes = 0
+        self._ids = itertools.count(1)
+        self._prefix = f'{os.getpid():x}.{id(self) & 0xffff:x}'
+        self.evicted_count = 0
+
+    @property
+    def total_bytes(self) -> int:
+        """Total size of payloads currently held by the store."""
+        return self._total_bytes
+
+    def __len__(self) -> int:
+        return len(self._objects)
+
+    def __contains__(self, handle: str) -> bool:
+        return handle in self._objects
+
+    # ------------------------------------------------------------------ offloading
+
+    def offload(self, v: Any) -> Optional[dict]:
+        """
+        Move the value to the store if it is large enough.
+
+        :param v: python value (``Value.v``)
+        :return: handle dict to put in the ``Value`` instead of v or None if the value stays inline
+        """
+        prepared = self._prepare(v)
+        if prepared is None:
+            return None
+        parts, nbytes, encoding, meta = prepared
+        if nbytes > self._spool_size:
+            logger.warning(f'Value of {nbytes} B is larger than spool ({self._spool_size} B), it stays inline')
+            return None
+        handle = self._put(parts, nbytes, encoding, meta)
+        return {LARGE_VALUE_KEY: handle, 'nbytes': nbytes, 'encoding': encoding, 'meta': meta}
+
+    def _prepare(self, v: Any) -> Optional[Tuple[List[Any], int, str, dict]]:
+        """Return (buffers, size, encoding, meta) for values that should be offloaded, None otherwise."""
+        threshold = self.threshold
+        if isinstance(v, (bytes, bytearray, memoryview)):
+            nbytes = memoryview(v).nbytes
+            return ([v], nbytes, ENCODING_RAW, {}) if nbytes >= threshold else None
+        if isinstance(v, str):
+            # len() is a lower bound of utf-8 size, encode only when it can pass the threshold
+            if len(v) * 4 < threshold:
+                return None
+            b = v.encode('utf-8')
+            return ([b], len(b), ENCODING_STR, {}) if len(b) >= threshold else None
+        if isinstance(v, dict) and v.get('format') == ENCODING_IMAGEBYTES and isinstance(v.get('chunks'), list):
+            nbytes = sum(len(c) for c in v['chunks'])
+            if nbytes < threshold:
+                return None
+            meta = {k: i for k, i in v.items() if k != 'chunks'}
+            return list(v['chunks']), nbytes, ENCODING_IMAGEBYTES, meta
+        if isinstance(v, (list, tuple, dict)):
+            # nested lists (JSON image arrays) and documents are packed to measure them only when they can pass
+            if _packed_size_lower_bound(v, threshold) < threshold:
+                return None
+            from obcom.comunication.message_serializer import MessageSerializer
+            b = MessageSerializer.pack_b(v)
+            return ([b], len(b), ENCODING_MSGPACK, {}) if len(b) >= threshold else None
+        return None
+
+    def _put(self, parts: List[Any], nbytes: int, encoding: str, meta: dict) -> str:
+        if self._write_pos + nbytes > self._spool_size:
+            # objects left in the unused tail are the oldest ones, drop them before starting next lap
+            self._evict_overlapping(self._write_pos, self._spool_size)
+            self._write_pos = 0
+        start = self._write_pos
+        end = start + nbytes
+        self._evict_overlapping(start, end)
+        pos = start
+        for part in parts:
+            mv = memoryview(part).cast('B')
+            self._mm[pos:pos + mv.nbytes] = mv
+            pos += mv.nbytes
+        handle = f'{self._prefix}.{next(self._ids):x}'
+        self._objects[handle] = _StoredObject(offset=start, nbytes=nbytes, encoding=encoding, meta=meta)
+        self._total_bytes += nbytes
+        self._write_pos = end
+        return handle
+
+    def _evict_overlapping(self, start: int, end: int):
+        # objects are laid out in ring order, so the ones overlapping the new region are always the oldest
+        while self._objects:
+            handle, obj = next(iter(self._objects.items()))
+            if obj.offset < end and start < obj.offset + obj.nbytes:
+                self._objects.popitem(last=False)
+                self._total_bytes -= obj.nbytes
+                self.evicted_count += 1
+            else:
+                break
+
+    # ------------------------------------------------------------------ reading
+
+    @staticmethod
+    def get_handle(v: Any) -> Optional[str]:
+        """Return handle if v is a handle dict made by :meth:`offload`, otherwise None."""
+        if isinstance(v, dict):
+            return v.get(LARGE_VALUE_KEY)
+        return None
+
+    def is_alive(self, v: Any) -> bool:
+        """False if v is a handle dict whose object was already evicted."""
+        handle = self.get_handle(v)
+        return handle is None or handle in self._objects
+
+    def describe(self, handle: str) -> Optional[dict]:
+        obj = self._objects.get(handle)
+        if obj is None:
+            return None
+        return {'handle': handle, 'nbytes': obj.nbytes, 'encoding': obj.encoding, 'meta': obj.meta,
+                'chunk_size': self.chunk_size}
+
+    def iter_chunks(self, handle: str, offset: int = 0, length: int = None) -> Iterator[bytes]:
+        """
+        Yield the payload (or its part) in chunks of chunk_size bytes. Chunks are copies, they stay valid after the
+        object is evicted.
+
+        :raise KeyError: when handle is unknown (never stored or evicted)
+        """
+        obj = self._objects[handle]
+        offset = max(0, int(offset))
+        end = obj.nbytes if length is None else min(obj.nbytes, offset + int(length))
+        pos = obj.offset + offset
+        stop = obj.offset + end
+        while pos < stop:
+            n = min(self.chunk_size, stop - pos)
+            yield self._mm[pos:pos + n]
+            pos += n
+
+    def fetch(self, handle: str, offset: int = 0, length: int = None) -> Tuple[List[bytes], Optional[int]]:
+        """
+        Return up to max_chunks chunks of the payload (or its part) and the offset where the next fetch continues,
+        None when the requested range was returned whole.
+
+        :raise KeyError: when handle is unknown (never stored or evicted)
+        :raise ValueError: when offset or length is not a non-negative integer
+        """
+        for name, n in (('offset', offset), ('length', length)):
+            if n is not None and (not isinstance(n, int) or isinstance(n, bool) or n < 0):
+                raise ValueError(f'{name} must be a non-negative integer, got {n!r}')
+        obj = self._objects[handle]
+        end = obj.nbytes if length is None else min(obj.nbytes, offset + length)
+        limit = offset + self.max_chunks * self.chunk_size
+        if end <= limit:
+            return list(self.iter_chunks(handle, offset=offset, length=end - offset)), None
+        return list(self.iter_chunks(handle, offset=offset, length=limit - offset)), limit
+
+    def read(self, handle: str) -> bytes:
+        """Return whole payload, see :meth:`iter_chunks`."""
+        return b''.join(self.iter_chunks(handle))
+
+    def close(self):
+        self._objects.clear()
+        self._total_bytes = 0
+        self._mm.close()
+
+
+def create_large_value_store_from_config() -> Optional[LargeValueStore]:
+    """Create store from the 'large_values' configuration section or return None if it is disabled."""
+    try:
+        cfg = SingletonConfig.get_config()['large_values'].get()
+    except confuse.exceptions.NotFoundError:
+        return None
+    if not cfg or not cfg.get('enabled', False):
+        return None
+    try:
+        store = LargeValueStore(spool_size=cfg.get('spool_size', 512 * 1024 * 1024),
+                                threshold=cfg.get('threshold', 1024 * 1024),
+                                path=cfg.get('spool_path'),
+                                chunk_size=cfg.get('chunk_size', 1024 * 1024),
+                                max_chunks=cfg.get('max_chunks_per_reply', 64))
+    except (OSError, ValueError) as e:
+        logger.error(f'Can not create large value store: {e}')
+        return None
+    logger.info(f'Large value store enabled, values from {store.threshold} B are kept out of band')
+    return store
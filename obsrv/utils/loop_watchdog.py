@@ -0,0 +1,194 @@
+"""
+Watchdog of the asyncio event loop: finds out what blocks it.
+
+The loop runs a heartbeat callback every ``threshold / 4`` seconds. A daemon thread checks the time of the last
+heartbeat and when the loop has not turned for ``threshold`` seconds it captures the current Python stack of the loop
+thread (``sys._current_frames``) - the code which holds the loop at that moment, e.g. an astropy computation, a
+synchronous YAML reload or a big JSON decode. Stalls are aggregated by stack into a top-N report of loop blockers
+with count, total and maximum stall time.
+
+Exposed as a warning log line per stall, the ``ocabox_loop_stalls_total`` / ``ocabox_loop_stall_seconds`` metrics
+and the ``loop_stalls`` router command. Opt-in via the ``loop_watchdog`` config section.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Dict, List, Optional, Tuple
+
+from obsrv.utils import metrics
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+_STALLS = metrics.counter('ocabox_loop_stalls_total', 'Event loop stalls longer than the watchdog threshold')
+_STALL_SECONDS = metrics.histogram('ocabox_loop_stall_seconds', 'Duration of event loop stalls',
+                                   buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+_StackKey = Tuple[Tuple[str, int, str], ...]
+
+
+class _Blocker:
+    __slots__ = ('stack', 'count', 'total', 'max', 'last')
+
+    def __init__(self, stack: List[str]):
+        self.stack = stack
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+
+class LoopWatchdog:
+    """
+    Detects stalls of the event loop and aggregates stacks of the loop thread captured during them.
+
+    :param loop: watched loop
+    :param threshold: loop not turning for this many seconds is a stall
+    :param stack_depth: innermost frames kept from a captured stack
+    :param max_blockers: number of distinct stacks remembered, the least seen are dropped
+    :param report_interval: seconds between logged top blockers reports (only after new stalls), 0 disables them
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float = 0.25, stack_depth: int = 15,
+                 max_blockers: int = 100, report_interval: float = 600.0):
+        self.loop = loop
+        self.threshold = float(threshold)
+        self.stack_depth = int(stack_depth)
+        self.max_blockers = int(max_blockers)
+        self.report_interval = float(report_interval)
+        self._interval = max(0.005, self.threshold / 4)
+        self._last_beat: Optional[float] = None
+        self._loop_thread: Optional[int] = None
+        self._beat_handle: Optional[asyncio.Handle] = None
+        self._blockers: Dict[_StackKey, _Blocker] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._m_stalls = _STALLS.labels()
+        self._m_stall_seconds = _STALL_SECONDS.labels()
+        self.stalls = 0
+
+    def start(self):
+        """Start watching, can be called before the loop runs (the watch starts with the first heartbeat)."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self.loop.call_soon_threadsafe(self._beat)
+        self._thread = threading.Thread(target=self._watch, name='loop_watchdog', daemon=True)
+        self._thread.start()
+        logger.info(f'Event loop watchdog started, threshold {self.threshold * 1000:.0f} ms')
+
+    def stop(self):
+        self._stop.set()
+        if self._beat_handle is not None:
+            self._beat_handle.cancel()
+            self._beat_handle = None
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+        self._thread = None
+
+    def _beat(self):
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        if not self._stop.is_set():
+            self._beat_handle = self.loop.call_later(self._interval, self._beat)
+
+    def _watch(self):
+        stall_beat: Optional[float] = None  # heartbeat before the current stall
+        stall_key: Optional[_StackKey] = None
+        next_report, reported_stalls = time.monotonic() + self.report_interval, 0
+        while not self._stop.wait(self._interval / 2):
+            if self.report_interval and time.monotonic() >= next_report:
+                if self.stalls != reported_stalls:
+                    self.log_report()
+                next_report, reported_stalls = time.monotonic() + self.report_interval, self.stalls
+            last = self._last_beat
+            if last is None:
+                continue
+            if stall_beat is not None and last != stall_beat:
+                # the loop turned again
+                self._finish_stall(stall_key, last - stall_beat - self._interval)
+                stall_beat = stall_key = None
+            if stall_beat is None and time.monotonic() - last > self.threshold + self._interval \
+                    and self.loop.is_running():
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is None:
+                    continue
+                stall_beat = last
+                stall_key = self._capture(frame)
+                del frame
+
+    def _capture(self, frame) -> _StackKey:
+        summary = traceback.extract_stack(frame)[-self.stack_depth:]
+        key = tuple((f.filename, f.lineno, f.name) for f in summary)
+        with self._lock:
+            blocker = self._blockers.get(key)
+            if blocker is None:
+                if len(self._blockers) >= self.max_blockers:
+                    del self._blockers[min(self._blockers, key=lambda k: self._blockers[k].count)]
+                blocker = self._blockers[key] = _Blocker([f'{_short_path(f.filename)}:{f.lineno} in {f.name}'
+                                                          for f in summary])
+        logger.warning(f'Event loop blocked for over {self.threshold * 1000:.0f} ms in '
+                       f'{blocker.stack[-1] if blocker.stack else "?"}')
+        return key
+
+    def _finish_stall(self, key: _StackKey, duration: float):
+        duration = max(duration, self.threshold)
+        self.stalls += 1
+        self._m_stalls.inc()
+        self._m_stall_seconds.observe(duration)
+        with self._lock:
+            blocker = self._blockers.get(key)
+            if blocker is not None:
+                blocker.count += 1
+                blocker.total += duration
+                blocker.max = max(blocker.max, duration)
+                blocker.last = time.time()
+        logger.warning(f'Event loop was blocked for {duration * 1000:.0f} ms')
+
+    def report(self, top: int = 10) -> List[dict]:
+        """Loop blockers with the longest total stall time first, stacks innermost frame last."""
+        with self._lock:
+            blockers = sorted(self._blockers.values(), key=lambda b: b.total, reverse=True)[:top]
+            return [{'stack': list(b.stack), 'count': b.count, 'total_s': b.total, 'max_s': b.max, 'last': b.last}
+                    for b in blockers if b.count]
+
+    def log_report(self, top: int = 5):
+        for i, b in enumerate(self.report(top), 1):
+            logger.warning(f'Loop blocker #{i}: {b["count"]} stalls, total {b["total_s"]:.2f} s, max '
+                           f'{b["max_s"]:.2f} s at {" <- ".join(reversed(b["stack"][-3:]))}')
+
+    def reset(self):
+        with self._lock:
+            self._blockers.clear()
+
+
+def _short_path(filename: str) -> str:
+    """Path relative to site-packages or from the package directory, full path otherwise."""
+    i = filename.rfind(f'{os.sep}site-packages{os.sep}')
+    if i >= 0:
+        return filename[i + len('site-packages') + 2:]
+    i = filename.rfind(f'{os.sep}obsrv{os.sep}')
+    return filename[i + 1:] if i >= 0 else filename
+
+
+_watchdog: Optional[LoopWatchdog] = None
+
+
+def get_loop_watchdog() -> Optional[LoopWatchdog]:
+    """Running watchdog of the server loop, None when not enabled."""
+    return _watchdog
+
+
+def schedule_loop_watchdog(loop: asyncio.AbstractEventLoop, threshold: float = 0.25, stack_depth: int = 15,
+                           report_interval: float = 600.0) -> LoopWatchdog:
+    """Start the watchdog of the server loop (safe before ``loop.run_until_complete``)."""
+    global _watchdog
+    if _watchdog is not None:
+        _watchdog.stop()
+    _watchdog = LoopWatchdog(loop, threshold=threshold, stack_depth=stack_depth, report_interval=report_interval)
+    _watchdog.start()
+    return _watchdog
@@ -0,0 +1,400 @@
+"""
+Server metrics: counters, gauges and histograms exported in the Prometheus text format.
+
+Metrics are declared once (module level or ``__init__``) and hot paths keep the labelled child returned by
+``labels()``, so recording is an attribute increment or a bucket increment without any lookup::
+
+    _REQUESTS = metrics.counter('ocabox_router_requests_total', 'Messages received by the router', ('router', 'kind'))
+    ...
+    self._m_requests = _REQUESTS.labels(self.name, 'request')  # preallocated
+    ...
+    self._m_requests.inc()
+
+Values kept anyway by other modules (cache hit counters, breaker states, request queues, connection pools, process
+statistics) are not duplicated but read by collectors when the metrics are scraped.
+
+``MetricsExporter`` (``metrics`` config section, opt-in) serves ``/metrics`` on a local HTTP port and optionally
+publishes a snapshot to NATS periodically.
+"""
+import asyncio
+import gc
+import logging
+import math
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import confuse
+
+from obsrv.ob_config import SingletonConfig
+from obsrv.utils.histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# seconds, Prometheus 'le' buckets of histogram metrics
+DEFAULT_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                                      30.0, 60.0)
+
+# (labels, value) samples of one metric family; for histograms the value is a LatencyHistogram
+Sample = Tuple[Dict[str, str], object]
+# name, type, help, samples
+Family = Tuple[str, str, str, List[Sample]]
+
+
+class CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+
+class GaugeChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+
+class Metric:
+    """
+    Family of one metric, children per label values.
+
+    :param name: metric name, e.g. 'ocabox_router_requests_total'
+    :param help_: description
+    :param type_: COUNTER, GAUGE or HISTOGRAM
+    :param label_names: names of labels, values are given to ``labels()``
+    :param buckets: upper bounds of histogram buckets (s)
+    """
+
+    def __init__(self, name: str, help_: str, type_: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.type = type_
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Child of the label values, created on the first call; keep it for recording on hot paths."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f'{self.name} expects labels {self.label_names}, got {values}')
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def _new_child(self):
+        if self.type == COUNTER:
+            return CounterChild()
+        if self.type == GAUGE:
+            return GaugeChild()
+        return LatencyHistogram(self.buckets)
+
+    def remove(self, *values):
+        self._children.pop(tuple(str(v) for v in values), None)
+
+    def collect(self) -> Family:
+        samples = []
+        for key, child in list(self._children.items()):
+            labels = dict(zip(self.label_names, key))
+            samples.append((labels, child if self.type == HISTOGRAM else child.value))
+        return self.name, self.type, self.help, samples
+
+
+class MetricsRegistry:
+    """Declared metrics and collectors of values owned by other modules."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+        self._lock = threading.Lock()
+
+    def _metric(self, name: str, help_: str, type_: str, label_names: Sequence[str], **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = Metric(name, help_, type_, label_names, **kwargs)
+            elif metric.type != type_ or metric.label_names != tuple(label_names):
+                raise ValueError(f'Metric {name} is already declared as {metric.type} {metric.label_names}')
+        return metric
+
+    def counter(self, name: str, help_: str, label_names: Sequence[str] = ()) -> Metric:
+        return self._metric(name, help_, COUNTER, label_names)
+
+    def gauge(self, name: str, help_: str, label_names: Sequence[str] = ()) -> Metric:
+        return self._metric(name, help_, GAUGE, label_names)
+
+    def histogram(self, name: str, help_: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Metric:
+        return self._metric(name, help_, HISTOGRAM, label_names, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        """Function called on every scrape, returns metric families (name, type, help, samples)."""
+        if collector not in self._collectors:
+            self._collectors.append(collector)
+
+    def collect(self) -> List[Family]:
+        families = [m.collect() for m in list(self._metrics.values())]
+        for collector in list(self._collectors):
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.warning(f'Metrics collector {getattr(collector, "__name__", collector)} failed: {e}')
+        return families
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for name, type_, help_, samples in self.collect():
+            if not samples:
+                continue
+            lines.append(f'# HELP {name} {_escape_help(help_)}')
+            lines.append(f'# TYPE {name} {type_}')
+            for labels, value in samples:
+                if type_ == HISTOGRAM:
+                    lines.extend(_render_histogram(name, labels, value))
+                else:
+                    lines.append(f'{name}{_render_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, list]:
+        """Serializable values for publishing: {name: [{'labels': {...}, 'value': v}, ...]}, histograms summarized."""
+        out = {}
+        for name, type_, _, samples in self.collect():
+            if not samples:
+                continue
+            out[name] = [{'labels': labels,
+                          'value': value.to_dict() if type_ == HISTOGRAM else value} for labels, value in samples]
+        return out
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _render_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+    return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels.keys(), escaped)) + '}'
+
+
+def _format_value(value) -> str:
+    value = float(value)
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _render_histogram(name: str, labels: Dict[str, str], h: LatencyHistogram) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(h.bounds, h.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{_render_labels({**labels, "le": repr(float(bound))})} {cumulative}')
+    lines.append(f'{name}_bucket{_render_labels({**labels, "le": "+Inf"})} {h.count}')
+    lines.append(f'{name}_sum{_render_labels(labels)} {_format_value(float(h.sum))}')
+    lines.append(f'{name}_count{_render_labels(labels)} {h.count}')
+    return lines
+
+
+REGISTRY = MetricsRegistry()
+
+
+def counter(name: str, help_: str, label_names: Sequence[str] = ()) -> Metric:
+    """Counter of the server registry (the same object for the same name)."""
+    return REGISTRY.counter(name, help_, label_names)
+
+
+def gauge(name: str, help_: str, label_names: Sequence[str] = ()) -> Metric:
+    """Gauge of the server registry (the same object for the same name)."""
+    return REGISTRY.gauge(name, help_, label_names)
+
+
+def histogram(name: str, help_: str, label_names: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Metric:
+    """Histogram (seconds) of the server registry (the same object for the same name)."""
+    return REGISTRY.histogram(name, help_, label_names, buckets)
+
+
+# ---------------------------------------------------------------- collectors of values owned by other modules
+
+
+def _process_families() -> Iterable[Family]:
+    families = [('ocabox_gc_collections_total', COUNTER, 'Garbage collections per generation',
+                 [({'generation': str(i)}, s.get('collections', 0)) for i, s in enumerate(gc.get_stats())])]
+    try:
+        families.append(('ocabox_asyncio_tasks', GAUGE, 'Tasks of the event loop',
+                         [({}, len(asyncio.all_tasks()))]))
+    except RuntimeError:
+        pass  # scraped without a running loop
+    try:
+        with open('/proc/self/status') as f:
+            rss = next((int(line.split()[1]) for line in f if line.startswith('VmRSS:')), None)
+        if rss is not None:
+            families.append(('ocabox_resident_memory_bytes', GAUGE, 'Resident set size', [({}, rss * 1024)]))
+        families.append(('ocabox_open_fds', GAUGE, 'Open file descriptors',
+                         [({}, len(os.listdir('/proc/self/fd')))]))
+    except (OSError, ValueError):
+        pass  # not Linux
+    return families
+
+
+_BREAKER_STATE = {'closed': 0, 'half_open': 1, 'open': 2}
+
+
+def _connector_families() -> Iterable[Family]:
+    from obsrv.protocols.connector_registry import ConnectorRegistry
+    registry = ConnectorRegistry()
+    breakers = registry.circuit_breaker_states()
+    pools = registry.pool_stats()
+    return [
+        ('ocabox_circuit_breaker_state', GAUGE, 'Breaker state of the server (0 closed, 1 half open, 2 open)',
+         [({'host': host}, _BREAKER_STATE.get(s['state'], -1)) for host, s in sorted(breakers.items())]),
+        ('ocabox_circuit_breaker_opened_total', COUNTER, 'Times the breaker of the server opened',
+         [({'host': host}, s['open_count']) for host, s in sorted(breakers.items())]),
+        ('ocabox_pool_connections', GAUGE, 'Connections of the pool of the server',
+         [({'host': host}, s['size']) for host, s in sorted(pools.items())]),
+        ('ocabox_pool_connections_in_use', GAUGE, 'Connections of the pool currently lent to requests',
+         [({'host': host}, s['in_use']) for host, s in sorted(pools.items())]),
+    ] + _admission_families(breakers)
+
+
+def _admission_families(breakers: Dict[str, dict]) -> List[Family]:
+    from obsrv.telescope_devices.request_queue import queue_stats
+    queues = queue_stats()
+    rejections = [({'reason': 'circuit_open', 'target': host}, s['rejected']) for host, s in sorted(breakers.items())]
+    rejections += [({'reason': 'queue_timeout', 'target': name}, s['timeouts']) for name, s in sorted(queues.items())]
+    return [
+        ('ocabox_admission_rejections_total', COUNTER, 'Requests rejected without being sent to the device',
+         rejections),
+        ('ocabox_request_queue_active', GAUGE, 'Requests being sent by the device queue',
+         [({'queue': name}, s['active']) for name, s in sorted(queues.items())]),
+        ('ocabox_request_queue_limit', GAUGE, 'Concurrent requests allowed by the device queue',
+         [({'queue': name}, s['limit']) for name, s in sorted(queues.items())]),
+        ('ocabox_request_queue_depth', GAUGE, 'Requests waiting in the device queue',
+         [({'queue': name}, s['depth']) for name, s in sorted(queues.items())]),
+    ]
+
+
+def _cache_families() -> Iterable[Family]:
+    from obsrv.tree_components.specialized_components.tree_cache_observatory import cache_stats
+    stats = sorted(cache_stats().items())
+    lookups = [({'cache': name, 'result': result}, s[key])
+               for name, s in stats for result, key in (('hit', 'hits'), ('coalesced', 'shared'), ('miss', 'misses'))]
+    return [('ocabox_cache_lookups_total', COUNTER, 'GET lookups of the cache by result', lookups),
+            ('ocabox_cache_values', GAUGE, 'Values known to the cache',
+             [({'cache': name}, s['values']) for name, s in stats])]
+
+
+def register_default_collectors(registry: MetricsRegistry = REGISTRY):
+    for collector in (_process_families, _connector_families, _cache_families):
+        registry.add_collector(collector)
+
+
+# ---------------------------------------------------------------- export
+
+
+class MetricsExporter:
+    """
+    HTTP endpoint with the Prometheus text of the registry and optional periodic publishing to NATS.
+
+    :param host: interface of the HTTP endpoint, local only by default
+    :param port: port of the HTTP endpoint, None disables it
+    :param path: URL path of the endpoint
+    :param nats_subject: NATS subject of published snapshots, None disables publishing
+    :param publish_interval: seconds between published snapshots
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: Optional[int] = 9108, path: str = '/metrics',
+                 nats_subject: Optional[str] = None, publish_interval: float = 60.0,
+                 registry: MetricsRegistry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.nats_subject = nats_subject
+        self.publish_interval = publish_interval
+        self.registry = registry
+        self._runner = None
+        self._publish_task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls) -> Optional['MetricsExporter']:
+        """Exporter described by the 'metrics' configuration section, None when disabled or missing."""
+        try:
+            cfg = SingletonConfig.get_config()['metrics'].get()
+        except confuse.exceptions.NotFoundError:
+            return None
+        if not cfg or not cfg.get('enabled', False):
+            return None
+        return cls(host=cfg.get('host', '127.0.0.1'), port=cfg.get('port', 9108), path=cfg.get('path', '/metrics'),
+                   nats_subject=cfg.get('nats_subject'), publish_interval=cfg.get('publish_interval', 60.0))
+
+    async def start(self):
+        register_default_collectors(self.registry)
+        if self.port is not None:
+            from aiohttp import web
+            app = web.Application()
+            app.router.add_get(self.path, self._handle)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, self.host, self.port)
+            await site.start()
+            if not self.port:
+                self.port = self._runner.addresses[0][1]
+            logger.info(f'Metrics served on http://{self.host}:{self.port}{self.path}')
+        if self.nats_subject:
+            self._publish_task = asyncio.create_task(self._publish_loop(), name='metrics_publisher')
+
+    async def stop(self):
+        if self._publish_task is not None:
+            self._publish_task.cancel()
+            await asyncio.gather(self._publish_task, return_exceptions=True)
+            self._publish_task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        from aiohttp import web
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def _publish_loop(self):
+        from serverish.base import MessengerNotConnected, dt_utcnow_array
+        from serverish.messenger import get_publisher
+        publisher = get_publisher(self.nats_subject)
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                await publisher.publish(data={'published': dt_utcnow_array(), 'metrics': self.registry.snapshot()},
+                                        meta={'message_type': 'telemetry', 'tags': ['metrics'],
+                                              'sender': 'Ocabox server'})
+            except (MessengerNotConnected, asyncio.TimeoutError) as e:
+                logger.warning(f'Can not publish metrics to nats: {e}')
+            except Exception as e:
+                logger.error(f'Publishing metrics failed: {e}')
@@ -14,6 +14,8 @@ Periodically samples the live process and emits a single-line WARNING with:
          tcp[STATE=count, ...]
          tasks=K gc=(g0,g1,g2 coll=Total)
          top_peers=ip:port×count, ...
+         breakers=host:state, ...   (only servers whose breaker is not closed)
+         queues=device:running/queued, ...   (only device request queues with waiting requests)
 
 Linux-only (reads `/proc/self/fd`, `/proc/self/net/{tcp,tcp6}`,
 `/proc/self/status`); on other platforms it skips with a one-line warning and
@@ -26,6 +28,8 @@ Hypothesis checks (look for spikes correlated with cascade ERRORs):
 - `gc=(...)` showing high gen-2 generation pressure → GC pauses → stalls.
 - `top_peers` dominated by one host with `SYN_SENT`/`CLOSE_WAIT` entries →
   socket pile-up to a dead host.
+- `breakers` listing many hosts at once → the outage is on our side (loop,
+  network), not in the Alpaca servers.
 
 Wire-up (one line in `main.py`, just before `loop.run_until_complete(...)`):
 
@@ -154,6 +158,26 @@ def _read_proc_net_tcp(path: str) -> tuple[Counter, Counter]:
     return states, peers
 
 
+def _breakers_summary() -> str:
+    try:
+        from obsrv.protocols.connector_registry import ConnectorRegistry
+        states = ConnectorRegistry().circuit_breaker_states()
+    except Exception:
+        return "?"
+    return ",".join(f"{host}:{s['state']}" for host, s in sorted(states.items())
+                    if s['state'] != 'closed') or "-"
+
+
+def _queues_summary() -> str:
+    try:
+        from obsrv.telescope_devices.request_queue import queue_stats
+        stats = queue_stats()
+    except Exception:
+        return "?"
+    return ",".join(f"{name}:{s['active']}/{s['depth']}" for name, s in sorted(stats.items())
+                    if s['depth']) or "-"
+
+
 def _snapshot(peak_lag_ms: float) -> str:
     fds, sockets = _count_fds()
     try:
@@ -176,7 +200,8 @@ def _snapshot(peak_lag_ms: float) -> str:
     return (f"DIAG fds={fds} (sockets={sockets}, limit={limit_str}) "
             f"rss={rss_str} lag_ms={peak_lag_ms:.1f} "
             f"tcp[{state_str}] tasks={n_tasks} gc=({_gc_summary()}) "
-            f"top_peers={top_peers}")
+            f"top_peers={top_peers} breakers={_breakers_summary()} "
+            f"queues={_queues_summary()}")
 
 
 async def _diag_loop(interval: float) -> None:
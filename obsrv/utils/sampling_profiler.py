@@ -0,0 +1,232 @@
+"""
+Statistical profiler of the running server, started and stopped by the ``start_profiler`` / ``stop_profiler``
+router commands.
+
+A daemon thread samples the Python stack of the event loop thread (or of all threads) every ``interval`` seconds
+with ``sys._current_frames`` - no tracing hooks, so the overhead is a stack walk per sample and the server does not
+need to be restarted under a profiler. Samples are aggregated into collapsed stacks (``root;caller;callee count``
+lines, the input of ``flamegraph.pl``, speedscope or inferno), written to a file when the profile ends and optionally
+returned to the client.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType
+from typing import Dict, List, Optional
+
+import confuse
+
+from obsrv.ob_config import SingletonConfig
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+DEFAULT_INTERVAL = 0.01
+DEFAULT_MAX_DURATION = 300.0
+DEFAULT_OUTPUT_DIR = '/tmp'
+
+
+def _frame_name(code: CodeType) -> str:
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f'{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+class ProfileResult:
+    """Aggregated samples of one profile."""
+
+    def __init__(self, stacks: Counter, samples: int, start: float, duration: float, interval: float):
+        self.stacks = stacks
+        self.samples = samples
+        self.start = start
+        self.duration = duration
+        self.interval = interval
+        self.file: Optional[str] = None
+
+    def to_folded(self) -> str:
+        """Collapsed stacks, one 'frame;frame;frame count' line per distinct stack."""
+        lines = []
+        for key, count in self.stacks.most_common():
+            thread, codes = key[0], key[1:]
+            frames = ([thread] if thread else []) + [_frame_name(c) for c in codes]
+            lines.append(f'{";".join(f.replace(";", ":") for f in frames)} {count}')
+        return '\n'.join(lines) + ('\n' if lines else '')
+
+    def top(self, n: int = 10) -> List[dict]:
+        """Functions with the most samples on top of the stack ('self') and anywhere in the stack ('total')."""
+        own: Counter = Counter()
+        total: Counter = Counter()
+        for key, count in self.stacks.items():
+            codes = key[1:]
+            if codes:
+                own[codes[-1]] += count
+            for code in set(codes):
+                total[code] += count
+        return [{'function': _frame_name(code), 'self': own[code], 'total': total[code],
+                 'self_ratio': own[code] / self.samples if self.samples else 0.0}
+                for code, _ in own.most_common(n)]
+
+    def write(self, path: str) -> str:
+        with open(path, 'w') as f:
+            f.write(self.to_folded())
+        self.file = path
+        return path
+
+    def summary(self, top: int = 10) -> dict:
+        return {'samples': self.samples, 'duration': self.duration, 'interval': self.interval, 'start': self.start,
+                'stacks': len(self.stacks), 'file': self.file, 'top': self.top(top)}
+
+
+class SamplingProfiler:
+    """
+    Sampler of Python stacks.
+
+    :param interval: seconds between samples
+    :param thread_id: sampled thread, the thread creating the profiler by default (the event loop thread)
+    :param all_threads: sample every thread except the sampler, stacks are prefixed by the thread name
+    :param max_depth: innermost frames kept from a stack
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, thread_id: Optional[int] = None, all_threads: bool = False,
+                 max_depth: int = 128):
+        self.interval = max(0.001, float(interval))
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.all_threads = all_threads
+        self.max_depth = max_depth
+        self.result: Optional[ProfileResult] = None
+        self.output: Optional[str] = None
+        self._stacks: Counter = Counter()  # (thread name or None, code objects root first) -> samples
+        self._samples = 0
+        self._start = 0.0
+        self._start_wall = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: Optional[float] = None, output: Optional[str] = None):
+        """
+        Start sampling.
+
+        :param duration: stop automatically after this many seconds
+        :param output: file written with collapsed stacks when the profile ends
+        """
+        if self.running:
+            raise RuntimeError('Profiler is already running')
+        self.output = output
+        self.result = None
+        self._stacks = Counter()
+        self._samples = 0
+        self._stop.clear()
+        self._start = time.monotonic()
+        self._start_wall = time.time()
+        self._thread = threading.Thread(target=self._run, args=(duration,), name='sampling_profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> ProfileResult:
+        """Stop sampling (if still running) and return the result."""
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        return self.result
+
+    def _run(self, duration: Optional[float]):
+        deadline = self._start + duration if duration else None
+        own = threading.get_ident()
+        names: Dict[int, str] = {}
+        while not self._stop.wait(self.interval):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            frames = sys._current_frames()
+            if self.all_threads:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                selected = [(tid, f) for tid, f in frames.items() if tid != own]
+            else:
+                selected = [(self.thread_id, frames[self.thread_id])] if self.thread_id in frames else []
+            for tid, frame in selected:
+                codes = []
+                while frame is not None and len(codes) < self.max_depth:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                codes.reverse()
+                self._stacks[(names.get(tid, str(tid)) if self.all_threads else None, *codes)] += 1
+            self._samples += 1
+            del frames, selected
+        self._finish()
+
+    def _finish(self):
+        result = ProfileResult(self._stacks, self._samples, self._start_wall, time.monotonic() - self._start,
+                               self.interval)
+        if self.output:
+            try:
+                result.write(self.output)
+            except OSError as e:
+                logger.error(f'Can not write profile to {self.output}: {e}')
+        self.result = result
+        logger.info(f'Profile finished: {result.samples} samples in {result.duration:.1f} s'
+                    + (f', collapsed stacks in {result.file}' if result.file else ''))
+
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def _settings() -> dict:
+    try:
+        cfg = SingletonConfig.get_config()['profiler'].get()
+    except confuse.exceptions.NotFoundError:
+        cfg = None
+    return cfg or {}
+
+
+def _check_file_name(file_name) -> str:
+    """Bare file name from a client, paths could overwrite any file writable by the server."""
+    if not isinstance(file_name, str) or not file_name or '..' in file_name \
+            or any(sep in file_name for sep in ('/', '\\', os.sep)):
+        raise ValueError(f'Profile file must be a bare file name, got {file_name!r}')
+    return file_name
+
+
+def start_profiler(duration: Optional[float] = None, interval: Optional[float] = None, all_threads: bool = False,
+                   file_name: Optional[str] = None) -> dict:
+    """
+    Start the process profiler sampling the calling thread (the event loop) or all threads.
+
+    :param duration: seconds of profiling, limited by ``profiler.max_duration``
+    :param interval: seconds between samples, ``profiler.interval`` by default
+    :param file_name: name of the collapsed stacks file in ``profiler.output_dir`` (no directories), a timestamped
+        name by default
+    :raise RuntimeError: a profile is already running
+    :raise ValueError: the file name is not a bare file name
+    """
+    global _profiler
+    if _profiler is not None and _profiler.running:
+        raise RuntimeError('Profiler is already running')
+    cfg = _settings()
+    max_duration = float(cfg.get('max_duration', DEFAULT_MAX_DURATION))
+    duration = min(float(duration), max_duration) if duration else max_duration
+    if file_name is None:
+        file_name = f'ocabox_profile_{time.strftime("%Y%m%d_%H%M%S")}.folded'
+    output = os.path.join(cfg.get('output_dir') or DEFAULT_OUTPUT_DIR, _check_file_name(file_name))
+    _profiler = SamplingProfiler(interval=interval or cfg.get('interval', DEFAULT_INTERVAL), all_threads=all_threads)
+    _profiler.start(duration=duration, output=output)
+    logger.warning(f'Profiler started for {duration:.0f} s, interval {_profiler.interval * 1000:.0f} ms, '
+                   f'output {output}')
+    return {'duration': duration, 'interval': _profiler.interval, 'all_threads': all_threads, 'file': output}
+
+
+async def stop_profiler() -> Optional[ProfileResult]:
+    """
+    Stop the running profile, or return the last finished one. None if the profiler was never started.
+    The sampler thread is joined by a worker thread, the loop is not blocked until the last sample is written.
+    """
+    if _profiler is None:
+        return None
+    return await asyncio.to_thread(_profiler.stop)
+
+
+def profiler_running() -> bool:
+    return _profiler is not None and _profiler.running
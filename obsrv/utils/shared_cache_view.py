@@ -0,0 +1,267 @@
+"""Shared-memory view of the TreeCache for co-located client processes.
+
+Local processes (GUIs, PMS daemons running on the same host) that only need
+the latest cached value of an address can read it straight from a memory
+mapped file instead of paying for a ZMQ round trip through the router.
+
+The file is a fixed-slot table. Each address owns one slot chosen by
+``crc32(address) % slots`` with linear probing; slots are never released, so
+a reader probing for an address can stop at the first empty slot. Every slot
+is guarded by a seqlock: the writer bumps the sequence number to an odd value,
+rewrites the slot and bumps it back to even. Readers copy the slot and retry
+when the sequence was odd or changed while copying. There is exactly one
+writer (the TreeCache that owns the file) and any number of readers.
+
+Layout (little endian)::
+
+    header (64 B):  magic '4s', version 'H', reserved 'H', slots 'I', slot_size 'I'
+    slot header:    seq 'I', flags 'I', ts 'd', change_time 'd', addr_len 'H', val_len 'I'
+    slot body:      address (ADDRESS_SIZE B, utf-8), value (slot_size - SLOT_HEADER_SIZE - ADDRESS_SIZE B, json)
+
+The view is written only when the cache stores a new value, there is no
+periodic dump. Values that can not be encoded as JSON or do not fit in the
+slot are published with a flag and an empty payload, so readers still see
+the timestamps and know they have to ask the router.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from typing import Any, Dict, Iterator, NamedTuple, Optional
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+MAGIC = b'OCSV'
+VERSION = 1
+HEADER_SIZE = 64
+ADDRESS_SIZE = 128
+_HEADER = struct.Struct('<4sHHII')
+_SLOT_HEADER = struct.Struct('<IIddHI')
+_SEQ = struct.Struct('<I')
+SLOT_HEADER_SIZE = 32  # _SLOT_HEADER.size (30) rounded up for alignment
+
+FLAG_VALUE_NONE = 0x1
+FLAG_UNENCODABLE = 0x2
+FLAG_TOO_LARGE = 0x4
+
+_READ_RETRIES = 100
+
+
+class SharedCacheEntry(NamedTuple):
+    address: str
+    value: Any
+    ts: float
+    change_time: float
+    flags: int
+
+    @property
+    def has_value(self) -> bool:
+        """False when the payload was not exported (None, not JSON encodable or too large)."""
+        return not self.flags
+
+
+class SharedCacheViewError(Exception):
+    pass
+
+
+def _slot_offset(index: int, slot_size: int) -> int:
+    return HEADER_SIZE + index * slot_size
+
+
+def _home_slot(address: bytes, slots: int) -> int:
+    return zlib.crc32(address) % slots
+
+
+class SharedCacheViewWriter:
+    """
+    Single writer of the shared cache view.
+
+    :param path: path of the mapped file, a tmpfs location like ``/dev/shm`` is recommended
+    :param slots: number of slots (maximum number of addresses exported)
+    :param slot_size: size of one slot in bytes, limits the size of exported value
+    """
+
+    def __init__(self, path: str, slots: int = 4096, slot_size: int = 512):
+        if slot_size <= SLOT_HEADER_SIZE + ADDRESS_SIZE:
+            raise ValueError(f'slot_size must be greater than {SLOT_HEADER_SIZE + ADDRESS_SIZE}')
+        if slots < 1:
+            raise ValueError('slots must be positive')
+        self._path = path
+        self._slots = slots
+        self._slot_size = slot_size
+        self._value_size = slot_size - SLOT_HEADER_SIZE - ADDRESS_SIZE
+        self._slot_index: Dict[str, int] = {}
+        self._sequences: Dict[int, int] = {}
+        self._full_logged = False
+        size = HEADER_SIZE + slots * slot_size
+        # always start from an empty table, stale entries from a previous run would be misleading
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+        _HEADER.pack_into(self._mm, 0, MAGIC, VERSION, 0, slots, slot_size)
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def publish(self, address: str, value: Any, ts: float, change_time: float) -> bool:
+        """
+        Write the latest value of the address into its slot.
+
+        :param address: address as string
+        :param value: python value (``Value.v``), exported as JSON
+        :param ts: timestamp of the value
+        :param change_time: time of the last change of the value
+        :return: False if the address could not be exported because the table is full or address is too long
+        """
+        index = self._slot_index.get(address)
+        if index is None:
+            index = self._allocate(address)
+            if index is None:
+                return False
+        flags = 0
+        payload = b''
+        if value is None:
+            flags = FLAG_VALUE_NONE
+        else:
+            try:
+                payload = json.dumps(value, separators=(',', ':')).encode('utf-8')
+            except (TypeError, ValueError):
+                flags = FLAG_UNENCODABLE
+            else:
+                if len(payload) > self._value_size:
+                    flags = FLAG_TOO_LARGE
+                    payload = b''
+        self._write_slot(index, address.encode('utf-8'), payload, flags, ts, change_time)
+        return True
+
+    def _allocate(self, address: str) -> Optional[int]:
+        address_b = address.encode('utf-8')
+        if len(address_b) > ADDRESS_SIZE:
+            logger.warning(f'Address {address} is too long to export to shared cache view')
+            return None
+        index = _home_slot(address_b, self._slots)
+        for _ in range(self._slots):
+            if index not in self._sequences:
+                self._sequences[index] = 0
+                self._slot_index[address] = index
+                return index
+            index = (index + 1) % self._slots
+        if not self._full_logged:
+            logger.warning(f'Shared cache view {self._path} is full ({self._slots} slots), new addresses are not '
+                           f'exported')
+            self._full_logged = True
+        return None
+
+    def _write_slot(self, index: int, address: bytes, payload: bytes, flags: int, ts: float, change_time: float):
+        offset = _slot_offset(index, self._slot_size)
+        seq = self._sequences[index] + 1
+        _SEQ.pack_into(self._mm, offset, seq)  # odd - write in progress
+        _SLOT_HEADER.pack_into(self._mm, offset, seq, flags, ts, change_time, len(address), len(payload))
+        body = offset + SLOT_HEADER_SIZE
+        self._mm[body:body + len(address)] = address
+        body += ADDRESS_SIZE
+        self._mm[body:body + len(payload)] = payload
+        seq += 1
+        _SEQ.pack_into(self._mm, offset, seq)  # even - slot consistent
+        self._sequences[index] = seq
+
+    def close(self, unlink: bool = True):
+        """Close the mapping and by default remove the file so readers don't see a stale view."""
+        if self._mm is None:
+            return
+        self._mm.close()
+        self._mm = None
+        if unlink:
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+
+
+class SharedCacheViewReader:
+    """
+    Read only access to a shared cache view created by :class:`SharedCacheViewWriter`.
+
+    Usage::
+
+        with SharedCacheViewReader('/dev/shm/ocabox_cache_main') as view:
+            entry = view.get('sim.telescope.rightascension')
+            if entry and entry.has_value:
+                print(entry.value, entry.ts)
+
+    :param path: path of the mapped file
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, slots, slot_size = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self._mm.close()
+            raise SharedCacheViewError(f'{path} is not a shared cache view (version {VERSION})')
+        self._slots = slots
+        self._slot_size = slot_size
+
+    def get(self, address: str) -> Optional[SharedCacheEntry]:
+        """
+        Return latest exported entry for address.
+
+        :param address: address as string
+        :return: entry or None if the address is not exported
+        """
+        address_b = address.encode('utf-8')
+        index = _home_slot(address_b, self._slots)
+        for _ in range(self._slots):
+            entry = self._read_slot(index)
+            if entry is None:
+                return None
+            if entry.address == address:
+                return entry
+            index = (index + 1) % self._slots
+        return None
+
+    def items(self) -> Iterator[SharedCacheEntry]:
+        """Iterate over all exported entries."""
+        for index in range(self._slots):
+            entry = self._read_slot(index)
+            if entry is not None:
+                yield entry
+
+    def _read_slot(self, index: int) -> Optional[SharedCacheEntry]:
+        offset = _slot_offset(index, self._slot_size)
+        end = offset + self._slot_size
+        for _ in range(_READ_RETRIES):
+            seq_before = _SEQ.unpack_from(self._mm, offset)[0]
+            if seq_before == 0:
+                return None  # never written
+            if seq_before & 1:
+                continue
+            raw = self._mm[offset:end]
+            if _SEQ.unpack_from(self._mm, offset)[0] != seq_before:
+                continue
+            seq, flags, ts, change_time, addr_len, val_len = _SLOT_HEADER.unpack_from(raw, 0)
+            if seq != seq_before:
+                continue
+            body = SLOT_HEADER_SIZE
+            address = raw[body:body + addr_len].decode('utf-8')
+            body += ADDRESS_SIZE
+            value = json.loads(raw[body:body + val_len]) if val_len else None
+            return SharedCacheEntry(address, value, ts, change_time, flags)
+        raise SharedCacheViewError(f'Slot {index} is changing too fast to be read consistently')
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self) -> SharedCacheViewReader:
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,259 @@
+"""
+Per-component latency tracing of requests going through the tree.
+
+When tracing is enabled (``tracing`` config section) every request handled by the request solver gets a ``Trace`` in
+a context variable. ``TreeComponent`` subclasses have their ``get_response`` wrapped by :func:`traced`, which records
+a span (entry and exit time) of the component, so the time of a slow request can be split between the router, the
+freezer wait, the cache single-flight wait, the blocker and the connector. Spans of tasks started while handling the
+request belong to the same trace (context variables are copied to new tasks).
+
+Every finished trace updates latency histograms per component and address prefix. Full traces are kept for a sample
+of requests (``sample_rate``) and for every request slower than ``slow_threshold``; both are returned by the
+``get_traces`` router command.
+
+When tracing is disabled the wrapper costs one context variable lookup per ``get_response`` call.
+"""
+import functools
+import itertools
+import logging
+import random
+from collections import deque
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional, Tuple
+
+import confuse
+
+from obsrv.ob_config import SingletonConfig
+from obsrv.utils.clock import get_clock
+from obsrv.utils.histogram import LatencyHistogram
+
+logger = logging.getLogger(__name__.rsplit('.')[-1])
+
+ROUTER_SPAN = 'router'
+
+_current_trace: ContextVar[Optional['Trace']] = ContextVar('ocabox_trace', default=None)
+_current_span: ContextVar[Optional['Span']] = ContextVar('ocabox_span', default=None)
+_received: ContextVar[Optional[float]] = ContextVar('ocabox_received', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'owner', 'parent', 'start', 'end', 'status')
+
+    def __init__(self, name: str, owner: object, parent: Optional['Span'], start: float):
+        self.name = name
+        self.owner = owner
+        self.parent = parent
+        self.start = start
+        self.end: Optional[float] = None
+        self.status: Optional[bool] = None
+
+
+class Trace:
+    """Spans of one request, times from ``get_clock().monotonic()``."""
+
+    __slots__ = ('trace_id', 'address', 'request_type', 'cycle_query', 'wall_start', 'start', 'end', 'status',
+                 'spans', '_token')
+
+    def __init__(self, trace_id: int, address: str, request_type: str, cycle_query: bool, start: float):
+        self.trace_id = trace_id
+        self.address = address
+        self.request_type = request_type
+        self.cycle_query = cycle_query
+        self.wall_start = get_clock().time() - (get_clock().monotonic() - start)
+        self.start = start
+        self.end: Optional[float] = None
+        self.status: Optional[bool] = None
+        self.spans: List[Span] = []
+        self._token = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else get_clock().monotonic()) - self.start
+
+    def to_dict(self) -> dict:
+        """
+        Serializable trace, span times in ms from the start of the trace. 'self_ms' is the time of the span not
+        covered by its child spans (e.g. waiting in the freezer or for the HTTP response).
+        """
+        children: Dict[int, float] = {}
+        for s in self.spans:
+            if s.parent is not None and s.end is not None:
+                children[id(s.parent)] = children.get(id(s.parent), 0.0) + s.end - s.start
+        index = {id(s): i for i, s in enumerate(self.spans)}
+        spans = []
+        for s in self.spans:
+            end = s.end if s.end is not None else self.end
+            duration = end - s.start if end is not None else None
+            spans.append({'name': s.name,
+                          'parent': index.get(id(s.parent)),
+                          'start_ms': (s.start - self.start) * 1000,
+                          'duration_ms': duration * 1000 if duration is not None else None,
+                          'self_ms': max(0.0, duration - children.get(id(s), 0.0)) * 1000
+                          if duration is not None else None,
+                          'status': s.status})
+        return {'id': self.trace_id, 'address': self.address, 'request_type': self.request_type,
+                'cycle_query': self.cycle_query, 'time': self.wall_start, 'duration_ms': self.duration * 1000,
+                'status': self.status, 'spans': spans}
+
+
+class Tracer:
+    """
+    Collects traces and latency histograms.
+
+    :param enabled: trace requests at all
+    :param sample_rate: fraction of finished traces kept whole
+    :param slow_threshold: traces at least this long (s) are always kept, None to keep only sampled ones
+    :param max_traces: number of kept traces (oldest are dropped)
+    :param prefix_depth: histograms are aggregated by this many first segments of the address
+    """
+
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.01, slow_threshold: Optional[float] = 1.0,
+                 max_traces: int = 200, prefix_depth: int = 3):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.prefix_depth = prefix_depth
+        self._traces: Deque[Trace] = deque(maxlen=max(1, int(max_traces)))
+        self._histograms: Dict[Tuple[str, str], LatencyHistogram] = {}
+        self._ids = itertools.count(1)
+        self._random = random.Random()
+
+    def configure(self, enabled: bool = None, sample_rate: float = None, slow_threshold: float = None,
+                  max_traces: int = None, prefix_depth: int = None):
+        if enabled is not None:
+            self.enabled = bool(enabled)
+        if sample_rate is not None:
+            self.sample_rate = float(sample_rate)
+        if slow_threshold is not None:
+            self.slow_threshold = float(slow_threshold) if slow_threshold >= 0 else None
+        if max_traces is not None and max_traces != self._traces.maxlen:
+            self._traces = deque(self._traces, maxlen=max(1, int(max_traces)))
+        if prefix_depth is not None:
+            self.prefix_depth = int(prefix_depth)
+
+    def start_trace(self, request) -> Optional[Trace]:
+        """
+        Start the trace of the request in the current context. Returns None when tracing is disabled or the request
+        is a part of another traced request (internal requests of components).
+        """
+        if not self.enabled or _current_trace.get() is not None:
+            return None
+        now = get_clock().monotonic()
+        received = _received.get()
+        start = min(received, now) if received is not None else now
+        trace = Trace(next(self._ids), str(request.address), request.request_type,
+                      bool(getattr(request, 'cycle_query', False)), start)
+        router = Span(ROUTER_SPAN, None, None, start)
+        trace.spans.append(router)
+        trace._token = (_current_trace.set(trace), _current_span.set(router))
+        return trace
+
+    def finish_trace(self, trace: Optional[Trace], status: Optional[bool] = None):
+        if trace is None:
+            return
+        trace_token, span_token = trace._token
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        trace.end = get_clock().monotonic()
+        trace.status = status
+        trace.spans[0].end = trace.end
+        trace.spans[0].status = status
+        prefix = '.'.join(trace.address.split('.')[:self.prefix_depth])
+        for s in trace.spans:
+            if s.end is not None:
+                self._histogram(s.name, prefix).observe(s.end - s.start)
+        if (self.slow_threshold is not None and trace.duration >= self.slow_threshold) \
+                or self._random.random() < self.sample_rate:
+            self._traces.append(trace)
+
+    def _histogram(self, component: str, prefix: str) -> LatencyHistogram:
+        h = self._histograms.get((component, prefix))
+        if h is None:
+            h = self._histograms[(component, prefix)] = LatencyHistogram()
+        return h
+
+    def traces(self, limit: int = None, min_duration: float = None, address: str = None) -> List[dict]:
+        """Kept traces newest first, optionally only these at least min_duration (s) long or under the address."""
+        out = []
+        for t in reversed(self._traces):
+            if min_duration is not None and t.duration < min_duration:
+                continue
+            if address and not t.address.startswith(address):
+                continue
+            out.append(t.to_dict())
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def histograms(self, with_buckets: bool = False) -> Dict[str, Dict[str, dict]]:
+        """Latency summaries keyed by component name and address prefix."""
+        out: Dict[str, Dict[str, dict]] = {}
+        for (component, prefix), h in sorted(self._histograms.items()):
+            out.setdefault(component, {})[prefix] = h.to_dict(with_buckets)
+        return out
+
+    def reset(self):
+        self._traces.clear()
+        self._histograms.clear()
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+def configure_tracing_from_config():
+    """Configure the tracer from the 'tracing' configuration section (missing section leaves tracing disabled)."""
+    try:
+        cfg = SingletonConfig.get_config()['tracing'].get()
+    except confuse.exceptions.NotFoundError:
+        return
+    if not cfg:
+        return
+    _tracer.configure(enabled=cfg.get('enabled', False), sample_rate=cfg.get('sample_rate'),
+                      slow_threshold=cfg.get('slow_threshold'), max_traces=cfg.get('max_traces'),
+                      prefix_depth=cfg.get('prefix_depth'))
+    if _tracer.enabled:
+        logger.info(f'Request tracing enabled, sample rate {_tracer.sample_rate}, '
+                    f'slow threshold {_tracer.slow_threshold} s')
+
+
+def mark_received():
+    """Remember when the router received the message, the traces of its requests start at this time."""
+    if _tracer.enabled:
+        _received.set(get_clock().monotonic())
+
+
+async def _traced_call(trace: Trace, func, component, args, kwargs):
+    parent = _current_span.get()
+    if parent is not None and parent.owner is component:
+        # super().get_response() of the same component
+        return await func(component, *args, **kwargs)
+    span = Span(component.get_name(), component, parent, get_clock().monotonic())
+    trace.spans.append(span)
+    token = _current_span.set(span)
+    try:
+        response = await func(component, *args, **kwargs)
+        span.status = getattr(response, 'status', None)
+        return response
+    finally:
+        span.end = get_clock().monotonic()
+        _current_span.reset(token)
+
+
+def traced(func):
+    """Decorator of ``get_response`` recording the span of the component in the current trace."""
+    if getattr(func, '_ocabox_traced', False):
+        return func
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return func(self, *args, **kwargs)
+        return _traced_call(trace, func, self, args, kwargs)
+
+    wrapper._ocabox_traced = True
+    return wrapper
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from serverish.messenger import Messenger
 from obsrv.communication.base_request_solver_protocol import BaseRequestSolverProtocol
+from obsrv.utils.executors import Executors
+from obsrv.utils.large_value_store import LargeValueStore
 
 
 @dataclass
@@ -10,7 +12,11 @@ class TreeData:
     """
     target_requests: BaseRequestSolverProtocol
     nats_messenger: Messenger = None
+    large_values: LargeValueStore = None  # out-of-band store of large payloads, None when disabled
+    executors: Executors = None  # shared thread / process pools for CPU heavy work
 
     def __post_init__(self):
         if self.nats_messenger is None:
             self.nats_messenger = Messenger()
+        if self.executors is None:
+            self.executors = Executors()
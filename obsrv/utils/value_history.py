@@ -0,0 +1,214 @@
+"""Bounded, compact time-series history of numeric values.
+
+Each tracked address gets a :class:`ValueHistory` made of tiers. The first
+tier usually stores raw samples, the next ones store averages over fixed
+``step`` buckets, so a long window costs the same memory as a short one at a
+coarser resolution. Every tier is a pair of ring buffers of ``array('d')``
+(timestamps and values) with a fixed capacity, the memory used by one
+address is therefore ``16 B * sum(capacity)`` and never grows.
+"""
+from __future__ import annotations
+
+import math
+from array import array
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+# (step in seconds - 0 means raw samples, capacity)
+DEFAULT_TIERS: Tuple[Tuple[float, int], ...] = ((0, 600), (10, 720), (60, 1440))
+
+
+class _RingBuffer:
+    __slots__ = ('_ts', '_v', '_capacity', '_head', '_count')
+
+    def __init__(self, capacity: int):
+        self._ts = array('d', bytes(8 * capacity))
+        self._v = array('d', bytes(8 * capacity))
+        self._capacity = capacity
+        self._head = 0  # next write position
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, ts: float, v: float):
+        self._ts[self._head] = ts
+        self._v[self._head] = v
+        self._head = (self._head + 1) % self._capacity
+        if self._count < self._capacity:
+            self._count += 1
+
+    def oldest_ts(self) -> Optional[float]:
+        if not self._count:
+            return None
+        return self._ts[(self._head - self._count) % self._capacity]
+
+    def newest_ts(self) -> Optional[float]:
+        if not self._count:
+            return None
+        return self._ts[(self._head - 1) % self._capacity]
+
+    def window(self, since: float, until: float) -> Tuple[array, array]:
+        """Return copies of samples with ``since <= ts <= until`` in chronological order."""
+        start = (self._head - self._count) % self._capacity
+        # chronological order is buffer[start:] + buffer[:head] (or buffer[start:head] when not wrapped)
+        if start + self._count <= self._capacity:
+            ts = self._ts[start:start + self._count]
+            v = self._v[start:start + self._count]
+        else:
+            ts = self._ts[start:] + self._ts[:self._head]
+            v = self._v[start:] + self._v[:self._head]
+        lo = _bisect_left(ts, since)
+        hi = _bisect_right(ts, until)
+        return ts[lo:hi], v[lo:hi]
+
+
+def _bisect_left(a: Sequence[float], x: float) -> int:
+    lo, hi = 0, len(a)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if a[mid] < x:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def _bisect_right(a: Sequence[float], x: float) -> int:
+    lo, hi = 0, len(a)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if x < a[mid]:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+class HistoryTier:
+    """
+    One resolution level of the history.
+
+    :param step: bucket length in seconds, 0 stores every sample
+    :param capacity: number of stored samples (buckets)
+    """
+
+    __slots__ = ('step', 'capacity', '_buffer', '_bucket_start', '_bucket_sum', '_bucket_n')
+
+    def __init__(self, step: float, capacity: int):
+        if capacity < 1:
+            raise ValueError('History tier capacity must be positive')
+        if step < 0:
+            raise ValueError('History tier step can not be negative')
+        self.step = float(step)
+        self.capacity = int(capacity)
+        self._buffer = _RingBuffer(self.capacity)
+        self._bucket_start: Optional[float] = None
+        self._bucket_sum = 0.0
+        self._bucket_n = 0
+
+    @property
+    def name(self) -> str:
+        return 'raw' if not self.step else f'{self.step:g}s'
+
+    def add(self, ts: float, v: float):
+        if not self.step:
+            self._buffer.append(ts, v)
+            return
+        bucket_start = ts - ts % self.step
+        if self._bucket_start is not None and bucket_start != self._bucket_start:
+            self._flush()
+        self._bucket_start = bucket_start
+        self._bucket_sum += v
+        self._bucket_n += 1
+
+    def _flush(self):
+        if self._bucket_n:
+            self._buffer.append(self._bucket_start, self._bucket_sum / self._bucket_n)
+        self._bucket_sum = 0.0
+        self._bucket_n = 0
+
+    def oldest_ts(self) -> Optional[float]:
+        oldest = self._buffer.oldest_ts()
+        return oldest if oldest is not None else self._bucket_start
+
+    def window(self, since: float, until: float) -> Tuple[array, array]:
+        ts, v = self._buffer.window(since, until)
+        # the bucket being accumulated is reported as a partial average
+        if self._bucket_n and since <= self._bucket_start <= until:
+            ts.append(self._bucket_start)
+            v.append(self._bucket_sum / self._bucket_n)
+        return ts, v
+
+    @property
+    def nbytes(self) -> int:
+        return 16 * self.capacity
+
+
+class ValueHistory:
+    """
+    History of one address, samples are written to all tiers.
+
+    :param tiers: iterable of (step, capacity), finest resolution first
+    """
+
+    __slots__ = ('_tiers', '_last_ts')
+
+    def __init__(self, tiers: Iterable[Tuple[float, int]] = DEFAULT_TIERS):
+        self._tiers: List[HistoryTier] = sorted((HistoryTier(s, c) for s, c in tiers), key=lambda t: t.step)
+        if not self._tiers:
+            raise ValueError('History needs at least one tier')
+        self._last_ts = -math.inf
+
+    @staticmethod
+    def to_number(v) -> Optional[float]:
+        """Return value as float or None if value is not numeric (strings, dicts, NaN...)."""
+        if isinstance(v, bool):
+            return 1.0 if v else 0.0
+        if isinstance(v, (int, float)):
+            f = float(v)
+            return None if math.isnan(f) else f
+        return None
+
+    def add(self, ts: float, v) -> bool:
+        """
+        Add sample. Non numeric values and samples older than the last one are ignored.
+
+        :return: True if sample was stored
+        """
+        number = self.to_number(v)
+        if number is None or ts <= self._last_ts:
+            return False
+        self._last_ts = ts
+        for tier in self._tiers:
+            tier.add(ts, number)
+        return True
+
+    def tier_names(self) -> List[str]:
+        return [t.name for t in self._tiers]
+
+    def select_tier(self, since: float, tier_name: str = None) -> HistoryTier:
+        """
+        Return tier with given name or the finest tier that still covers ``since``, the coarsest otherwise.
+
+        :raise KeyError: when tier with given name does not exist
+        """
+        if tier_name is not None:
+            for tier in self._tiers:
+                if tier.name == tier_name:
+                    return tier
+            raise KeyError(tier_name)
+        for tier in self._tiers:
+            oldest = tier.oldest_ts()
+            if oldest is not None and oldest <= since:
+                return tier
+        return self._tiers[-1]
+
+    def window(self, since: float, until: float, tier_name: str = None) -> Tuple[HistoryTier, array, array]:
+        tier = self.select_tier(since, tier_name)
+        ts, v = tier.window(since, until)
+        return tier, ts, v
+
+    @property
+    def nbytes(self) -> int:
+        """Memory reserved by the ring buffers of this history."""
+        return sum(t.nbytes for t in self._tiers)
@@ -0,0 +1,108 @@
+"""
+Vectorized visibility of many targets from the observatory: alt-az, airmass and rising / setting over a time range.
+
+Pure numpy - the catalog (ICRS / J2000) positions are precessed to the equator of date (IAU 1976) and converted with
+the mean local sidereal time, nutation, aberration and refraction are neglected. The altitudes are accurate to about
+0.01 deg, plenty for scheduling, while a thousand targets over a night take milliseconds.
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+UNIX_J2000 = 946728000.0  # 2000-01-01 12:00 UT
+
+
+def local_sidereal_time(times: np.ndarray, longitude: float) -> np.ndarray:
+    """Local mean sidereal time in degrees at unix times ``times`` (UTC used as UT1), east positive ``longitude``."""
+    d = (np.asarray(times, dtype=float) - UNIX_J2000) / 86400.0
+    t = d / 36525.0
+    return (280.46061837 + 360.98564736629 * d + 0.000387933 * t ** 2 + longitude) % 360.0
+
+
+def precess(ra: np.ndarray, dec: np.ndarray, t: float):
+    """J2000 ``ra``, ``dec`` (degrees) precessed to the mean equator and equinox of unix time ``t``."""
+    c = (t - UNIX_J2000) / 86400.0 / 36525.0
+    zeta, z, theta = (np.deg2rad(a / 3600.0) for a in (2306.2181 * c + 0.30188 * c ** 2 + 0.017998 * c ** 3,
+                                                       2306.2181 * c + 1.09468 * c ** 2 + 0.018203 * c ** 3,
+                                                       2004.3109 * c - 0.42665 * c ** 2 - 0.041833 * c ** 3))
+    ra0, dec0 = np.deg2rad(ra), np.deg2rad(dec)
+    a = np.cos(dec0) * np.sin(ra0 + zeta)
+    b = np.cos(theta) * np.cos(dec0) * np.cos(ra0 + zeta) - np.sin(theta) * np.sin(dec0)
+    s = np.sin(theta) * np.cos(dec0) * np.cos(ra0 + zeta) + np.cos(theta) * np.sin(dec0)
+    return np.rad2deg(np.arctan2(a, b) + z) % 360.0, np.rad2deg(np.arcsin(np.clip(s, -1.0, 1.0)))
+
+
+def altaz(ra: np.ndarray, dec: np.ndarray, lst: np.ndarray, latitude: float):
+    """
+    Altitude and azimuth (from north through east), degrees, of equatorial positions of date.
+
+    ``ra`` / ``dec`` of shape (targets,) and ``lst`` of shape (times,) give arrays of shape (targets, times).
+    """
+    h = np.deg2rad(lst[np.newaxis, :] - np.asarray(ra, dtype=float)[:, np.newaxis])
+    dec = np.deg2rad(np.asarray(dec, dtype=float))[:, np.newaxis]
+    lat = np.deg2rad(latitude)
+    sin_alt = np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(h)
+    north = np.sin(dec) * np.cos(lat) - np.cos(dec) * np.sin(lat) * np.cos(h)  # cos(alt) cos(az)
+    east = -np.cos(dec) * np.sin(h)  # cos(alt) sin(az)
+    # arctan2 instead of arcsin, which loses precision near the zenith
+    alt = np.arctan2(sin_alt, np.hypot(north, east))
+    return np.rad2deg(alt), np.rad2deg(np.arctan2(east, north)) % 360.0
+
+
+def airmass(alt: np.ndarray) -> np.ndarray:
+    """Kasten & Young (1989) relative airmass, NaN below the horizon."""
+    alt = np.asarray(alt, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x = 1.0 / (np.sin(np.deg2rad(alt)) + 0.50572 * (alt + 6.07995) ** -1.6364)
+    return np.where(alt > 0, x, np.nan)
+
+
+def _first_crossing(times: np.ndarray, alt: np.ndarray, level: float, rising: bool) -> np.ndarray:
+    """Interpolated time of the first crossing of ``level`` per row of ``alt``, NaN when there is none."""
+    above = alt >= level
+    cross = (above[:, 1:] & ~above[:, :-1]) if rising else (~above[:, 1:] & above[:, :-1])
+    found = cross.any(axis=1)
+    i = cross.argmax(axis=1)
+    rows = np.arange(alt.shape[0])
+    a0, a1 = alt[rows, i], alt[rows, i + 1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = times[i] + (level - a0) / (a1 - a0) * (times[i + 1] - times[i])
+    return np.where(found, t, np.nan)
+
+
+def _to_list(a: np.ndarray, decimals: int) -> list:
+    """JSON friendly nested list, NaN as None."""
+    a = np.round(a, decimals)
+    return np.where(np.isnan(a), None, a).tolist()
+
+
+def target_visibility(ra: Sequence[float], dec: Sequence[float], times: np.ndarray, latitude: float,
+                      longitude: float, min_alt: float = 0.0) -> Dict[str, List]:
+    """
+    Visibility of targets on a time grid.
+
+    :param ra, dec: ICRS (J2000) positions of the targets, degrees
+    :param times: unix times of the grid, increasing, at least two
+    :param latitude, longitude: observatory position, degrees, east positive longitude
+    :param min_alt: horizon limit, degrees
+    :return: ``times``, per target and time ``alt``, ``az``, ``airmass`` (None below the horizon), and per target
+        ``rise`` / ``set`` (first crossings of ``min_alt`` in the range, None when there is none), ``time_above``
+        (seconds above ``min_alt``), ``max_alt`` and ``max_alt_time``
+    """
+    times = np.asarray(times, dtype=float)
+    ra_d, dec_d = precess(np.asarray(ra, dtype=float), np.asarray(dec, dtype=float), float(times[len(times) // 2]))
+    alt, az = altaz(ra_d, dec_d, local_sidereal_time(times, longitude), latitude)
+    above = (alt >= min_alt).astype(float)
+    time_above = ((above[:, 1:] + above[:, :-1]) / 2 * np.diff(times)).sum(axis=1)  # trapezoid, error below a step
+    i_max = alt.argmax(axis=1)
+    return {
+        'times': times.tolist(),
+        'alt': _to_list(alt, 3),
+        'az': _to_list(az, 3),
+        'airmass': _to_list(airmass(alt), 4),
+        'rise': _to_list(_first_crossing(times, alt, min_alt, rising=True), 1),
+        'set': _to_list(_first_crossing(times, alt, min_alt, rising=False), 1),
+        'time_above': time_above.tolist(),
+        'max_alt': _to_list(alt.max(axis=1), 3),
+        'max_alt_time': times[i_max].tolist(),
+    }
@@ -0,0 +1,96 @@
+"""Benchmark of camera image transfer from an Alpaca server: JSON ``imagearray`` vs ``application/imagebytes``.
+
+Starts a local fake Alpaca server (aiohttp) serving one int32 frame in both formats and fetches it through
+``AlpacaConnector._get`` the same way the device tree does. Reported times include HTTP transfer, decoding and
+building the value delivered to clients (``ImageBytesArray.to_value`` for the binary format).
+
+Run::
+
+    python -m test.benchmark.bench_alpaca_imagebytes --size 4096 --repeat 3
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import struct
+import time
+
+from aiohttp import web
+
+from obsrv.protocols.alpaca.alpaca_connector import AlpacaConnector
+from obsrv.protocols.alpaca.alpaca_imagebytes import ImageBytesArray, encode_imagebytes, IMAGEBYTES_MIME
+
+_INT32 = 2
+
+
+def _build_frame(size: int) -> bytes:
+    row = struct.pack(f'<{size}i', *range(size))
+    return row * size
+
+
+async def _start_server(size: int):
+    frame = _build_frame(size)
+    t0 = time.perf_counter()
+    pixels = memoryview(frame).cast('i', (size, size)).tolist()
+    json_body = json.dumps({'Value': pixels, 'Type': _INT32, 'Rank': 2, 'ErrorNumber': 0, 'ErrorMessage': '',
+                            'ClientTransactionID': 0, 'ServerTransactionID': 0}).encode()
+    del pixels
+    print(f'prepared JSON body {len(json_body) / 1e6:.1f} MB in {time.perf_counter() - t0:.1f} s')
+    binary_body = encode_imagebytes(frame, shape=(size, size), transmission_type=_INT32)
+
+    async def imagearray(request: web.Request):
+        if IMAGEBYTES_MIME in request.headers.get('Accept', ''):
+            return web.Response(body=binary_body, content_type=IMAGEBYTES_MIME)
+        return web.Response(body=json_body, content_type='application/json')
+
+    app = web.Application()
+    app.router.add_get('/api/v1/camera/0/imagearray', imagearray)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/api/v1/camera/0/imagearray'
+
+
+async def _measure(coro_factory, repeat: int):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        await coro_factory()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+async def main_async(size: int, repeat: int):
+    runner, url = await _start_server(size)
+    connector = AlpacaConnector()
+    await connector.create_http_session()
+    try:
+        async def json_path():
+            return await connector._get(url)
+
+        async def imagebytes_path():
+            img = await connector._get(url, accept_imagebytes=True)
+            assert isinstance(img, ImageBytesArray)
+            return img.to_value()
+
+        for name, factory in (('json', json_path), ('imagebytes', imagebytes_path)):
+            times = await _measure(factory, repeat)
+            print(f'{name:>10}: {size}x{size} int32  median {statistics.median(times) * 1000:8.1f} ms  '
+                  f'min {min(times) * 1000:8.1f} ms  ({repeat} runs)')
+    finally:
+        await connector.close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=4096, help='frame width and height')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.size, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
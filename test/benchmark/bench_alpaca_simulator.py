@@ -0,0 +1,140 @@
+"""Load benchmark of the device tree against the local Alpaca simulator.
+
+Starts ``AlpacaSimulator`` and runs concurrent GET / PUT traffic of ``--clients`` workers for ``--duration`` seconds
+in two setups:
+
+* ``connector`` - requests sent directly through ``AlpacaConnector._get`` / ``_put`` (HTTP path only),
+* ``tree`` - requests through ``TreeProvider`` -> ``TreeCache`` -> ``TreeAlpacaObservatory`` of
+  ``test_observatory`` with its address pointed at the simulator (cache hits included, ``--max-age`` sets the
+  accepted age of cached values).
+
+Prints throughput, p50 / p95 / p99 latency and errors of both setups. Latency distributions and fault
+injection of the simulator come from ``--config`` (see ``obsrv.protocols.alpaca.alpaca_simulator``).
+
+Run::
+
+    python -m test.benchmark.bench_alpaca_simulator --clients 32 --duration 10 --config simulator.yaml
+"""
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Awaitable, Callable, List
+
+from obcom.data_colection.address import Address
+from obcom.data_colection.value_call import ValueRequest
+from obsrv.ob_config import SingletonConfig
+from obsrv.protocols.alpaca.alpaca_connector import AlpacaConnector
+from obsrv.protocols.alpaca.alpaca_simulator import AlpacaSimulator, load_config
+from obsrv.tree_components.base_components.tree_provider import TreeProvider
+from obsrv.tree_components.specialized_components import TreeCache
+from obsrv.tree_components.specialized_components.tree_alpaca import TreeAlpacaObservatory
+
+OBSERVATORY_NAME = 'test_observatory'
+
+# (device path in test_observatory, alpaca device, variable, share of traffic)
+_GETS = [
+    ('dibi', 'telescope/0', 'rightascension', 4),
+    ('dibi', 'telescope/0', 'declination', 4),
+    ('dome', 'dome/0', 'azimuth', 2),
+    ('focuser', 'focuser/0', 'position', 2),
+    ('camera', 'camera/0', 'camerastate', 2),
+    ('safetymonitor', 'safetymonitor/0', 'issafe', 1),
+]
+_PUT = ('focuser', 'focuser/0', 'move', 'Position')
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def _load(request: Callable[[bool, tuple], Awaitable], clients: int, duration: float, put_ratio: float,
+                seed: int):
+    rng = random.Random(seed)
+    weighted = [g for g in _GETS for _ in range(g[3])]
+    latencies: List[float] = []
+    errors: Counter = Counter()
+    end = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < end:
+            is_put = rng.random() < put_ratio
+            target = _PUT if is_put else rng.choice(weighted)
+            t0 = time.perf_counter()
+            try:
+                await request(is_put, target, rng.randrange(0, 10000))
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            else:
+                latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    return sorted(latencies), errors, time.perf_counter() - t0
+
+
+def _report(name: str, latencies: List[float], errors: Counter, elapsed: float):
+    ms = [v * 1000 for v in latencies]
+    print(f'{name:>10}: {len(ms) / elapsed:9.1f} req/s  p50 {_percentile(ms, 0.5):7.2f} ms  '
+          f'p95 {_percentile(ms, 0.95):7.2f} ms  p99 {_percentile(ms, 0.99):7.2f} ms  '
+          f'errors {sum(errors.values())} {dict(errors) if errors else ""}')
+
+
+async def main_async(args):
+    simulator = AlpacaSimulator(load_config(args.config), seed=args.seed)
+    url = await simulator.start()
+    SingletonConfig.get_config()['tree'][OBSERVATORY_NAME]['observatory']['address'].set(url)
+
+    connector = AlpacaConnector()
+    await connector.create_http_session()
+    try:
+        async def direct(is_put, target, value):
+            if is_put:
+                return await connector._put(f'{url}/{target[1]}/{target[2]}', **{target[3]: value})
+            return await connector._get(f'{url}/{target[1]}/{target[2]}')
+
+        _report('connector', *await _load(direct, args.clients, args.duration, args.put_ratio, args.seed))
+    finally:
+        await connector.close()
+
+    observatory = TreeAlpacaObservatory(component_name='sim', observatory_name=OBSERVATORY_NAME)
+    cache = TreeCache('bench_cache', observatory)
+    provider = TreeProvider('bench', 'sim', cache)
+    await provider.run()
+    try:
+        async def tree(is_put, target, value):
+            if is_put:
+                request = ValueRequest(Address(f'sim.{target[0]}.{target[2]}'), time.time(), request_type='PUT',
+                                       request_data={target[3]: value})
+            else:
+                request = ValueRequest(Address(f'sim.{target[0]}.{target[2]}'), time.time() - args.max_age)
+            response = await provider.get_response(request)
+            if not response.status:
+                raise RuntimeError(f'error {response.error.code if response.error else None}')
+            return response
+
+        _report('tree', *await _load(tree, args.clients, args.duration, args.put_ratio, args.seed))
+    finally:
+        await provider.stop()
+        await simulator.stop()
+    print(f'simulator requests: {sum(v for k, v in simulator.stats.items() if not k.startswith("fault:"))}, '
+          f'faults: {({k: v for k, v in simulator.stats.items() if k.startswith("fault:")})}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help='concurrent workers')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds of load per setup')
+    parser.add_argument('--put-ratio', type=float, default=0.05, help='share of PUT requests')
+    parser.add_argument('--max-age', type=float, default=0.1, help='accepted age (s) of cached values in tree GETs')
+    parser.add_argument('--config', help='YAML or JSON simulator configuration')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == '__main__':
+    main()
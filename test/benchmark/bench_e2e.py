@@ -0,0 +1,391 @@
+"""End-to-end benchmark of the request path: ZMQ client -> ``Router`` -> tree -> connector -> device.
+
+Builds the ``dummytest`` branch of ``obsrv/configuration/tree_build_example.py`` (request blocker, access grantor,
+broker, cache, conditional freezer, provider) behind a ``Router`` on a free port. The mount of ``dummytest`` uses
+the dummy connector, the other devices talk to a local ``AlpacaSimulator``. ``--clients`` ZMQ DEALER clients run in
+a separate thread with their own event loop, each sends one request at a time (closed loop).
+
+Scenarios:
+
+* ``cache_hit`` - GETs of mount values accepting an hour old value, answered by the cache,
+* ``cache_miss`` - GETs of Alpaca device values accepting no cached value, every request reaches the device,
+* ``cycle`` - conditional cycle queries of ``focuser.position`` while a driver moves the focuser every
+  ``--cycle-interval`` seconds; latency is the delay from the end of the PUT to the delivery of the new position,
+* ``put_burst`` - PUTs moving the focuser,
+* ``mixed`` - fleet traffic: hits, misses and PUTs over mount, dome, focuser, camera and rotator.
+
+For every scenario throughput, p50 / p95 / p99 latency, errors and the lag of the server event loop (delay of a
+periodic ``sleep``) are reported and compared with a stored baseline. A metric worse than the baseline by more than
+``--tolerance`` is reported as a regression and the benchmark exits with status 1.
+
+Run::
+
+    python -m test.benchmark.bench_e2e --clients 32 --duration 10                  # compare with baseline.json
+    python -m test.benchmark.bench_e2e --clients 32 --duration 10 --save-baseline  # store a new baseline
+
+Baselines are machine specific, store one on the machine used for comparison before a change.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+import zmq
+import zmq.asyncio
+
+from obcom.comunication.message_serializer import MessageSerializer
+from obcom.comunication.multipart_structure import MultipartStructure
+from obcom.data_colection.value_call import ValueResponse
+from obsrv.communication.request_solver import RequestSolver
+from obsrv.communication.router import Router
+from obsrv.ob_config import SingletonConfig
+from obsrv.protocols.alpaca.alpaca_simulator import AlpacaSimulator, load_config
+from obsrv.tree_components.base_components.tree_base_broker import TreeBaseBroker
+from obsrv.tree_components.base_components.tree_base_broker_default_target import TreeBaseBrokerDefaultTarget
+from obsrv.tree_components.base_components.tree_provider import TreeProvider
+from obsrv.tree_components.specialized_components import TreeBaseRequestBlocker
+from obsrv.tree_components.specialized_components import TreeBlockerAccessGrantor
+from obsrv.tree_components.specialized_components import TreeCache
+from obsrv.tree_components.specialized_components import TreeConditionalFreezer
+from obsrv.tree_components.specialized_components.tree_alpaca import TreeAlpacaObservatory
+
+OBSERVATORY_NAME = 'dummytest'
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_SIMULATOR_CONFIG = {'latency': {'default': {'dist': 'lognormal', 'median': 0.002, 'sigma': 0.3}}}
+REQUEST_TIMEOUT = 10.0
+CYCLE_TOLERANCE = 1.0
+PERMISSION = {TreeBaseRequestBlocker.SPECIAL_PERMISSION_PARAM: True}
+
+# metric: True when a higher value is better
+METRICS = {'throughput': True, 'p50': False, 'p95': False, 'p99': False, 'loop_lag_p99': False}
+
+_HIT_ADDRESSES = ['mount.rightascension', 'mount.declination', 'mount.tracking', 'mount.slewing']
+_MISS_ADDRESSES = ['dome.azimuth', 'focuser.position', 'camera.camerastate', 'derotator.position']
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def _get(address: str, tolerance: float) -> dict:
+    now = time.time()
+    return {'address': {'adr': f'{OBSERVATORY_NAME}.{address}'}, 'time_of_data': now,
+            'time_of_data_tolerance': tolerance, 'request_timeout': now + REQUEST_TIMEOUT}
+
+
+def _put(address: str, **data) -> dict:
+    request = _get(address, 0.0)
+    request.update(request_type='PUT', request_data=dict(PERMISSION, **data))
+    return request
+
+
+def _cycle(address: str, time_of_known_change: Optional[float]) -> dict:
+    request = _get(address, CYCLE_TOLERANCE)
+    request.update(cycle_query=True, request_data={'time_of_known_change': time_of_known_change})
+    return request
+
+
+def _cache_hit(rng: random.Random, state: dict) -> dict:
+    return _get(rng.choice(_HIT_ADDRESSES), 3600.0)
+
+
+def _cache_miss(rng: random.Random, state: dict) -> dict:
+    return _get(rng.choice(_MISS_ADDRESSES), 0.0)
+
+
+def _put_burst(rng: random.Random, state: dict) -> dict:
+    return _put('focuser.move', Position=rng.randrange(0, 10000))
+
+
+def _mixed(rng: random.Random, state: dict) -> dict:
+    r = rng.random()
+    if r < 0.6:
+        return _cache_hit(rng, state) if rng.random() < 0.5 else _get(rng.choice(_MISS_ADDRESSES), 1.0)
+    if r < 0.95:
+        return _cache_miss(rng, state)
+    return _put_burst(rng, state)
+
+
+def _cycle_position(rng: random.Random, state: dict) -> dict:
+    return _cycle('focuser.position', state.get('ts'))
+
+
+SCENARIOS: Dict[str, Callable[[random.Random, dict], dict]] = {
+    'cache_hit': _cache_hit,
+    'cache_miss': _cache_miss,
+    'cycle': _cycle_position,
+    'put_burst': _put_burst,
+    'mixed': _mixed,
+}
+
+
+def _envelope(request: dict, msg_id: int) -> List[bytes]:
+    now = time.time()
+    ms = MultipartStructure.from_parts(create_time=MessageSerializer.pack_b(now),
+                                       id_=MessageSerializer.pack_b(msg_id),
+                                       data=[MessageSerializer.pack_b(request)],
+                                       request_timeout=MessageSerializer.pack_b(now + REQUEST_TIMEOUT),
+                                       service_msg=MessageSerializer.pack_b(False),
+                                       prefix_data=[])
+    return ms.multipart
+
+
+class _ClientResult:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors: Counter = Counter()
+
+
+async def _run_clients(port: int, scenario: str, clients: int, duration: float, seed: int,
+                       put_done: Dict[int, float]) -> _ClientResult:
+    make_request = SCENARIOS[scenario]
+    result = _ClientResult()
+    end = time.perf_counter() + duration
+    context = zmq.asyncio.Context()
+
+    async def client(nr: int):
+        rng = random.Random(seed * 1000 + nr)
+        state = {}
+        msg_id = 0
+        with context.socket(zmq.DEALER) as s:
+            s.setsockopt(zmq.LINGER, 0)
+            s.connect(f'tcp://localhost:{port}')
+            while time.perf_counter() < end:
+                msg_id += 1
+                t0 = time.perf_counter()
+                await s.send_multipart(_envelope(make_request(rng, state), msg_id))
+                try:
+                    answer = await asyncio.wait_for(s.recv_multipart(), REQUEST_TIMEOUT)
+                except asyncio.TimeoutError:
+                    result.errors['timeout'] += 1
+                    break  # the late answer would be taken as the answer of the next request
+                t1 = time.perf_counter()
+                response = ValueResponse.from_byte(MultipartStructure(answer, 0).data[0])
+                if not response.status:
+                    result.errors[str(response.error.code if response.error else None)] += 1
+                    continue
+                if scenario == 'cycle':
+                    state['ts'] = response.value.ts
+                    done = put_done.get(response.value.v)
+                    if done is not None:
+                        result.latencies.append(t1 - done)
+                else:
+                    result.latencies.append(t1 - t0)
+
+    try:
+        await asyncio.gather(*(client(i) for i in range(clients)))
+    finally:
+        context.destroy(linger=0)
+    return result
+
+
+class LoopLagMonitor:
+    """Measures how late a periodic sleep of the event loop wakes up."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval)
+            self.lags.append(loop.time() - t0 - self.interval)
+
+    def start(self):
+        self.lags = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> List[float]:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return sorted(self.lags)
+
+
+def _build_tree(port: int) -> Router:
+    alpaca = TreeAlpacaObservatory('alpaca-bench', observatory_name=OBSERVATORY_NAME)
+    blocker = TreeBaseRequestBlocker('alpaca-blocker-bench', alpaca)
+    grantor = TreeBlockerAccessGrantor('access-grantor-bench', 'access_grantor', blocker)
+    broker = TreeBaseBrokerDefaultTarget('broker-components-bench', [grantor], default_provider=blocker)
+    cache = TreeCache('cache-bench', broker)
+    freezer = TreeConditionalFreezer('conditional-freezer-bench', cache)
+    provider = TreeProvider('target-provider-bench', OBSERVATORY_NAME, freezer)
+    grantor.set_change_notifier(cache._report_new_value)
+    front = TreeBaseBroker('broker-front-bench', [provider])
+    return Router(request_solver=RequestSolver(data_provider=front), name='BenchmarkRouter', port=port)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+async def _cycle_driver(port: int, interval: float, put_done: Dict[int, float], stop: asyncio.Event):
+    """Moves the focuser to a new position every interval, remembers when each move was acknowledged."""
+    context = zmq.asyncio.Context()
+    position = 0
+    try:
+        with context.socket(zmq.DEALER) as s:
+            s.setsockopt(zmq.LINGER, 0)
+            s.connect(f'tcp://localhost:{port}')
+            while not stop.is_set():
+                position += 1
+                await s.send_multipart(_envelope(_put('focuser.move', Position=position), position))
+                await s.recv_multipart()
+                put_done[position] = time.perf_counter()
+                try:
+                    await asyncio.wait_for(stop.wait(), interval)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        context.destroy(linger=0)
+
+
+def _run_in_thread(coro_factory):
+    """Run clients on their own event loop so they do not disturb the measured loop of the server."""
+    def target():
+        return asyncio.run(coro_factory())
+    return asyncio.to_thread(target)
+
+
+async def run_scenario(port: int, scenario: str, args) -> dict:
+    put_done: Dict[int, float] = {}
+    monitor = LoopLagMonitor()
+    monitor.start()
+    stop_driver = threading.Event()
+    driver = None
+    if scenario == 'cycle':
+        async def driver_main():
+            stop = asyncio.Event()
+            task = asyncio.create_task(_cycle_driver(port, args.cycle_interval, put_done, stop))
+            while not stop_driver.is_set():
+                await asyncio.sleep(0.05)
+            stop.set()
+            await task
+        driver = asyncio.ensure_future(_run_in_thread(driver_main))
+    t0 = time.perf_counter()
+    result = await _run_in_thread(lambda: _run_clients(port, scenario, args.clients, args.duration, args.seed,
+                                                       put_done))
+    elapsed = time.perf_counter() - t0
+    if driver is not None:
+        stop_driver.set()
+        await driver
+    lags = await monitor.stop()
+    latencies = sorted(result.latencies)
+    return {
+        'throughput': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+        'requests': len(latencies),
+        'errors': dict(result.errors),
+        'loop_lag_p99': percentile(lags, 0.99) * 1000,
+        'loop_lag_max': (lags[-1] if lags else float('nan')) * 1000,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Return descriptions of metrics worse than baseline by more than tolerance (fraction)."""
+    regressions = []
+    for scenario, metrics in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            new, old = metrics.get(metric), base.get(metric)
+            if new is None or old is None or old <= 0:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f'{scenario}.{metric}: {old:.2f} -> {new:.2f} ({change:+.0%})')
+    return regressions
+
+
+def _print_results(results: Dict[str, dict], baseline: Dict[str, dict]):
+    print(f'{"scenario":>10} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"lag p99":>8} {"lag max":>8}'
+          f'  errors')
+    for scenario, m in results.items():
+        print(f'{scenario:>10} {m["throughput"]:9.1f} {m["p50"]:8.2f} {m["p95"]:8.2f} {m["p99"]:8.2f} '
+              f'{m["loop_lag_p99"]:8.2f} {m["loop_lag_max"]:8.2f}  {sum(m["errors"].values())} '
+              f'{m["errors"] if m["errors"] else ""}')
+        base = baseline.get(scenario)
+        if base:
+            print(f'{"baseline":>10} {base["throughput"]:9.1f} {base["p50"]:8.2f} {base["p95"]:8.2f} '
+                  f'{base["p99"]:8.2f} {base["loop_lag_p99"]:8.2f} {base["loop_lag_max"]:8.2f}')
+
+
+async def main_async(args) -> int:
+    SingletonConfig.add_config_file_from_config_dir('sample_config.yaml')
+    SingletonConfig.get_config(rebuild=True).get()
+    simulator = AlpacaSimulator(load_config(args.simulator_config) or DEFAULT_SIMULATOR_CONFIG, seed=args.seed)
+    url = await simulator.start()
+    SingletonConfig.get_config()['tree'][OBSERVATORY_NAME]['observatory']['address'].set(url)
+
+    port = _free_port()
+    router = _build_tree(port)
+    router.start()
+    await router.request_solver.run_tree()
+    results = {}
+    try:
+        for scenario in args.scenarios:
+            results[scenario] = await run_scenario(port, scenario, args)
+    finally:
+        router.stop()
+        await router.wait_for_stop()
+        await router.request_solver.stop_tree()
+        await simulator.stop()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get('scenarios', {})
+    _print_results(results, baseline)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': sys.version.split()[0],
+                       'machine': platform.node(), 'clients': args.clients, 'duration': args.duration,
+                       'scenarios': results}, f, indent=2)
+        print(f'baseline saved to {args.baseline}')
+        return 0
+    if not baseline:
+        print(f'no baseline in {args.baseline}, run with --save-baseline to store one')
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for r in regressions:
+        print(f'REGRESSION {r}')
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help='concurrent ZMQ clients')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds of load per scenario')
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--cycle-interval', type=float, default=0.2, help='seconds between focuser moves in cycle')
+    parser.add_argument('--simulator-config', help='YAML or JSON Alpaca simulator configuration')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed relative worsening of a metric')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == '__main__':
+    main()
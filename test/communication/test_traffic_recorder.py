@@ -0,0 +1,58 @@
+import os
+import tempfile
+import time
+import unittest
+
+from obsrv.communication.traffic_recorder import TrafficRecorder, read_traffic_log, traffic_log_files, client_hash
+
+
+class TrafficRecorderTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'traffic.bin')
+
+    def tearDown(self):
+        self.dir.cleanup()
+        super().tearDown()
+
+    def test_record_and_read(self):
+        recorder = TrafficRecorder(self.path)
+        recorder.record(b'client1', [b'request1'], timeout=time.time() + 30)
+        recorder.record(b'client2', [b'a', b'bb'], service=True)
+        recorder.close()
+        records = list(read_traffic_log(self.path))
+        self.assertEqual([r.frames for r in records], [[b'request1'], [b'a', b'bb']])
+        self.assertEqual(records[0].client, client_hash(b'client1'))
+        self.assertAlmostEqual(records[0].timeout, 30, delta=1)
+        self.assertTrue(records[1].service)
+        self.assertLessEqual(records[0].ts, records[1].ts)
+
+    def test_rotation_keeps_order(self):
+        recorder = TrafficRecorder(self.path, max_bytes=200, backups=2)
+        for i in range(20):
+            recorder.record(b'client', [f'request{i:02d}'.encode() * 2])
+        recorder.close()
+        self.assertEqual(traffic_log_files(self.path), [self.path + '.2', self.path + '.1', self.path])
+        frames = [r.frames[0] for r in read_traffic_log(self.path)]
+        self.assertEqual(frames, sorted(frames))  # oldest files dropped, the rest in order
+        self.assertEqual(frames[-1], b'request19' * 2)
+        self.assertLess(len(frames), 20)
+
+    def test_truncated_record_is_skipped(self):
+        recorder = TrafficRecorder(self.path)
+        recorder.record(b'client', [b'complete'])
+        recorder.record(b'client', [b'cut in the middle'])
+        recorder.close()
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 5)
+        self.assertEqual([r.frames for r in read_traffic_log(self.path)], [[b'complete']])
+
+    def test_disabled_by_config(self):
+        self.assertIsNone(TrafficRecorder.from_config({'enabled': False, 'path': self.path}))
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import struct
+import unittest
+
+from obsrv.protocols.alpaca.alpaca_exceptions import AlpacaError, AlpacaImageBytesError
+from obsrv.protocols.alpaca.alpaca_imagebytes import ImageBytesArray, encode_imagebytes, HEADER_SIZE
+
+
+class ImageBytesArrayTest(unittest.TestCase):
+
+    def test_decode_int32_frame(self):
+        """Pixels are exposed as a memoryview with the image shape, without copying the body"""
+        pixels = list(range(12))
+        body = encode_imagebytes(struct.pack('<12i', *pixels), shape=(3, 4), transmission_type=2)
+        img = ImageBytesArray(body)
+        self.assertEqual(img.shape, (3, 4))
+        self.assertEqual(img.dtype, '<i4')
+        self.assertEqual(img.data.format, 'i')
+        self.assertEqual(img.data[1, 2], 6)
+        self.assertEqual(img.nbytes, 48)
+        self.assertIs(img.data.obj, body)
+
+    def test_transmission_type_narrower_than_element_type(self):
+        body = encode_imagebytes(struct.pack('<4H', 1, 2, 3, 65535), shape=(2, 2), transmission_type=8,
+                                 element_type=2)
+        img = ImageBytesArray(body)
+        self.assertEqual(img.element_type, 2)
+        self.assertEqual(img.dtype, '<u2')
+        self.assertEqual(img.data[1, 1], 65535)
+
+    def test_to_value_chunks(self):
+        raw = struct.pack('<10h', *range(10))
+        img = ImageBytesArray(encode_imagebytes(raw, shape=(5, 2), transmission_type=1))
+        value = img.to_value(chunk_size=8)
+        self.assertEqual(value['shape'], [5, 2])
+        self.assertEqual(value['nbytes'], 20)
+        self.assertEqual([len(c) for c in value['chunks']], [8, 8, 4])
+        self.assertEqual(b''.join(value['chunks']), raw)
+
+    def test_error_frame(self):
+        body = encode_imagebytes(b'', shape=(0, 0), transmission_type=2, error_number=1031,
+                                 error_message='Not connected')
+        with self.assertRaises(AlpacaError) as ctx:
+            ImageBytesArray(body)
+        self.assertEqual(ctx.exception.error_number, 1031)
+
+    def test_malformed_frames(self):
+        with self.assertRaises(AlpacaImageBytesError):
+            ImageBytesArray(b'\0' * (HEADER_SIZE - 1))
+        # payload shorter than shape
+        body = encode_imagebytes(struct.pack('<3i', 1, 2, 3), shape=(2, 2), transmission_type=2)
+        with self.assertRaises(AlpacaImageBytesError):
+            ImageBytesArray(body)
+        body = encode_imagebytes(b'\0' * 4, shape=(1, 1), transmission_type=42)
+        with self.assertRaises(AlpacaImageBytesError):
+            ImageBytesArray(body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import random
+import unittest
+
+from obsrv.protocols.alpaca.alpaca_connector import AlpacaConnector
+from obsrv.protocols.alpaca.alpaca_exceptions import AlpacaError, AlpacaHttp500Error, RequestConnectionError
+from obsrv.protocols.alpaca.alpaca_imagebytes import ImageBytesArray
+from obsrv.protocols.alpaca.alpaca_simulator import AlpacaSimulator, sample_latency, ERROR_BUSY
+from obsrv.protocols.circuit_breaker import CircuitBreakerSet, CircuitOpenError, STATE_OPEN
+from obsrv.protocols.connector_registry import normalize_endpoint
+
+
+class AlpacaSimulatorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def _start(self, config=None):
+        self.simulator = AlpacaSimulator(config, seed=1)
+        self.url = await self.simulator.start()
+        self.connector = AlpacaConnector()
+        await self.connector.create_http_session()
+
+    async def asyncTearDown(self):
+        await self.connector.close()
+        await self.simulator.stop()
+
+    async def test_get_put_round_trip(self):
+        await self._start()
+        self.assertTrue(await self.connector._get(f'{self.url}/safetymonitor/0/issafe'))
+        await self.connector._put(f'{self.url}/focuser/0/move', Position=1234)
+        self.assertEqual(await self.connector._get(f'{self.url}/focuser/0/position'), 1234)
+        await self.connector._put(f'{self.url}/telescope/0/tracking', Tracking=True)
+        self.assertIs(await self.connector._get(f'{self.url}/telescope/0/tracking'), True)
+        state = await self.connector._get(f'{self.url}/dome/0/devicestate')
+        self.assertIn({'Name': 'shutterstatus', 'Value': 1}, state)
+        with self.assertRaises(AlpacaError):
+            await self.connector._get(f'{self.url}/dome/0/notavariable')
+        self.assertEqual(self.simulator.stats['focuser.position'], 1)
+
+    async def test_imagebytes(self):
+        await self._start({'image_size': [8, 4]})
+        image = await self.connector._get(f'{self.url}/camera/0/imagearray', accept_imagebytes=True)
+        self.assertIsInstance(image, ImageBytesArray)
+        self.assertEqual(tuple(image.shape), (8, 4))
+        pixels = await self.connector._get(f'{self.url}/camera/0/imagearray')
+        self.assertEqual(pixels[0], list(range(4)))
+
+    async def test_fault_injection(self):
+        await self._start({'faults': {'default': {}, 'camera.*': {'busy': 1.0}, 'dome.*': {'http_500': 1.0},
+                                      'focuser.*': {'reset': 1.0}}})
+        with self.assertRaises(AlpacaError) as cm:
+            await self.connector._get(f'{self.url}/camera/0/camerastate')
+        self.assertEqual(cm.exception.error_number, ERROR_BUSY)
+        with self.assertRaises(AlpacaHttp500Error):
+            await self.connector._get(f'{self.url}/dome/0/azimuth')
+        with self.assertRaises(RequestConnectionError):
+            await self.connector._get(f'{self.url}/focuser/0/position')
+        self.assertEqual(self.simulator.stats['fault:busy'], 1)
+        self.assertEqual(await self.connector._get(f'{self.url}/rotator/0/position'), 0.0)
+
+    async def test_reset_opens_circuit_breaker(self):
+        await self._start({'faults': {'default': {}, 'focuser.*': {'reset': 1.0}}})
+        self.connector._breakers = CircuitBreakerSet(failure_threshold=2, open_duration=30)
+        url = f'{self.url}/focuser/0/position'
+        for _ in range(2):
+            with self.assertRaises(RequestConnectionError):
+                await self.connector._guarded(url, lambda: self.connector._get(url))
+        with self.assertRaises(CircuitOpenError):
+            await self.connector._guarded(url, lambda: self.connector._get(url))
+        self.assertEqual(self.simulator.stats['fault:reset'], 2)  # the last request was not sent
+        self.assertEqual(self.connector.circuit_breaker_states()[normalize_endpoint(url)]['state'], STATE_OPEN)
+
+    async def test_get_is_retried_after_reset(self):
+        # with seed 1 the first request draws a reset and the second one does not
+        await self._start({'faults': {'default': {}, 'focuser.position': {'reset': 0.5}}})
+        self.connector._breakers = CircuitBreakerSet(enabled=False)
+        self.assertEqual(await self.connector._hedged_get(f'{self.url}/focuser/0/position'), 0)
+        self.assertEqual(self.simulator.stats['fault:reset'], 1)
+        self.assertEqual(self.simulator.stats['focuser.position'], 2)
+
+
+class SampleLatencyTest(unittest.TestCase):
+
+    def test_distributions(self):
+        rng = random.Random(1)
+        self.assertEqual(sample_latency(None, rng), 0.0)
+        self.assertEqual(sample_latency({'dist': 'fixed', 'value': 0.2}, rng), 0.2)
+        self.assertTrue(0.1 <= sample_latency({'dist': 'uniform', 'low': 0.1, 'high': 0.2}, rng) <= 0.2)
+        self.assertGreaterEqual(sample_latency({'dist': 'normal', 'mean': 0.0, 'stddev': 1.0}, rng), 0.0)
+        self.assertGreater(sample_latency({'dist': 'lognormal', 'median': 0.01, 'sigma': 0.5}, rng), 0.0)
+        with self.assertRaises(ValueError):
+            sample_latency({'dist': 'pareto'}, rng)
+
+
+if __name__ == '__main__':
+    unittest.main()
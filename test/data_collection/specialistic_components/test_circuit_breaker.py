@@ -0,0 +1,89 @@
+import time
+import unittest
+from unittest import mock
+
+from obsrv.protocols.circuit_breaker import CircuitBreaker, CircuitBreakerSet, CircuitOpenError, STATE_CLOSED, \
+    STATE_OPEN, STATE_HALF_OPEN
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(time, 'monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('http://alpaca:80', failure_threshold=3, open_duration=30,
+                                      slow_call_threshold=5)
+
+    def _open(self):
+        for _ in range(3):
+            self.breaker.acquire()
+            self.breaker.record_failure()
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success(0.1)  # resets the count
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.acquire()
+        self.assertEqual(self.breaker.describe()['rejected'], 1)
+
+    def test_slow_calls_count_as_failures(self):
+        for _ in range(3):
+            self.breaker.record_success(6.0)
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+
+    def test_single_probe_in_half_open(self):
+        self._open()
+        self.now += 30
+        self.assertEqual(self.breaker.state, STATE_HALF_OPEN)
+        self.assertTrue(self.breaker.acquire())
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.acquire()  # probe already in flight
+        self.breaker.record_success(0.1)
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+        self.assertFalse(self.breaker.acquire())
+
+    def test_failed_probe_reopens(self):
+        self._open()
+        self.now += 30
+        self.breaker.acquire()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        self.now += 29
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.acquire()
+        self.assertEqual(self.breaker.open_count, 2)
+
+    def test_late_failures_do_not_extend_open_window(self):
+        self._open()
+        self.now += 20
+        self.breaker.record_failure()  # call sent before the breaker opened
+        self.assertEqual(self.breaker.open_count, 1)
+        self.now += 10
+        self.assertEqual(self.breaker.state, STATE_HALF_OPEN)
+
+    def test_fast_cancelled_probe_frees_the_slot(self):
+        self._open()
+        self.now += 30
+        self.breaker.acquire()
+        self.breaker.record_cancelled(0.5)
+        self.assertTrue(self.breaker.acquire())
+
+    def test_breaker_set(self):
+        breakers = CircuitBreakerSet(failure_threshold=1)
+        breakers.get('a').record_failure()
+        self.assertIs(breakers.get('a'), breakers.get('a'))
+        self.assertEqual(breakers.describe()['a']['state'], STATE_OPEN)
+        self.assertEqual(breakers.get('b').state, STATE_CLOSED)
+        self.assertIsNone(CircuitBreakerSet(enabled=False).get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+from obsrv.protocols.connector_registry import ConnectorRegistry, normalize_endpoint
+
+
+class _FakeConnector:
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class _TestRegistry(ConnectorRegistry):
+    @staticmethod
+    def _create(protocol: str):
+        return _FakeConnector(protocol)
+
+
+class ConnectorRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = _TestRegistry()
+        self.registry._entries.clear()
+
+    def test_normalize_endpoint(self):
+        self.assertEqual(normalize_endpoint('http://LocalHost:80/api/v1'), 'http://localhost:80')
+        self.assertEqual(normalize_endpoint('192.168.1.10:65432'), '192.168.1.10:65432')
+        self.assertIsNone(normalize_endpoint(None))
+
+    def test_shared_and_refcounted(self):
+        self.assertIs(_TestRegistry(), self.registry)
+        c1 = self.registry.acquire('alpaca', 'http://localhost:80/api/v1')
+        c2 = self.registry.acquire('alpaca', 'http://localhost:80/api/v2')
+        c3 = self.registry.acquire('alpaca', 'http://otherhost:80/api/v1')
+        c4 = self.registry.acquire('pilar', 'localhost:80')
+        self.assertIs(c1, c2)
+        self.assertIsNot(c1, c3)
+        self.assertIsNot(c1, c4)
+        self.assertEqual(len(self.registry), 3)
+
+        self.assertFalse(self.registry.release(c1))
+        self.assertFalse(c1.closed)
+        self.assertTrue(self.registry.release(c2))
+        self.assertTrue(c1.closed)
+        self.assertEqual(len(self.registry), 2)
+        self.assertFalse(self.registry.release(c1))  # unknown connector
+
+        c5 = self.registry.acquire('alpaca', 'http://localhost:80/api/v1')
+        self.assertIsNot(c5, c1)
+
+
+if __name__ == '__main__':
+    unittest.main()
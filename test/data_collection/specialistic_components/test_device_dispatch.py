@@ -0,0 +1,58 @@
+import unittest
+
+from obsrv.telescope_devices.device_tree import Observatory, DISPATCH_MEMO_SIZE
+
+
+class _FakeConnector:
+    def __init__(self):
+        self.requests = []
+
+    async def get(self, component, variable, kind=None, **data):
+        self.requests.append(('GET', component.sys_id, variable, data))
+        return 12.0
+
+    async def put(self, component, variable, kind=None, **data):
+        self.requests.append(('PUT', component.sys_id, variable, data))
+        return None
+
+
+class DeviceDispatchTest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.connector = _FakeConnector()
+        self.obs = Observatory()
+        self.obs._connector = self.connector
+        self.obs.add_component('telescope', 'telescope', components={'derotator': {'kind': 'rotator'}})
+        self.obs.add_component('dome', 'dome')
+        self.obs.build_dispatch_table()
+
+    async def test_known_entries_are_resolved_ahead(self):
+        entry = self.obs.dispatch(('telescope', 'rightascension'), 'GET')
+        self.assertIs(entry, self.obs._dispatch_table[('telescope', 'rightascension', 'GET')])
+        self.assertIsNotNone(entry.result_processor)
+        self.assertEqual(await entry.execute(), 180.0)  # hours are delivered in degrees
+        self.assertIn(('dome', 'domefansturnon', 'PUT'), self.obs._dispatch_table)
+
+    async def test_dynamic_address_is_memoized(self):
+        entry = self.obs.dispatch(('telescope', 'derotator', 'position'), 'GET')
+        self.assertIs(self.obs.dispatch(('telescope', 'derotator', 'position'), 'GET'), entry)
+        self.assertEqual(await entry.execute(), 12.0)
+        await self.obs.dispatch(('telescope', 'derotator', 'position'), 'PUT').execute(Position=3)
+        self.assertEqual(self.connector.requests[-1], ('PUT', 'telescope.derotator', 'position', {'Position': 3}))
+        for i in range(DISPATCH_MEMO_SIZE + 10):
+            self.obs.dispatch(('dome', f'variable{i}'), 'GET')
+        self.assertEqual(len(self.obs._dispatch_memo), DISPATCH_MEMO_SIZE)
+
+    async def test_unknown_component(self):
+        with self.assertRaises(KeyError):
+            self.obs.dispatch(('nothing', 'position'), 'GET')
+
+    async def test_new_processor_invalidates_entries(self):
+        entry = self.obs.dispatch(('dome', 'azimuth'), 'GET')
+        self.obs.dome.add_alpaca_get_response_process('azimuth', lambda attribute, res: res + 1)
+        self.assertIsNot(self.obs.dispatch(('dome', 'azimuth'), 'GET'), entry)
+        self.assertEqual(await self.obs.dome.get('azimuth'), 13.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import asyncio
+import math
+import unittest
+
+import numpy as np
+
+from obsrv.utils.ephemeris_tables import DAY, EphemerisTables, NightlyEphemeris, build_tables, night_start
+
+OCM = dict(latitude=-24.598, longitude=-70.197, height=2817.0)  # Cerro Armazones
+
+
+def _synthetic_tables(start: float = 0.0) -> EphemerisTables:
+    times = start + np.arange(0.0, DAY + 60, 60)
+    phase = 2 * math.pi * (times - start) / DAY
+    sun_alt = 40 * np.cos(phase)  # noon at the start, midnight -40 deg
+    return EphemerisTables(times=times, sun_alt=sun_alt, sun_az=(times - start) / DAY * 720 % 360,
+                           moon_alt=np.full_like(times, 30.0), moon_az=np.full_like(times, 359.99),
+                           moon_ra=np.where(times < start + DAY / 2, 359.5, 0.5), moon_dec=np.zeros_like(times),
+                           moon_illumination=np.linspace(0.2, 0.3, len(times)))
+
+
+class EphemerisTablesTest(unittest.TestCase):
+
+    def test_interpolation(self):
+        tables = _synthetic_tables()
+        alt, az = tables.sun_altaz(DAY / 4)
+        self.assertAlmostEqual(alt, 0.0, places=6)
+        self.assertAlmostEqual(az, 180.0, places=6)
+        # between 359.5 and 0 deg, not interpolated through 180
+        self.assertAlmostEqual(tables.sun_altaz(DAY / 2 - 30)[1], 359.75, places=6)
+        self.assertAlmostEqual(tables.moon_altaz(DAY / 2 - 30)[1], 359.99, places=6)
+        alts, _ = tables.sun_altaz(np.array([0.0, DAY / 2]))
+        np.testing.assert_allclose(alts, [40.0, -40.0])
+        self.assertAlmostEqual(tables.moon_phase(DAY / 2), 0.25, places=6)
+        self.assertTrue(tables.covers(DAY))
+        self.assertFalse(tables.covers(DAY + 1))
+
+    def test_twilight_times(self):
+        twilight = _synthetic_tables(start=1000.0).twilight_times()
+        for evening, morning, level in (('sunset', 'sunrise', -0.833), ('astronomical_dusk', 'astronomical_dawn', -18)):
+            expected = math.acos(level / 40) / (2 * math.pi) * DAY
+            self.assertAlmostEqual(twilight[evening], 1000.0 + expected, delta=2.0)
+            self.assertAlmostEqual(twilight[morning], 1000.0 + DAY - expected, delta=2.0)
+
+    def test_moon_separation(self):
+        tables = _synthetic_tables()
+        self.assertAlmostEqual(tables.moon_separation(0.0, 0.0, DAY / 4), 0.5, places=6)
+        self.assertAlmostEqual(tables.moon_separation(0.5, 10.0, 3 * DAY / 4), 10.0, places=6)
+        np.testing.assert_allclose(tables.moon_separation(np.array([0.0, 90.0]), 0.0, 3 * DAY / 4), [0.5, 89.5])
+
+    def test_night_start(self):
+        t = 1700000000.0
+        start = night_start(t, OCM['longitude'])
+        self.assertLessEqual(start, t)
+        self.assertLess(t - start, DAY)
+        # local mean noon at longitude -70.197 is 16:40:47 UTC
+        self.assertAlmostEqual(start % DAY, DAY / 2 + 70.197 / 360 * DAY, places=3)
+
+
+class BuildTablesTest(unittest.TestCase):
+
+    def test_against_direct_astropy(self):
+        import astropy.units as u
+        from astropy.coordinates import AltAz, EarthLocation, get_body, get_sun
+        from astropy.time import Time
+
+        start = night_start(1700000000.0, OCM['longitude'])
+        tables = build_tables(**OCM, start=start, step=300)
+        t = start + 12345.6
+        location = EarthLocation(lat=OCM['latitude'] * u.deg, lon=OCM['longitude'] * u.deg, height=OCM['height'] * u.m)
+        frame = AltAz(obstime=Time(t, format='unix'), location=location)
+        sun = get_sun(frame.obstime).transform_to(frame)
+        moon = get_body('moon', frame.obstime, location).transform_to(frame)
+        self.assertAlmostEqual(tables.sun_altaz(t)[0], sun.alt.deg, delta=0.01)
+        self.assertAlmostEqual(tables.sun_altaz(t)[1], sun.az.deg, delta=0.01)
+        self.assertAlmostEqual(tables.moon_altaz(t)[0], moon.alt.deg, delta=0.05)
+        twilight = tables.twilight_times()
+        self.assertLess(twilight['sunset'], twilight['astronomical_dusk'])
+        self.assertLess(twilight['astronomical_dawn'], twilight['sunrise'])
+        self.assertAlmostEqual(tables.sun_altaz(twilight['civil_dusk'])[0], -6.0, delta=0.01)
+
+    def test_nightly_builds_once(self):
+        ephemeris = NightlyEphemeris(**OCM, step=600, keep=1)
+
+        async def query():
+            t = 1700000000.0
+            first, second = await asyncio.gather(ephemeris.tables(t), ephemeris.tables(t + 60))
+            next_night = await ephemeris.tables(t + DAY)
+            return first, second, next_night
+
+        first, second, next_night = asyncio.run(query())
+        self.assertIs(first, second)
+        self.assertIsNot(first, next_night)
+        self.assertIsNone(ephemeris.cached(1700000000.0))  # keep=1 dropped the first night
+        self.assertIs(ephemeris.cached(1700000000.0 + DAY), next_night)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import asyncio
+import math
+import os
+import threading
+import unittest
+
+from obsrv.utils.executors import PROCESS, Executors
+
+
+def _job(x, power=1):
+    return threading.get_ident(), os.getpid(), x ** power
+
+
+class ExecutorsTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executors = Executors()
+        self.thresholds = dict(self.executors.thresholds)
+        self.executors.thresholds['test_bytes'] = 1000
+
+    def tearDown(self):
+        self.executors.thresholds = self.thresholds
+        super().tearDown()
+
+    def test_singleton(self):
+        self.assertIs(Executors(), self.executors)
+
+    def test_small_jobs_run_inline(self):
+        async def scenario():
+            loop_thread = threading.get_ident()
+            small = await self.executors.run(_job, 3, power=2, size=999, threshold='test_bytes')
+            big = await self.executors.run(_job, 3, power=2, size=1000, threshold='test_bytes')
+            no_size = await self.executors.run(_job, 4)
+            return loop_thread, small, big, no_size
+
+        loop_thread, small, big, no_size = asyncio.run(scenario())
+        self.assertEqual(small, (loop_thread, os.getpid(), 9))
+        self.assertNotEqual(big[0], loop_thread)
+        self.assertEqual(big[2], 9)
+        self.assertNotEqual(no_size[0], loop_thread)
+
+    def test_process_pool(self):
+        async def scenario():
+            return await asyncio.gather(*(self.executors.run(_job, i, pool=PROCESS) for i in range(4)),
+                                        self.executors.run(math.factorial, 20, pool=PROCESS))
+
+        *results, factorial = asyncio.run(scenario())
+        self.assertEqual([r[2] for r in results], [0, 1, 2, 3])
+        if self.executors.process_workers > 0:
+            self.assertTrue(all(r[1] != os.getpid() for r in results))
+        self.assertEqual(factorial, math.factorial(20))
+
+    def test_errors_are_raised(self):
+        async def scenario():
+            await self.executors.run(_job, 'x', power=2)
+
+        with self.assertRaises(TypeError):
+            asyncio.run(scenario())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import unittest
+
+from obsrv.protocols.iris_ccd.iris_ccd_connector import IrisCcdConnector, IrisCcdEndpoint
+
+ADDRESS = '127.0.0.1:7000'
+
+
+class _FakeTransport:
+    def __init__(self):
+        self.sent = []
+        self.closed = False
+
+    def sendto(self, data: bytes):
+        self.sent.append(data.rstrip(b'\0').decode('utf-8'))
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeSocketConnector(IrisCcdConnector):
+    """Connector whose endpoints use fake transports, a new one for every new socket."""
+
+    def __init__(self, timeout: float):
+        super().__init__()
+        self._timeout = timeout
+        self._token_echo = False
+        self.transports = []
+
+    async def _get_endpoint(self, address: str) -> IrisCcdEndpoint:
+        endpoint = self._endpoints.get(address)
+        if endpoint is None or endpoint.closing:
+            self.transports.append(_FakeTransport())
+            endpoint = self._endpoints[address] = IrisCcdEndpoint(self.transports[-1], self._packet_size)
+        return endpoint
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class IrisCcdCorrelatorTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_token_echo_allows_concurrent_commands(self):
+        transport = _FakeTransport()
+        endpoint = IrisCcdEndpoint(transport, packet_size=64, token_echo=True)
+        t1 = asyncio.create_task(endpoint.request('sync', timeout=1))
+        t2 = asyncio.create_task(endpoint.request('filter status', timeout=1))
+        await _settle()
+        self.assertEqual(transport.sent, ['#1 sync', '#2 filter status'])
+
+        endpoint.response_received(b'#7 OKAY late\0')  # unknown token is dropped
+        endpoint.response_received(b'#2 OKAY 3\0\0')
+        endpoint.response_received(b'#1 OKAY idle\0')
+        self.assertEqual(await t1, b'OKAY idle\0')
+        self.assertEqual(await t2, b'OKAY 3\0\0')
+        self.assertEqual(endpoint.stats['sync'].count, 1)
+        self.assertEqual(endpoint.stats['filter'].count, 1)
+
+    async def test_serialized_mode_coalesces_duplicate_gets(self):
+        transport = _FakeTransport()
+        endpoint = IrisCcdEndpoint(transport, packet_size=64, token_echo=False)
+        tasks = [asyncio.create_task(endpoint.request('sync', timeout=1, coalesce=True)) for _ in range(3)]
+        other = asyncio.create_task(endpoint.request('filter status', timeout=1, coalesce=True))
+        await _settle()
+        self.assertEqual(transport.sent, ['sync'])  # one datagram, next command waits for the response
+
+        endpoint.response_received(b'OKAY idle')
+        for t in tasks:
+            self.assertEqual(await t, b'OKAY idle')
+        await _settle()
+        self.assertEqual(transport.sent, ['sync', 'filter status'])
+        endpoint.response_received(b'OKAY 2')
+        self.assertEqual(await other, b'OKAY 2')
+        self.assertEqual(endpoint.stats['sync'].count, 1)
+        self.assertEqual(endpoint.stats['sync'].coalesced, 2)
+
+    async def test_timeout_and_transport_error(self):
+        endpoint = IrisCcdEndpoint(_FakeTransport(), packet_size=64, token_echo=True)
+        with self.assertRaises(asyncio.TimeoutError):
+            await endpoint.request('sync', timeout=0.01)
+        self.assertEqual(endpoint.stats['sync'].timeouts, 1)
+
+        t = asyncio.create_task(endpoint.request('sync', timeout=1))
+        await _settle()
+        endpoint.fail_pending(ConnectionRefusedError())
+        with self.assertRaises(ConnectionRefusedError):
+            await t
+        self.assertEqual(endpoint.stats['sync'].errors, 1)
+
+    async def test_timeout_does_not_fail_queued_command(self):
+        connector = _FakeSocketConnector(timeout=0.05)
+        first = asyncio.create_task(connector._execute_command(ADDRESS, 'sync'))
+        second = asyncio.create_task(connector._execute_command(ADDRESS, 'filter status'))
+        await _settle()
+        self.assertEqual(connector.transports[0].sent, ['sync'])  # second waits for the response
+
+        with self.assertRaises(TimeoutError):
+            await first
+        await _settle()
+        self.assertTrue(connector.transports[0].closed)
+        self.assertEqual(connector.transports[0].sent, ['sync'])
+        self.assertEqual(connector.transports[1].sent, ['filter status'])
+        connector._endpoints[ADDRESS].response_received(b'OKAY 2')
+        self.assertEqual(await second, '2')
+
+
+if __name__ == '__main__':
+    unittest.main()
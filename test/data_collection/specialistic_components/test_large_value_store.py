@@ -0,0 +1,88 @@
+import unittest
+
+from obcom.comunication.message_serializer import MessageSerializer
+from obsrv.utils.large_value_store import LargeValueStore, LARGE_VALUE_KEY, ENCODING_IMAGEBYTES, ENCODING_MSGPACK, \
+    ENCODING_STR
+
+
+class LargeValueStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = LargeValueStore(spool_size=35, threshold=3, chunk_size=4)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_small_values_stay_inline(self):
+        self.assertIsNone(self.store.offload(b'ab'))
+        self.assertIsNone(self.store.offload(12345))
+        self.assertIsNone(self.store.offload({}))
+        self.assertEqual(len(self.store), 0)
+
+    def test_offload_and_read_chunks(self):
+        """Large value is replaced by handle and can be read back in chunks"""
+        handle = self.store.offload(b'0123456789')
+        self.assertEqual(handle['nbytes'], 10)
+        h = handle[LARGE_VALUE_KEY]
+        self.assertEqual(list(self.store.iter_chunks(h)), [b'0123', b'4567', b'89'])
+        self.assertEqual(list(self.store.iter_chunks(h, offset=2, length=3)), [b'234'])
+        self.assertEqual(self.store.describe(h)['nbytes'], 10)
+        self.assertEqual(self.store.get_handle(handle), h)
+
+    def test_offload_imagebytes_value_and_str(self):
+        image = {'format': 'imagebytes', 'shape': [2, 3], 'dtype': '<u2', 'chunks': [b'abcd', b'ef']}
+        handle = self.store.offload(image)
+        self.assertEqual(handle['encoding'], ENCODING_IMAGEBYTES)
+        self.assertEqual(handle['meta']['shape'], [2, 3])
+        self.assertNotIn('chunks', handle['meta'])
+        self.assertEqual(self.store.read(handle[LARGE_VALUE_KEY]), b'abcdef')
+        handle = self.store.offload('żółw')
+        self.assertEqual(handle['encoding'], ENCODING_STR)
+        self.assertEqual(self.store.read(handle[LARGE_VALUE_KEY]).decode(), 'żółw')
+
+    def test_offload_nested_list_and_dict(self):
+        """Nested lists (JSON image arrays) and documents are offloaded by their packed size"""
+        store = LargeValueStore(spool_size=64 * 1024, threshold=1000)
+        try:
+            image = [list(range(50)) for _ in range(40)]  # far fewer rows than threshold
+            plan = {'name': 'night', 'targets': [{'name': f'target{i}', 'ra': float(i), 'dec': -float(i)}
+                                                 for i in range(40)]}
+            for v in (image, plan):
+                handle = store.offload(v)
+                self.assertEqual(handle['encoding'], ENCODING_MSGPACK)
+                self.assertEqual(MessageSerializer.from_bytes(store.read(handle[LARGE_VALUE_KEY])), v)
+            self.assertIsNone(store.offload([[1, 2], [3, 4]]))
+            self.assertIsNone(store.offload({'a': [1, 2], 'b': 'text'}))
+        finally:
+            store.close()
+
+    def test_ring_eviction_by_total_size(self):
+        """Oldest objects are evicted when the spool is full, total size never exceeds the spool"""
+        handles = [self.store.offload(c.encode() * size)
+                   for c, size in zip('abcdefgh', [10, 10, 10, 3, 10, 10, 10, 10])]
+        alive = [h for h in handles if self.store.is_alive(h)]
+        self.assertEqual([self.store.read(h[LARGE_VALUE_KEY]) for h in alive],
+                         [b'f' * 10, b'g' * 10, b'h' * 10])
+        self.assertEqual(self.store.total_bytes, 30)
+        self.assertFalse(self.store.is_alive(handles[0]))
+        with self.assertRaises(KeyError):
+            self.store.read(handles[0][LARGE_VALUE_KEY])
+
+    def test_fetch_is_limited_and_validated(self):
+        """One fetch returns at most max_chunks chunks and the offset to continue from"""
+        self.store.max_chunks = 2
+        h = self.store.offload(b'0123456789')[LARGE_VALUE_KEY]
+        self.assertEqual(self.store.fetch(h), ([b'0123', b'4567'], 8))
+        self.assertEqual(self.store.fetch(h, offset=8), ([b'89'], None))
+        self.assertEqual(self.store.fetch(h, offset=1, length=5), ([b'1234', b'5'], None))
+        self.assertEqual(self.store.fetch(h, offset=20), ([], None))
+        for offset, length in (('1', None), (-1, None), (0, -4), (0, 2.5), (True, None)):
+            with self.assertRaises(ValueError):
+                self.store.fetch(h, offset=offset, length=length)
+
+    def test_too_large_for_spool(self):
+        self.assertIsNone(self.store.offload(b'x' * 36))
+
+
+if __name__ == '__main__':
+    unittest.main()
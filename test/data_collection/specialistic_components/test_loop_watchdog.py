@@ -0,0 +1,57 @@
+import asyncio
+import time
+import unittest
+
+from obsrv.utils.loop_watchdog import LoopWatchdog
+
+
+def _blocking_computation(seconds: float):
+    time.sleep(seconds)  # synchronous work holding the loop
+
+
+class LoopWatchdogTest(unittest.TestCase):
+    THRESHOLD = 0.05
+
+    def _run(self, scenario) -> LoopWatchdog:
+        loop = asyncio.new_event_loop()
+        watchdog = LoopWatchdog(loop, threshold=self.THRESHOLD, report_interval=0)
+        watchdog.start()
+        try:
+            loop.run_until_complete(scenario())
+        finally:
+            watchdog.stop()
+            loop.close()
+        return watchdog
+
+    def test_blocking_call_is_reported(self):
+        async def scenario():
+            await asyncio.sleep(0.05)
+            for _ in range(2):
+                _blocking_computation(0.2)
+                await asyncio.sleep(0.1)
+
+        watchdog = self._run(scenario)
+        self.assertEqual(watchdog.stalls, 2)
+        report = watchdog.report()
+        self.assertEqual(len(report), 1)
+        blocker = report[0]
+        self.assertEqual(blocker['count'], 2)
+        self.assertIn('_blocking_computation', blocker['stack'][-1])
+        self.assertIn('scenario', blocker['stack'][-2])
+        self.assertGreater(blocker['max_s'], 0.1)
+        self.assertLess(blocker['max_s'], 0.4)
+
+    def test_idle_and_busy_loop_is_not_a_stall(self):
+        async def scenario():
+            await asyncio.sleep(0.2)
+            for _ in range(100):
+                _blocking_computation(0.001)
+                await asyncio.sleep(0)
+
+        watchdog = self._run(scenario)
+        self.assertEqual(watchdog.stalls, 0)
+        self.assertEqual(watchdog.report(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
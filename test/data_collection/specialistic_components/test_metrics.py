@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+
+import aiohttp
+
+from obsrv.utils.metrics import COUNTER, GAUGE, MetricsExporter, MetricsRegistry
+
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry = MetricsRegistry()
+
+    def test_counter_children_are_preallocated(self):
+        requests = self.registry.counter('test_requests_total', 'Requests', ('kind',))
+        get = requests.labels('get')
+        self.assertIs(requests.labels('get'), get)
+        get.inc()
+        get.inc(2)
+        requests.labels('put').inc()
+        self.assertIs(self.registry.counter('test_requests_total', 'Requests', ('kind',)), requests)
+        text = self.registry.render()
+        self.assertIn('# TYPE test_requests_total counter', text)
+        self.assertIn('test_requests_total{kind="get"} 3', text)
+        self.assertIn('test_requests_total{kind="put"} 1', text)
+        with self.assertRaises(ValueError):
+            self.registry.gauge('test_requests_total', 'Requests', ('kind',))
+        with self.assertRaises(ValueError):
+            requests.labels('get', 'extra')
+
+    def test_histogram_buckets_are_cumulative(self):
+        h = self.registry.histogram('test_latency_seconds', 'Latency', ('host',), buckets=(0.1, 1.0))
+        child = h.labels('a"b')
+        for v in (0.05, 0.1, 0.5, 5.0):
+            child.observe(v)
+        lines = self.registry.render().splitlines()
+        self.assertIn('test_latency_seconds_bucket{host="a\\"b",le="0.1"} 2', lines)
+        self.assertIn('test_latency_seconds_bucket{host="a\\"b",le="1.0"} 3', lines)
+        self.assertIn('test_latency_seconds_bucket{host="a\\"b",le="+Inf"} 4', lines)
+        self.assertIn('test_latency_seconds_count{host="a\\"b"} 4', lines)
+        self.assertIn('test_latency_seconds_sum{host="a\\"b"} 5.65', lines)
+
+    def test_collectors(self):
+        def broken():
+            raise RuntimeError('not available')
+
+        self.registry.add_collector(lambda: [('test_queue_depth', GAUGE, 'Depth', [({'queue': 'q1'}, 4)]),
+                                             ('test_empty_total', COUNTER, 'Nothing', [])])
+        self.registry.add_collector(broken)
+        text = self.registry.render()
+        self.assertIn('test_queue_depth{queue="q1"} 4', text)
+        self.assertNotIn('test_empty_total', text)
+        self.assertEqual(self.registry.snapshot(), {'test_queue_depth': [{'labels': {'queue': 'q1'}, 'value': 4}]})
+
+
+class MetricsExporterTest(unittest.TestCase):
+
+    def test_http_endpoint(self):
+        registry = MetricsRegistry()
+        registry.counter('test_served_total', 'Served').labels().inc()
+        exporter = MetricsExporter(port=0, registry=registry)
+
+        async def scrape():
+            await exporter.start()
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(f'http://127.0.0.1:{exporter.port}/metrics') as response:
+                        return response.status, response.headers['Content-Type'], await response.text()
+            finally:
+                await exporter.stop()
+
+        status, content_type, text = asyncio.run(scrape())
+        self.assertEqual(status, 200)
+        self.assertTrue(content_type.startswith('text/plain'))
+        self.assertIn('test_served_total 1', text)
+        self.assertIn('# TYPE ocabox_gc_collections_total counter', text)  # default collectors
+
+
+if __name__ == '__main__':
+    unittest.main()
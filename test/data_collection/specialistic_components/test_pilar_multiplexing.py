@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+
+from obsrv.protocols.pilar.pilar_connector import PilarConnection
+
+
+class _FakeWriter:
+    def __init__(self):
+        self.lines = []
+
+    def write(self, data: bytes):
+        self.lines.append(data.decode('utf-8'))
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PilarMultiplexingTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.reader = asyncio.StreamReader()
+        self.writer = _FakeWriter()
+        self.conn = PilarConnection(self.reader, self.writer)
+        self.conn.start_multiplexing(max_in_flight=8)
+
+    async def asyncTearDown(self):
+        self.conn.close()
+
+    async def test_out_of_order_responses(self):
+        t1 = asyncio.create_task(self.conn.submit(101, 'GET A', timeout=1))
+        t2 = asyncio.create_task(self.conn.submit(102, 'GET B', timeout=1))
+        await asyncio.sleep(0)
+        self.assertEqual(self.writer.lines, ['101 GET A\n', '102 GET B\n'])
+        self.assertEqual(self.conn.in_flight, 2)
+
+        self.reader.feed_data(b'102 DATA INLINE B=2.5\n'
+                              b'EVENT INFO something\n'
+                              b'101 DATA INLINE A=text\n'
+                              b'102 COMMAND COMPLETE\n'
+                              b'101 COMMAND COMPLETE\n')
+        self.assertEqual(await t1, 'text')
+        self.assertEqual(await t2, 2.5)
+        self.assertEqual(self.conn.in_flight, 0)
+
+    async def test_late_response_is_dropped(self):
+        with self.assertRaises(asyncio.TimeoutError):
+            await self.conn.submit(101, 'GET A', timeout=0.01)
+        self.assertEqual(self.conn.in_flight, 0)
+
+        t = asyncio.create_task(self.conn.submit(102, 'GET B', timeout=1))
+        await asyncio.sleep(0)
+        # response of the timed out command comes after the next command was sent
+        self.reader.feed_data(b'101 DATA INLINE A=1\n101 COMMAND COMPLETE\n'
+                              b'102 DATA INLINE B=7\n102 COMMAND COMPLETE\n')
+        self.assertEqual(await t, 7)
+        self.assertFalse(self.conn.broken)
+
+    async def test_command_failed(self):
+        t = asyncio.create_task(self.conn.submit(101, 'SET A=1', timeout=1))
+        await asyncio.sleep(0)
+        self.reader.feed_data(b'101 COMMAND FAILED\n')
+        with self.assertRaises(RuntimeError):
+            await t
+
+    async def test_eof_fails_pending_commands(self):
+        tasks = [asyncio.create_task(self.conn.submit(101 + i, 'GET A', timeout=1)) for i in range(3)]
+        await asyncio.sleep(0)
+        self.reader.feed_eof()
+        for t in tasks:
+            with self.assertRaises(ConnectionAbortedError):
+                await t
+        self.assertTrue(self.conn.broken)
+        with self.assertRaises(ConnectionAbortedError):
+            await self.conn.submit(104, 'GET A', timeout=1)
+
+    async def test_event_lines_go_to_event_handler(self):
+        events = []
+        self.conn.event_handler = events.append
+        t = asyncio.create_task(self.conn.submit(101, 'GET A', timeout=1))
+        await asyncio.sleep(0)
+        self.reader.feed_data(b'EVENT INFO POINTING.SETUP.FOCUS.POSITION=1.25\n'
+                              b'101 DATA INLINE A=1\n101 COMMAND COMPLETE\n')
+        self.assertEqual(await t, 1)
+        self.assertEqual(events, ['EVENT INFO POINTING.SETUP.FOCUS.POSITION=1.25'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from obsrv.protocols.pilar.pilar_connector import PilarConnection, PilarConnector
+
+ADDRESS = '127.0.0.1:65432'
+
+
+class _FakeWriter:
+    def __init__(self):
+        self.lines = []
+        self.closed = False
+
+    def write(self, data: bytes):
+        self.lines.append(data.decode('utf-8'))
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def _make_connection() -> PilarConnection:
+    return PilarConnection(asyncio.StreamReader(), _FakeWriter())
+
+
+def _make_pool_connector(connections) -> PilarConnector:
+    """PilarConnector with a ready non-multiplexed pool, skipping config load and connecting."""
+    c = PilarConnector.__new__(PilarConnector)
+    c._pool_size = len(connections)
+    c._keepalive = {'enabled': False, 'interval': 10.0, 'idle': 30.0, 'max_idle': 0,
+                    'command': 'GET MOTORS.STATUS', 'timeout': 0.1}
+    c._connection_pools = {ADDRESS: asyncio.Queue()}
+    c._pool_members = {ADDRESS: set(connections)}
+    c._mux_connections = {}
+    c._maintenance_tasks = {}
+    c._refill_tasks = {}
+    c._id_pools = {ADDRESS: asyncio.Queue()}
+    for i in range(101, 111):
+        c._id_pools[ADDRESS].put_nowait(i)
+    for conn in connections:
+        c._connection_pools[ADDRESS].put_nowait(conn)
+    c._create_single_connection = AsyncMock(side_effect=lambda host, port: _make_connection())
+    return c
+
+
+class PilarPoolMaintenanceTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_broken_connection_is_replaced_off_request_path(self):
+        conn1, conn2 = _make_connection(), _make_connection()
+        connector = _make_pool_connector([conn1, conn2])
+        conn, cmd_id = await connector._connection_pools[ADDRESS].get(), await connector._id_pools[ADDRESS].get()
+        conn.broken = True
+
+        await connector._return_connection_resources(ADDRESS, conn, cmd_id)
+        # returning does not wait for a new connection
+        connector._create_single_connection.assert_not_called()
+        self.assertTrue(conn.writer.closed)
+        self.assertEqual(connector._id_pools[ADDRESS].qsize(), 10)
+
+        await connector._refill_tasks[ADDRESS]
+        self.assertEqual(connector._create_single_connection.call_count, 1)
+        self.assertEqual(connector._connection_pools[ADDRESS].qsize(), 2)
+        self.assertEqual(len(connector._pool_members[ADDRESS]), 2)
+        self.assertNotIn(conn, connector._pool_members[ADDRESS])
+
+    async def test_keepalive_probe(self):
+        alive, dead, fresh = _make_connection(), _make_connection(), _make_connection()
+        alive.last_used -= 60
+        dead.last_used -= 60
+        connector = _make_pool_connector([alive, dead, fresh])
+        alive.reader.feed_data(b'101 COMMAND COMPLETE\n')  # answer for the first taken id
+        dead.reader.feed_eof()
+
+        await connector._maintain_pool(ADDRESS)
+        await connector._refill_tasks[ADDRESS]
+
+        self.assertEqual(alive.writer.lines, ['101 GET MOTORS.STATUS\n'])
+        self.assertEqual(fresh.writer.lines, [])  # recently used connection is not probed
+        self.assertFalse(alive.broken)
+        self.assertTrue(dead.broken)
+        self.assertNotIn(dead, connector._pool_members[ADDRESS])
+        self.assertEqual(len(connector._pool_members[ADDRESS]), 3)
+        self.assertEqual(connector._connection_pools[ADDRESS].qsize(), 3)
+        self.assertEqual(connector._id_pools[ADDRESS].qsize(), 10)
+
+    async def test_keepalive_leaves_connections_available(self):
+        conn1, conn2 = _make_connection(), _make_connection()
+        conn1.last_used -= 60
+        conn2.last_used -= 60
+        connector = _make_pool_connector([conn1, conn2])
+
+        maintenance = asyncio.create_task(connector._maintain_pool(ADDRESS))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        # one connection is probed at a time, the other one stays in the queue for requests
+        self.assertEqual(conn1.writer.lines, ['101 GET MOTORS.STATUS\n'])
+        self.assertEqual(conn2.writer.lines, [])
+        self.assertEqual(connector._connection_pools[ADDRESS].qsize(), 1)
+
+        conn1.reader.feed_data(b'101 COMMAND COMPLETE\n')
+        conn2.reader.feed_data(b'102 COMMAND COMPLETE\n')
+        await maintenance
+        self.assertEqual(conn2.writer.lines, ['102 GET MOTORS.STATUS\n'])
+        self.assertEqual(connector._connection_pools[ADDRESS].qsize(), 2)
+
+    async def test_command_id_survives_dropped_pool(self):
+        connector = _make_pool_connector([_make_connection()])
+        conn, cmd_id = await connector._connection_pools[ADDRESS].get(), await connector._id_pools[ADDRESS].get()
+        connector._drop_pool(ADDRESS)  # disconnect while the command is in flight
+
+        await connector._return_connection_resources(ADDRESS, conn, cmd_id)
+        self.assertEqual(connector._id_pools[ADDRESS].qsize(), 10)
+        self.assertNotIn(ADDRESS, connector._connection_pools)
+
+    async def test_pool_stats(self):
+        connector = _make_pool_connector([_make_connection(), _make_connection(), _make_connection()])
+        await connector._connection_pools[ADDRESS].get()
+        self.assertEqual(connector.pool_stats(), {ADDRESS: {'size': 3, 'target': 3, 'in_use': 1}})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import asyncio
+import unittest
+
+from obsrv.protocols.request_hedging import LatencyTracker, RetryBudget, hedged_request
+
+
+def _retry_connection_errors(e):
+    return isinstance(e, ConnectionError)
+
+
+class HedgedRequestTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_slow_attempt_is_hedged(self):
+        delays = [1.0, 0.01]
+        started, cancelled = [], []
+
+        async def attempt():
+            delay = delays[len(started)]
+            started.append(delay)
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(delay)
+                raise
+            return delay
+
+        result = await hedged_request(attempt, RetryBudget(), hedge_delay=0.02)
+        await asyncio.sleep(0)
+        self.assertEqual(result, 0.01)
+        self.assertEqual(started, [1.0, 0.01])
+        self.assertEqual(cancelled, [1.0])
+
+    async def test_failed_attempt_is_retried(self):
+        outcomes = [ConnectionError('dropped'), 'ok']
+
+        async def attempt():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        self.assertEqual(await hedged_request(attempt, RetryBudget(), retryable=_retry_connection_errors), 'ok')
+
+    async def test_non_retryable_error_is_raised(self):
+        calls = []
+
+        async def attempt():
+            calls.append(1)
+            raise ValueError('device error')
+
+        with self.assertRaises(ValueError):
+            await hedged_request(attempt, RetryBudget(), retryable=_retry_connection_errors)
+        self.assertEqual(len(calls), 1)
+
+    async def test_exhausted_budget_stops_retries(self):
+        budget = RetryBudget(ratio=0.0, min_per_second=0.0, capacity=1.0)
+        calls = []
+
+        async def attempt():
+            calls.append(1)
+            raise ConnectionError('down')
+
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                await hedged_request(attempt, budget, retryable=_retry_connection_errors)
+        self.assertEqual(len(calls), 4)  # one retry paid by the only token
+        self.assertEqual(budget.describe()['denied'], 2)
+
+
+class LatencyTrackerTest(unittest.TestCase):
+
+    def test_quantile(self):
+        tracker = LatencyTracker(window=100, min_samples=10)
+        for i in range(9):
+            tracker.record(i / 100)
+        self.assertIsNone(tracker.quantile(0.95))
+        for i in range(9, 100):
+            tracker.record(i / 100)
+        self.assertAlmostEqual(tracker.quantile(0.95), 0.95)
+
+
+if __name__ == '__main__':
+    unittest.main()
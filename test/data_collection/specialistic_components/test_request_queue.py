@@ -0,0 +1,59 @@
+import asyncio
+import unittest
+
+from obsrv.telescope_devices.request_queue import RequestQueue, QueueTimeoutError, PRIORITY_GET, PRIORITY_PUT
+
+
+class RequestQueueTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_limit_and_priority_order(self):
+        queue = RequestQueue('obs.camera', limit=1)
+        order = []
+
+        async def request(name, priority):
+            await queue.acquire(priority)
+            try:
+                order.append(name)
+                await asyncio.sleep(0.01)
+            finally:
+                queue.release()
+
+        first = asyncio.create_task(request('get1', PRIORITY_GET))
+        await asyncio.sleep(0)
+        others = [asyncio.create_task(request(n, p)) for n, p in
+                  [('get2', PRIORITY_GET), ('get3', PRIORITY_GET), ('put', PRIORITY_PUT)]]
+        await asyncio.sleep(0)
+        self.assertEqual(queue.active, 1)
+        self.assertEqual(queue.depth, 3)
+        await asyncio.gather(first, *others)
+        self.assertEqual(order, ['get1', 'put', 'get2', 'get3'])
+        stats = queue.stats()
+        self.assertEqual((stats['active'], stats['depth'], stats['total'], stats['queued_total']), (0, 0, 4, 3))
+        self.assertGreater(stats['max_wait_time'], 0)
+
+    async def test_cancelled_request_leaves_queue(self):
+        queue = RequestQueue('obs.camera', limit=1)
+        await queue.acquire()
+        waiting = asyncio.create_task(queue.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(queue.depth, 0)
+        queue.release()
+        self.assertEqual(queue.active, 0)
+        await queue.acquire()  # free slot, not taken by the cancelled request
+        self.assertEqual(queue.active, 1)
+
+    async def test_queue_timeout(self):
+        queue = RequestQueue('obs.camera', limit=1)
+        await queue.acquire()
+        with self.assertRaises(QueueTimeoutError):
+            await queue.acquire(timeout=0.01)
+        self.assertEqual(queue.stats()['timeouts'], 1)
+        queue.release()
+        self.assertEqual(queue.active, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from obsrv.utils import sampling_profiler
+from obsrv.utils.sampling_profiler import SamplingProfiler, start_profiler, stop_profiler
+
+
+def _busy_loop(seconds: float):
+    end = time.monotonic() + seconds
+    n = 0
+    while time.monotonic() < end:
+        n += 1
+    return n
+
+
+def _waiting(event: threading.Event):
+    event.wait()
+
+
+class SamplingProfilerTest(unittest.TestCase):
+
+    def test_profile_of_current_thread(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'profile.folded')
+            profiler = SamplingProfiler(interval=0.002)
+            profiler.start(output=path)
+            _busy_loop(0.3)
+            result = profiler.stop()
+            self.assertFalse(profiler.running)
+            self.assertGreater(result.samples, 20)
+            self.assertEqual(result.file, path)
+            with open(path) as f:
+                folded = f.read()
+        self.assertEqual(folded, result.to_folded())
+        stack, count = folded.splitlines()[0].rsplit(' ', 1)
+        self.assertIn('_busy_loop', stack.split(';')[-1])
+        self.assertIn('test_profile_of_current_thread', stack)
+        self.assertGreater(int(count), result.samples * 0.8)
+        top = result.top(1)[0]
+        self.assertIn('_busy_loop', top['function'])
+        self.assertGreater(top['self_ratio'], 0.8)
+
+    def test_duration_and_all_threads(self):
+        event = threading.Event()
+        worker = threading.Thread(target=_waiting, args=(event,), name='sample_worker')
+        worker.start()
+        try:
+            profiler = SamplingProfiler(interval=0.005, all_threads=True)
+            profiler.start(duration=0.1)
+            time.sleep(0.3)
+            self.assertFalse(profiler.running)  # stopped by itself
+            result = profiler.stop()
+        finally:
+            event.set()
+            worker.join()
+        threads = {line.split(';', 1)[0] for line in result.to_folded().splitlines()}
+        self.assertIn('sample_worker', threads)
+        self.assertNotIn('sampling_profiler', threads)
+        self.assertLess(result.duration, 0.2)
+
+    def test_client_file_name_stays_in_output_dir(self):
+        with tempfile.TemporaryDirectory() as d, \
+                mock.patch.object(sampling_profiler, '_settings', return_value={'output_dir': d}):
+            for name in ('../profile.folded', '/etc/passwd', 'sub/profile.folded', '..', '', 5):
+                with self.assertRaises(ValueError):
+                    start_profiler(duration=1, file_name=name)
+            self.assertFalse(sampling_profiler.profiler_running())
+            info = start_profiler(duration=5, interval=0.005, file_name='profile.folded')
+            self.assertEqual(info['file'], os.path.join(d, 'profile.folded'))
+            result = asyncio.run(stop_profiler())
+            self.assertFalse(sampling_profiler.profiler_running())
+            self.assertEqual(result.file, os.path.join(d, 'profile.folded'))
+            self.assertTrue(os.path.exists(result.file))
+
+
+if __name__ == '__main__':
+    unittest.main()
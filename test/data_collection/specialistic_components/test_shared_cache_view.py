@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+from obsrv.utils.shared_cache_view import SharedCacheViewWriter, SharedCacheViewReader, SharedCacheViewError, \
+    FLAG_TOO_LARGE, FLAG_UNENCODABLE, FLAG_VALUE_NONE, _SEQ, _slot_offset, _home_slot
+
+
+class SharedCacheViewTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, 'view')
+        self.writer = SharedCacheViewWriter(self.path, slots=8, slot_size=256)
+
+    def tearDown(self):
+        self.writer.close()
+        self._dir.cleanup()
+
+    def test_publish_and_read(self):
+        """Published value is visible to a reader opened on the same file"""
+        self.writer.publish('sim.telescope.ra', 12.5, 100.0, 90.0)
+        with SharedCacheViewReader(self.path) as view:
+            entry = view.get('sim.telescope.ra')
+            self.assertIsNotNone(entry)
+            self.assertTrue(entry.has_value)
+            self.assertEqual(entry.value, 12.5)
+            self.assertEqual(entry.ts, 100.0)
+            self.assertEqual(entry.change_time, 90.0)
+            self.assertIsNone(view.get('sim.telescope.dec'))
+
+    def test_update_overwrites_slot(self):
+        """Next publish for the same address reuses the slot"""
+        self.writer.publish('a.b', {'x': 1}, 1.0, 1.0)
+        self.writer.publish('a.b', {'x': 2}, 2.0, 2.0)
+        with SharedCacheViewReader(self.path) as view:
+            self.assertEqual(view.get('a.b').value, {'x': 2})
+            self.assertEqual(len(list(view.items())), 1)
+
+    def test_collisions_and_full_table(self):
+        """Linear probing keeps all addresses readable and a full table refuses new ones"""
+        addresses = [f'a.{i}' for i in range(8)]
+        for i, a in enumerate(addresses):
+            self.assertTrue(self.writer.publish(a, i, float(i), float(i)))
+        self.assertFalse(self.writer.publish('a.overflow', 1, 1.0, 1.0))
+        with SharedCacheViewReader(self.path) as view:
+            for i, a in enumerate(addresses):
+                self.assertEqual(view.get(a).value, i)
+
+    def test_values_without_payload(self):
+        """None, not encodable and too large values are flagged, not exported"""
+        self.writer.publish('a.none', None, 1.0, 1.0)
+        self.writer.publish('a.bytes', b'raw', 1.0, 1.0)
+        self.writer.publish('a.large', 'x' * 1000, 1.0, 1.0)
+        with SharedCacheViewReader(self.path) as view:
+            self.assertEqual(view.get('a.none').flags, FLAG_VALUE_NONE)
+            self.assertEqual(view.get('a.bytes').flags, FLAG_UNENCODABLE)
+            self.assertEqual(view.get('a.large').flags, FLAG_TOO_LARGE)
+            self.assertFalse(view.get('a.large').has_value)
+
+    def test_reader_skips_slot_during_write(self):
+        """Reader never returns a slot whose seqlock is odd (write in progress)"""
+        self.writer.publish('a.b', 1, 1.0, 1.0)
+        index = _home_slot(b'a.b', 8)
+        _SEQ.pack_into(self.writer._mm, _slot_offset(index, 256), 3)
+        with SharedCacheViewReader(self.path) as view:
+            with self.assertRaises(SharedCacheViewError):
+                view.get('a.b')
+
+    def test_wrong_file(self):
+        with open(self.path + '_other', 'wb') as f:
+            f.write(b'\0' * 128)
+        with self.assertRaises(SharedCacheViewError):
+            SharedCacheViewReader(self.path + '_other')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from obsrv.protocols.subscription import PollingSubscription, combine_unsubscribes
+
+
+class _FakeConnector:
+    def __init__(self, values):
+        self.values = values
+        self.calls = 0
+
+    async def get(self, component, variable, kind=None, **data):
+        self.calls += 1
+        v = self.values[variable]
+        if isinstance(v, Exception):
+            raise v
+        return v
+
+
+class PollingSubscriptionTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_polling_delivers_values(self):
+        component = SimpleNamespace(sys_id='obs.mount')
+        connector = _FakeConnector({'ra': 1.5, 'dec': ConnectionError('down')})
+        received = []
+
+        async def callback(c, variable, value, ts):
+            received.append((c, variable, value))
+
+        unsubscribe = PollingSubscription(connector, [(component, 'ra'), (component, 'dec')], callback,
+                                          period=0.01).start()
+        await asyncio.sleep(0.035)
+        unsubscribe()
+        unsubscribe()  # idempotent
+        calls = connector.calls
+        await asyncio.sleep(0.03)
+        self.assertEqual(connector.calls, calls)
+        self.assertGreaterEqual(len(received), 2)
+        self.assertTrue(all(r == (component, 'ra', 1.5) for r in received))
+
+    async def test_only_changes(self):
+        component = SimpleNamespace(sys_id='obs.mount')
+        connector = _FakeConnector({'ra': 1.5})
+        received = []
+        sub = PollingSubscription(connector, [(component, 'ra')], lambda c, v, value, ts: received.append(value),
+                                  period=0.01, only_changes=True)
+        sub.start()
+        await asyncio.sleep(0.025)
+        connector.values['ra'] = 2.5
+        await asyncio.sleep(0.025)
+        sub.cancel()
+        self.assertEqual(received, [1.5, 2.5])
+
+    def test_combine_unsubscribes(self):
+        calls = []
+        u = combine_unsubscribes(lambda: calls.append(1), lambda: calls.append(2))
+        u()
+        u()
+        self.assertEqual(calls, [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import asyncio
+import math
+import unittest
+
+from obcom.data_colection.address import Address
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest
+from obsrv.tree_components.base_components.tree_provider import TreeProvider
+from obsrv.tree_components.specialized_components import TreeCache
+from obsrv.utils.histogram import LatencyHistogram
+from obsrv.utils.tracing import ROUTER_SPAN, Tracer, get_tracer
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        h = LatencyHistogram()
+        for i in range(1, 1001):
+            h.observe(i / 1000)  # 1 ms ... 1 s
+        self.assertEqual(h.count, 1000)
+        self.assertAlmostEqual(h.percentile(0.5), 0.5, delta=0.05)
+        self.assertAlmostEqual(h.percentile(0.99), 0.99, delta=0.1)
+        self.assertEqual(h.percentile(1.0), 1.0)
+        self.assertAlmostEqual(h.to_dict()['mean_ms'], 500.5)
+
+    def test_empty_and_merge(self):
+        h1, h2 = LatencyHistogram(), LatencyHistogram()
+        self.assertTrue(math.isnan(h1.percentile(0.5)))
+        self.assertIsNone(h1.to_dict()['p50_ms'])
+        h2.observe(0.01)
+        h2.observe(1000)  # overflow bucket
+        h1.merge(h2)
+        self.assertEqual((h1.count, h1.max), (2, 1000))
+        self.assertEqual(sum(h1.to_dict(with_buckets=True)['buckets'].values()), 2)
+
+
+class TracingTest(unittest.TestCase):
+    class SlowValueProvider(TreeProvider):
+        DELAY = 0.05
+
+        async def get_value(self, request: ValueRequest, **kwargs) -> Value or None:
+            await asyncio.sleep(self.DELAY)
+            return Value(1, 1661349399.030824)
+
+    def setUp(self):
+        super().setUp()
+        self.device = self.SlowValueProvider('sample_device', 'device')
+        self.cache = TreeCache('sample_cache', self.device)
+        self.provider = TreeProvider('sample_provider', 'provider', self.cache)
+        self.tracer = get_tracer()
+        self._enabled = self.tracer.enabled
+        self.tracer.reset()
+        self.tracer.configure(enabled=True, sample_rate=1.0)
+
+    def tearDown(self):
+        get_tracer().configure(enabled=self._enabled, sample_rate=0.01)
+        get_tracer().reset()
+        super().tearDown()
+
+    def _request(self) -> ValueRequest:
+        return ValueRequest(Address('provider.device.value'), 1661349399.030824, time_of_data_tolerance=10)
+
+    async def _traced_request(self):
+        request = self._request()
+        trace = self.tracer.start_trace(request)
+        response = await self.provider.get_response(request)
+        self.tracer.finish_trace(trace, response.status)
+        return trace
+
+    def test_spans_of_components(self):
+        trace = asyncio.run(self._traced_request())
+        self.assertIsNotNone(trace)
+        d = trace.to_dict()
+        self.assertEqual([s['name'] for s in d['spans']],
+                         [ROUTER_SPAN, 'sample_provider', 'sample_cache', 'sample_device'])
+        self.assertEqual([s['parent'] for s in d['spans']], [None, 0, 1, 2])
+        device = d['spans'][3]
+        self.assertGreaterEqual(device['duration_ms'], TracingTest.SlowValueProvider.DELAY * 1000 * 0.9)
+        # the time of the slow device is not the own time of the components above it
+        self.assertLess(d['spans'][1]['self_ms'], device['self_ms'])
+        self.assertTrue(d['status'])
+        self.assertEqual(self.tracer.traces()[0]['id'], d['id'])
+
+    def test_histograms_by_component_and_prefix(self):
+        async def coro():
+            for _ in range(3):
+                await self._traced_request()
+
+        asyncio.run(coro())
+        histograms = self.tracer.histograms()
+        self.assertEqual(histograms['sample_cache']['provider.device.value']['count'], 3)
+        self.assertEqual(histograms['sample_device']['provider.device.value']['count'], 1)  # then from cache
+
+    def test_disabled_tracing_records_nothing(self):
+        self.tracer.configure(enabled=False)
+        trace = asyncio.run(self._traced_request())
+        self.assertIsNone(trace)
+        self.assertEqual(self.tracer.traces(), [])
+        self.assertEqual(self.tracer.histograms(), {})
+
+    def test_only_slow_traces_kept_without_sampling(self):
+        tracer = Tracer(enabled=True, sample_rate=0.0, slow_threshold=TracingTest.SlowValueProvider.DELAY / 2)
+        self.tracer = tracer
+
+        async def coro():
+            for _ in range(3):
+                await self._traced_request()
+
+        asyncio.run(coro())
+        self.assertEqual(len(tracer.traces()), 1)  # only the first request went to the device
+
+
+if __name__ == '__main__':
+    unittest.main()
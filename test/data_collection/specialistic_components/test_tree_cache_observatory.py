@@ -4,10 +4,12 @@ import unittest
 from typing import List, Tuple
 
 from obcom.data_colection.address import Address
+from obsrv.ob_config import SingletonConfig
 from obsrv.tree_components.base_components.tree_component import ProvidesResponseProtocol
 from obsrv.tree_components.base_components.tree_provider import TreeProvider
 from obcom.data_colection.coded_error import TreeStructureError
 from obsrv.tree_components.specialized_components import TreeCache
+from obsrv.tree_components.specialized_components.tree_cache_observatory import cache_stats
 from obcom.data_colection.value import Value
 from obcom.data_colection.value_call import ValueRequest
 
@@ -51,6 +53,13 @@ class TreeCacheTest(unittest.IsolatedAsyncioTestCase):
     def tearDown(self) -> None:
         super().tearDown()
 
+    def _configured_cache(self, name: str, **cfg) -> TreeCache:
+        """Put a cache configured by the 'tree' config section of its name between the providers"""
+        SingletonConfig.get_config()['tree'][name].set(cfg)
+        self.tree_cache = TreeCache(name, self.tree_provider2)
+        self.tree_provider1 = TreeProvider('sample_name1', 'provider1', self.tree_cache)
+        return self.tree_cache
+
     def test__value_meets_requirements(self):
         """
         Test method _value_meets_requirements()
@@ -259,6 +268,108 @@ class TreeCacheTest(unittest.IsolatedAsyncioTestCase):
         request = ValueRequest(address, self.v1[1].ts)
         self.assertTrue(self.tree_cache.is_cachable_request(request=request))
 
+    async def test_history_request(self):
+        """Test 'HISTORY' request returns recorded numeric samples as packed arrays"""
+        from array import array
+        self._configured_cache('history_cache', history={'enabled': True, 'tiers': [[0, 10]]})
+        address = Address('.'.join([self.tree_provider1.get_source_name(), self.tree_provider2.get_source_name(),
+                                    self.v1[0]]))
+
+        for i in range(3):
+            await self.tree_cache._update_known_value(address, Value(i, 100.0 + i))
+        request = ValueRequest(address, time.time(), request_type='HISTORY', request_data={'since': 0, 'until': 200})
+        response = await self.tree_provider1.get_response(request)
+        self.assertTrue(response.status)
+        out = response.value.v
+        self.assertEqual(out['count'], 3)
+        self.assertEqual(out['tier'], 'raw')
+        ts = array('d')
+        ts.frombytes(out['ts'])
+        self.assertEqual(list(ts), [100.0, 101.0, 102.0])
+
+        # not tracked address
+        address = Address('.'.join([self.tree_provider1.get_source_name(), self.tree_provider2.get_source_name(),
+                                    'unknown']))
+        request = ValueRequest(address, time.time(), request_type='HISTORY')
+        response = await self.tree_provider1.get_response(request)
+        self.assertFalse(response.status)
+        self.assertEqual(response.error.code, 4001)
+
+    async def test_ingest_pushed_value(self):
+        """Test value pushed by subscription is served from cache and wakes the conditional freezer on change"""
+        class Freezer:
+            events = 0
+
+            async def set_change_event(self):
+                Freezer.events += 1
+
+        self.tree_cache.set_conditional_freezer(Freezer())
+        address_str = '.'.join([self.tree_provider1.get_source_name(), self.tree_provider2.get_source_name(),
+                                self.v1[0]])
+        now = time.time()
+
+        await self.tree_cache.ingest_pushed_value(address_str, Value(10, now - 1))
+        await self.tree_cache.ingest_pushed_value(address_str, Value(11, now))
+        request = ValueRequest(Address(address_str), now, time_of_data_tolerance=5)
+        response = await self.tree_provider1.get_response(request)
+        self.assertEqual(response.value.v, 11)
+        self.assertEqual(self.tree_provider2.count_tasks, 0)
+        self.assertEqual(Freezer.events, 1)
+
+    async def test_put_invalidates_related_values(self):
+        """Test successful PUT expires cached values listed by invalidation rules and wakes the freezer"""
+        class Freezer:
+            events = 0
+
+            async def set_change_event(self):
+                Freezer.events += 1
+
+        self._configured_cache('invalidating_cache',
+                               invalidation_rules=[{'put': r'^(.*)\.move$', 'invalidate': [r'\1.val1']}])
+        self.tree_cache.set_conditional_freezer(Freezer())
+        prefix = '.'.join([self.tree_provider1.get_source_name(), self.tree_provider2.get_source_name()])
+        now = time.time()
+
+        await self.tree_cache.ingest_pushed_value(f'{prefix}.val1', Value(10, now))
+        put = ValueRequest(Address(f'{prefix}.move'), now, request_type='PUT')
+        self.assertTrue((await self.tree_provider1.get_response(put)).status)
+        request = ValueRequest(Address(f'{prefix}.val1'), now, time_of_data_tolerance=5)
+        response = await self.tree_provider1.get_response(request)
+        self.assertEqual(response.value.v, 1)  # read again from the provider, not the pushed 10
+        self.assertEqual(self.tree_provider2.count_tasks, 2)
+        self.assertEqual(Freezer.events, 1)
+
+    async def test_coalesce_puts(self):
+        """Test PUT waiting for a previous PUT of the same address is superseded by a newer one"""
+        self._configured_cache('coalescing_cache', coalesce_puts={'enabled': True, 'address_regex': ['.*val1$']})
+        self.tree_provider2.response_delay = 0.05
+        address = Address('.'.join([self.tree_provider1.get_source_name(), self.tree_provider2.get_source_name(),
+                                    self.v1[0]]))
+
+        requests = [ValueRequest(address, time.time(), request_type='PUT') for _ in range(3)]
+        tasks = []
+        for r in requests:
+            tasks.append(asyncio.create_task(self.tree_provider1.get_response(r)))
+            await asyncio.sleep(0.01)
+        responses = await asyncio.gather(*tasks)
+        self.assertTrue(all(r.status for r in responses))
+        self.assertTrue(responses[1].value.tags.get('superseded'))
+        self.assertEqual(self.tree_provider2.count_tasks, 2)  # first and last PUT
+        self.assertEqual(self.tree_cache._put_slots, {})
+
+    async def test_cache_stats(self):
+        """Test hit and miss counters of the cache"""
+        address = Address('.'.join([self.tree_provider1.get_source_name(), self.tree_provider2.get_source_name(),
+                                    self.v1[0]]))
+
+        for _ in range(3):
+            await self.tree_provider1.get_response(ValueRequest(address, self.v1[1].ts, time_of_data_tolerance=10))
+        await self.tree_provider1.get_response(ValueRequest(address, self.v1[1].ts, request_type='PUT'))
+        stats = self.tree_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['uncachable']), (2, 1, 1))
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
+        self.assertIn('sample_name_cache', cache_stats())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+from array import array
+
+from obsrv.utils.value_history import ValueHistory, HistoryTier
+
+
+class ValueHistoryTest(unittest.TestCase):
+
+    def test_raw_ring_buffer_is_bounded(self):
+        """Raw tier keeps only last `capacity` samples in chronological order"""
+        h = ValueHistory(tiers=[(0, 5)])
+        for i in range(12):
+            h.add(float(i), i * 10)
+        tier, ts, v = h.window(0, 100)
+        self.assertEqual(tier.name, 'raw')
+        self.assertEqual(list(ts), [7.0, 8.0, 9.0, 10.0, 11.0])
+        self.assertEqual(list(v), [70.0, 80.0, 90.0, 100.0, 110.0])
+        self.assertIsInstance(ts, array)
+        self.assertEqual(h.nbytes, 16 * 5)
+
+    def test_window_bounds(self):
+        h = ValueHistory(tiers=[(0, 100)])
+        for i in range(10):
+            h.add(float(i), i)
+        _, ts, _ = h.window(3, 6)
+        self.assertEqual(list(ts), [3.0, 4.0, 5.0, 6.0])
+
+    def test_downsampled_tier_averages_buckets(self):
+        """Samples are averaged over step long buckets, the current bucket is reported as partial average"""
+        h = ValueHistory(tiers=[(0, 2), (10, 10)])
+        for ts, v in [(0, 1), (5, 3), (10, 10), (12, 20), (21, 7)]:
+            h.add(float(ts), v)
+        # raw tier no longer covers ts=0 so the coarser tier is selected
+        tier, ts, v = h.window(0, 100)
+        self.assertEqual(tier.name, '10s')
+        self.assertEqual(list(ts), [0.0, 10.0, 20.0])
+        self.assertEqual(list(v), [2.0, 15.0, 7.0])
+        # explicit tier
+        tier, ts, _ = h.window(0, 100, tier_name='raw')
+        self.assertEqual(list(ts), [12.0, 21.0])
+        with self.assertRaises(KeyError):
+            h.window(0, 100, tier_name='5s')
+
+    def test_non_numeric_and_old_samples_ignored(self):
+        h = ValueHistory(tiers=[(0, 10)])
+        self.assertTrue(h.add(1.0, True))
+        self.assertFalse(h.add(2.0, 'text'))
+        self.assertFalse(h.add(3.0, float('nan')))
+        self.assertFalse(h.add(0.5, 4))
+        _, ts, v = h.window(0, 10)
+        self.assertEqual(list(v), [1.0])
+
+    def test_wrong_tier(self):
+        with self.assertRaises(ValueError):
+            HistoryTier(0, 0)
+        with self.assertRaises(ValueError):
+            ValueHistory(tiers=[])
+
+
+if __name__ == '__main__':
+    unittest.main()
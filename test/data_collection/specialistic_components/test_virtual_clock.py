@@ -0,0 +1,117 @@
+import asyncio
+import time
+import unittest
+
+from obcom.data_colection.address import Address
+from obcom.data_colection.value import Value
+from obcom.data_colection.value_call import ValueRequest
+from obsrv.tree_components.base_components.tree_provider import TreeProvider
+from obsrv.tree_components.specialized_components import TreeCache
+from obsrv.tree_components.specialized_components import TreeConditionalFreezer
+from obsrv.utils.asyncio_util_functions import wait_for_psce
+from obsrv.utils.clock import get_clock, run_virtual, SystemClock, VirtualClock
+
+
+class VirtualClockTest(unittest.TestCase):
+
+    def test_sleep_advances_virtual_time(self):
+        clock = VirtualClock(start=1000.0)
+
+        async def scenario():
+            await asyncio.sleep(3600)
+            with self.assertRaises(asyncio.TimeoutError):
+                await wait_for_psce(asyncio.Event().wait(), timeout=60)
+            return get_clock().time()
+
+        t0 = time.perf_counter()
+        self.assertAlmostEqual(run_virtual(scenario(), clock), 1000.0 + 3660, places=3)
+        self.assertLess(time.perf_counter() - t0, 1.0)
+        self.assertIsInstance(get_clock(), SystemClock)
+
+    def test_timers_fire_in_order(self):
+        order = []
+
+        async def sleeper(delay):
+            await asyncio.sleep(delay)
+            order.append((delay, get_clock().monotonic()))
+
+        async def scenario():
+            await asyncio.gather(*(sleeper(d) for d in (30, 10, 20)))
+
+        run_virtual(scenario())
+        self.assertEqual(order, [(10, 10), (20, 20), (30, 30)])
+
+
+class _ChangingValueProvider(TreeProvider):
+    """Provider of a value changing every PERIOD seconds, stamped with the tree clock."""
+    PERIOD = 60
+
+    def __init__(self, component_name: str, source_name: str, **kwargs):
+        self.nr_requests = 0
+        super().__init__(component_name=component_name, source_name=source_name, **kwargs)
+
+    async def get_value(self, request: ValueRequest, **kwargs) -> Value or None:
+        self.nr_requests += 1
+        now = get_clock().time()
+        value_name = request.address[request.address.get_last_index()]
+        return Value(int(now // self.PERIOD) if value_name == 'changing' else 55, now)
+
+
+class FreezerVirtualTimeTest(unittest.TestCase):
+    """Hours of cycle queries in virtual time."""
+    HOURS = 2
+    TOLERANCE = 10.0
+
+    def setUp(self):
+        super().setUp()
+        self.device = _ChangingValueProvider('sample_device', 'device')
+        self.cache = TreeCache('sample_cache', self.device)
+        self.freezer = TreeConditionalFreezer('sample_freezer', self.cache)
+        self.provider = TreeProvider('sample_provider', 'provider', self.freezer)
+
+    async def _subscribe(self, name: str, timeout: float, until: float, results: list):
+        time_of_known_change = None
+        while get_clock().time() < until:
+            clock_now = get_clock().time()
+            request = ValueRequest(Address(f'provider.device.{name}'), clock_now,
+                                   time_of_data_tolerance=self.TOLERANCE, request_type='GET',
+                                   request_data={'time_of_known_change': time_of_known_change}, cycle_query=True)
+            request.request_timeout = clock_now + timeout
+            response = await self.provider.get_response(request)
+            results.append(response)
+            if response.status:
+                time_of_known_change = response.value.ts
+
+    def _run(self, name: str, timeout: float) -> list:
+        results = []
+
+        async def scenario():
+            await self.provider.run()
+            try:
+                await self._subscribe(name, timeout, get_clock().time() + self.HOURS * 3600, results)
+            finally:
+                await self.provider.stop()
+
+        run_virtual(scenario(), VirtualClock(start=1_700_000_000.0))
+        return results
+
+    def test_changes_are_delivered_and_refreshes_follow_tolerance(self):
+        results = self._run('changing', timeout=120)
+        changes = [r for r in results if r.status]
+        self.assertEqual(len(changes), len(results))  # no timeouts
+        expected_changes = self.HOURS * 3600 / _ChangingValueProvider.PERIOD
+        self.assertAlmostEqual(len(changes), expected_changes, delta=2)
+        self.assertAlmostEqual(self.device.nr_requests, self.HOURS * 3600 / self.TOLERANCE,
+                               delta=expected_changes + 2)
+
+    def test_unchanged_value_times_out(self):
+        timeout = 30.0
+        results = self._run('static', timeout=timeout)
+        timeouts = [r for r in results if not r.status]
+        self.assertTrue(all(r.error.code == 4004 for r in timeouts))
+        expected = self.HOURS * 3600 / (timeout - self.freezer._alarm_timeout_offset)
+        self.assertAlmostEqual(len(timeouts), expected, delta=expected * 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+
+import numpy as np
+
+from obsrv.utils.visibility import airmass, altaz, local_sidereal_time, target_visibility
+
+LAT, LON = -24.598, -70.197  # Cerro Armazones
+T0 = 1700000000.0
+
+
+class VisibilityTest(unittest.TestCase):
+
+    def test_zenith_and_meridian(self):
+        lst = local_sidereal_time(np.array([T0]), LON)
+        alt, az = altaz(np.array([lst[0], lst[0]]), np.array([LAT, LAT + 30]), lst, LAT)
+        self.assertAlmostEqual(alt[0, 0], 90.0, places=6)
+        self.assertAlmostEqual(alt[1, 0], 60.0, places=6)
+        self.assertAlmostEqual(az[1, 0], 0.0, places=6)  # north of the zenith on the meridian
+        self.assertAlmostEqual(float(airmass(90.0)), 1.0, places=3)
+        self.assertAlmostEqual(float(airmass(30.0)), 1.995, places=2)
+        self.assertTrue(np.isnan(airmass(-10.0)))
+
+    def test_sidereal_day(self):
+        lst = local_sidereal_time(np.array([T0, T0 + 86164.0905]), LON)
+        self.assertAlmostEqual((lst[1] - lst[0] + 180) % 360 - 180, 0.0, places=3)
+
+    def test_rise_and_set(self):
+        times = T0 + np.arange(0, 86400 + 300, 300.0)
+        v = target_visibility([0.0, 0.0], [-89.0, 80.0], times, LAT, LON, min_alt=20.0)
+        self.assertEqual(len(v['times']), len(times))
+        self.assertEqual(np.shape(v['alt']), (2, len(times)))
+        # circumpolar south, never above 20 deg in the north
+        self.assertIsNone(v['rise'][0])
+        self.assertIsNone(v['set'][0])
+        self.assertAlmostEqual(v['time_above'][0], 86400.0)
+        self.assertAlmostEqual(v['time_above'][1], 0.0)
+        self.assertIsNone(v['airmass'][1][0])
+        self.assertLess(v['max_alt'][1], 20.0)
+
+        v = target_visibility([0.0], [0.0], times, LAT, LON, min_alt=20.0)
+        rise, set_ = v['rise'][0], v['set'][0]
+        self.assertIsNotNone(rise)
+        self.assertIsNotNone(set_)
+        i = int((rise - T0) // 300)
+        self.assertLess(v['alt'][0][i], 20.0)
+        self.assertGreaterEqual(v['alt'][0][i + 1], 20.0)
+        # equatorial target: hour angle within +-67.9 deg, about 9 h a day
+        self.assertAlmostEqual(v['time_above'][0] / 3600, 9.03, delta=0.1)
+
+    def test_against_astropy(self):
+        import astropy.units as u
+        from astropy.coordinates import AltAz, EarthLocation, SkyCoord
+        from astropy.time import Time
+
+        ra, dec = np.array([10.684, 83.633, 201.365]), np.array([41.269, 22.014, -43.019])
+        times = T0 + np.array([0.0, 7200.0])
+        v = target_visibility(ra, dec, times, LAT, LON)
+        frame = AltAz(obstime=Time(times[1], format='unix'),
+                      location=EarthLocation(lat=LAT * u.deg, lon=LON * u.deg))
+        expected = SkyCoord(ra * u.deg, dec * u.deg).transform_to(frame)
+        np.testing.assert_allclose(np.array(v['alt'], dtype=float)[:, 1], expected.alt.deg, atol=0.02)
+        np.testing.assert_allclose(np.array(v['az'], dtype=float)[:, 1], expected.az.deg, atol=0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()